@@ -1,11 +1,13 @@
 from flask import Flask, render_template, request, jsonify
 import threading
-import requests
+import http_client
 import json
 import time
 import config
-from auth import get_access_token
-from log_config import logger
+from auth import get_token
+from log_config import get_logger
+
+logger = get_logger(__name__)
 
 app = Flask(__name__)
 
@@ -22,7 +24,7 @@ def call_chat_api(payload, headers):
     reply = None
     while reply is None:
         try:
-            response = requests.post(API_ENDPOINT, headers=headers, data=json.dumps(payload), timeout=config.API_TIMEOUT)
+            response = http_client.post(API_ENDPOINT, headers=headers, data=json.dumps(payload), timeout=config.API_TIMEOUT)
             if response.status_code == 200:
                 data = response.json()
                 messages = data.get("chatHistory", {}).get("messages", [])
@@ -83,12 +85,7 @@ def chat():
     }
 
     # Retrieve token.
-    with config.token_lock:
-        token = config.access_token
-    if not token:
-        token = get_access_token()
-        with config.token_lock:
-            config.access_token = token
+    token = get_token()
 
     headers = {
         "Authorization": f"Bearer {token}",
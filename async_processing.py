@@ -0,0 +1,280 @@
+import asyncio
+import auth
+import coalescing
+import config
+import processing
+import throttling
+from log_config import get_logger
+
+logger = get_logger(__name__)
+
+try:
+    import aiohttp
+except ImportError:  # The asyncio engine is optional; the threading engine does not need it.
+    aiohttp = None
+
+def is_available():
+    """True if the async HTTP client needed by the asyncio engine is installed."""
+    return aiohttp is not None
+
+def run_job_async(job, cases, max_in_flight):
+    """
+    Process `cases` (any iterable; it is consumed lazily) for `job` on a private asyncio event loop.
+    Up to `max_in_flight` requests run concurrently on the calling thread; progress,
+    cancellation (job.cancel_event) and output files behave as in the threading engine.
+    """
+    if aiohttp is None:
+        raise RuntimeError("The asyncio engine requires the 'aiohttp' package.")
+    asyncio.run(_run_job(job, cases, max(1, max_in_flight)))
+
+async def _run_job(job, cases, max_in_flight):
+    connector = aiohttp.TCPConnector(limit=max_in_flight, limit_per_host=max_in_flight)
+    timeout = aiohttp.ClientTimeout(total=config.API_TIMEOUT)
+    # A single iterator shared by a fixed set of workers keeps memory flat however
+    # many cases the input has (no task object per case, no list of cases).
+    case_iter = iter(cases)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        workers = [asyncio.create_task(_worker(job, session, case_iter))
+                   for _ in range(max_in_flight)]
+        await asyncio.gather(*workers)
+    if job.cancel_event.is_set():
+        job.log("Job cancellation requested on the asyncio engine.")
+
+async def _worker(job, session, case_iter):
+    retry_queue = job.retry_queue
+    while not job.cancel_event.is_set():
+        # Due retries go ahead of new cases.
+        item = retry_queue.pop_due() or next(case_iter, None)
+        if item is None:
+            # Input exhausted: keep serving parked retries until none are left.
+            due_in = retry_queue.next_due_in()
+            if due_in is None:
+                break
+            await _sleep_unless_cancelled(job, min(due_in, 0.5))
+            continue
+        await call_experiment_api_async(job, session, *item)
+
+async def _sleep_unless_cancelled(job, seconds):
+    """Sleep for `seconds`, waking early if the job is cancelled."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + seconds
+    while not job.cancel_event.is_set():
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        await asyncio.sleep(min(remaining, 0.5))
+
+async def _wait_for_slot(job, try_acquire, poll=0.05):
+    """
+    Poll a non-blocking `try_acquire` until it succeeds and return its (truthy) result.
+    Returns None if the job is cancelled first.
+    """
+    while True:
+        slot = try_acquire()
+        if slot:
+            return slot
+        if job.cancel_event.is_set():
+            return None
+        await asyncio.sleep(poll)
+
+async def _send_request(job, session, url, headers, body, record_latency=True):
+    """
+    POST one request once the experiment's circuit breaker and shared rate limiter allow it,
+    holding a slot of the job's concurrency limiter while it is in flight. With
+    `record_latency`, a successful request's latency goes to the job's latency tracker.
+    Returns (status_code, response_headers, response_text), or (None, None, None) if the job
+    is cancelled while waiting.
+    """
+    breaker = job.circuit_breaker
+    admission = None
+    if breaker is not None:
+        admission = await _wait_for_slot(job, breaker.try_acquire, poll=0.5)
+        if admission is None:
+            return None, None, None
+    outcome = throttling.CANCELLED
+    try:
+        rate_limiter = job.rate_limiter
+        if rate_limiter is not None:
+            await _sleep_unless_cancelled(job, rate_limiter.reserve())
+            if job.cancel_event.is_set():
+                return None, None, None
+        limiter = job.concurrency_limiter
+        if limiter is not None and not await _wait_for_slot(job, limiter.try_acquire):
+            return None, None, None
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        outcome = throttling.CONNECTION_ERROR
+        try:
+            async with session.post(url, headers=headers, data=body) as response:
+                status_code = response.status
+                response_headers = response.headers
+                response_text = await response.text()
+                if rate_limiter is not None:
+                    rate_limiter.observe_headers(response_headers, status_code)
+            outcome = throttling.classify_status(status_code)
+            return status_code, response_headers, response_text
+        except asyncio.TimeoutError:
+            outcome = throttling.TIMEOUT
+            raise
+        except asyncio.CancelledError:
+            # A hedge race was decided by the other request.
+            outcome = throttling.CANCELLED
+            raise
+        finally:
+            latency = loop.time() - started
+            if limiter is not None:
+                limiter.release(outcome, latency)
+            if record_latency and outcome == throttling.SUCCESS and job.latencies is not None:
+                job.latencies.record(latency)
+    finally:
+        if breaker is not None:
+            breaker.release(outcome, admission)
+
+async def _send_hedged(job, session, url, headers, body):
+    """Asyncio counterpart of processing.send_hedged_request(); here the losing request is cancelled."""
+    hedger = job.hedger
+    delay = hedger.delay() if hedger is not None else None
+    if delay is None:
+        return await _send_request(job, session, url, headers, body)
+    hedger.record_request()
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    primary = asyncio.ensure_future(_send_request(job, session, url, headers, body, False))
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if done or job.cancel_event.is_set() or not hedger.try_hedge():
+        result = await primary
+        if result[0] is not None and throttling.classify_status(result[0]) == throttling.SUCCESS:
+            job.latencies.record(loop.time() - started)
+        return result
+    hedge = asyncio.ensure_future(_send_request(job, session, url, headers, body, False))
+    pending = {primary, hedge}
+    winner = None
+    while pending and winner is None:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in (primary, hedge):
+            if task in done and winner is None and task.exception() is None and task.result()[0] == 200:
+                winner = task
+                job.latencies.record(loop.time() - started)
+    for loser in pending:
+        loser.cancel()
+    if winner is None:
+        # Neither request succeeded: report the original request's outcome.
+        return primary.result()
+    if winner is hedge:
+        hedger.record_win()
+    return winner.result()
+
+async def call_experiment_api_async(job, session, case_number, original_data, attempt=0, previous_delay=None,
+                                    lookup=True):
+    """Asyncio counterpart of processing.call_experiment_api_job(); the response cache and in-flight sharing work the same way."""
+    key = (job.experiment_id, case_number)
+    if attempt == 0 and lookup:
+        if processing.use_cached_response(job, case_number, original_data):
+            return
+        shared, is_owner = coalescing.in_flight.claim(key, job)
+        if not is_owner and await _wait_for_shared_request(job, case_number, original_data, shared):
+            return
+    result = await _request_case(job, session, case_number, original_data, attempt, previous_delay)
+    if result is not processing.PARKED:
+        coalescing.in_flight.finish(key, job, result)
+        if result is not None:
+            processing.store_cached_response(job, case_number, result[1])
+
+async def _wait_for_shared_request(job, case_number, original_data, shared):
+    """Asyncio counterpart of processing.wait_for_shared_request()."""
+    processing.append_processing_detail(job, f"Case {case_number}: waiting for the identical request of another job.")
+    while not shared.done.is_set():
+        if job.cancel_event.is_set():
+            processing.append_processing_detail(job, f"Job cancelled during API call for case {case_number}.")
+            return True
+        await asyncio.sleep(0.1)
+    if shared.result is None:
+        return False
+    processing.write_api_response(job, case_number, original_data, shared.result[1])
+    return True
+
+async def _request_case(job, session, case_number, original_data, attempt=0, previous_delay=None):
+    """Asyncio counterpart of processing.request_case(); retries are parked the same way."""
+    if job.cancel_event.is_set():
+        job.log(f"Skipping case {case_number} due to cancellation.")
+        return None
+
+    try:
+        # The refresh (rarely needed, see auth.start_background_refresh) blocks, so it runs off the loop.
+        token = auth.cached_token() or await asyncio.to_thread(auth.get_token)
+    except Exception as e:
+        logger.error(f"Could not acquire an access token: {e}")
+        token = None
+    if not token:
+        job.log("No access token available.")
+        processing.update_progress(job)
+        processing.update_processed_cases(job, case_number)
+        return None
+
+    body = processing.build_run_model_body(case_number)
+    url = f'{config.apiUrl}experiment/{job.experiment_id}'
+
+    policy = job.retry_policy
+    max_attempts = policy.max_attempts
+    success = False
+    status_code = None
+    response_headers = None
+    response_text = None
+    error_message = None
+    content_to_write = None
+    if attempt == 0:
+        job.retry_budget.record_request()
+
+    while attempt < max_attempts and not success:
+        if job.cancel_event.is_set():
+            processing.append_processing_detail(job, f"Job cancelled during API call for case {case_number}.")
+            return None
+        retry_reason = None
+        try:
+            status_code, response_headers, response_text = await _send_hedged(job, session, url, processing.build_api_headers(token), body)
+            if status_code is None:
+                processing.append_processing_detail(job, f"Job cancelled during API call for case {case_number}.")
+                return None
+            logger.debug("Raw API response for case %s (attempt %d): %s", case_number, attempt + 1, response_text)
+            if status_code == 200:
+                success = True
+                break
+            elif policy.is_retryable(status_code):
+                retry_reason = f"Received {status_code}"
+                if status_code == 401:
+                    token = await asyncio.to_thread(processing.fresh_token_after_401, job, token)
+            else:
+                error_message = f"Error {status_code}: {response_text} for case {case_number}"
+                break
+        except asyncio.TimeoutError as te:
+            status_code = response_headers = response_text = None
+            retry_reason = f"Timeout occurred: {te}"
+        except Exception as e:
+            status_code = response_headers = response_text = None
+            retry_reason = f"Exception occurred: {e}"
+        if retry_reason is not None and processing.held_by_circuit_breaker(job, status_code):
+            # The next attempt waits for the breaker and does not use up the case's attempts.
+            processing.append_processing_detail(job, f"Case {case_number}: {retry_reason}. Held until the circuit breaker closes.")
+            continue
+        attempt += 1
+        delay = processing.plan_retry(job, case_number, attempt, previous_delay, retry_reason,
+                                      status_code, response_headers, response_text)
+        if delay is None:
+            break
+        previous_delay = delay
+        if processing.schedule_retry(job, case_number, original_data, attempt, delay):
+            return processing.PARKED
+        await _sleep_unless_cancelled(job, delay)
+
+    if job.cancel_event.is_set() and not success and not error_message:
+        processing.append_processing_detail(job, f"Job cancelled during API call for case {case_number}.")
+        return None
+
+    if not success:
+        if not error_message:
+            error_message = processing.build_failure_message(job, case_number, status_code, response_text, attempt)
+        processing.log_api_error(job, error_message)
+        processing.write_case_result(job, case_number, original_data, success, content_to_write, error_message)
+        return None
+    processing.write_api_response(job, case_number, original_data, response_text)
+    return status_code, response_text
@@ -1,59 +1,250 @@
+import os
 import time
 import threading
-from msal import PublicClientApplication
+from msal import PublicClientApplication, SerializableTokenCache
 import config
-from log_config import logger
+from log_config import get_logger
+
+if os.name == "nt":
+    import ctypes
+    from ctypes import wintypes
+
+    class _DataBlob(ctypes.Structure):
+        _fields_ = [("cbData", wintypes.DWORD), ("pbData", ctypes.POINTER(ctypes.c_char))]
+
+logger = get_logger(__name__)
 
 scopes = config.scopes
 
-def get_access_token(parent_window_handle=None):
-    """Acquire an access token using MSAL.
-    
-    If a parent_window_handle is provided (for GUI apps), it will be used.
-    Otherwise, if running in console mode, PublicClientApplication.CONSOLE_WINDOW_HANDLE is used.
+# Process-wide token state. The token itself lives in config.access_token (guarded by
+# config.token_lock); _expires_at is the monotonic time at which it stops being valid.
+_expires_at = 0.0
+# Held while a refresh is in progress, so concurrent callers wait for a single refresh.
+_refresh_lock = threading.Lock()
+_refresher = None
+
+def _get_scopes():
+    # Ensure scopes is a list.
+    s = scopes
+    if isinstance(s, str):
+        s = [s]
+    return s
+
+# --- Persistent token cache (TOKEN_CACHE / TOKEN_CACHE_FILE in config.ini) ---
+_token_cache = None
+
+class _CacheFileLock:
+    """
+    Cross-process lock for the token cache file, held by creating `<file>.lock` exclusively.
+    A lock file older than `stale_after` seconds is left over from a crashed process and is removed.
+    """
+    def __init__(self, path, timeout=10.0, stale_after=30.0):
+        self.path = path + ".lock"
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self._fd = None
+
+    def __enter__(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                self._fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) > self.stale_after:
+                        os.remove(self.path)
+                        continue
+                except OSError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Timed out waiting for the token cache lock {self.path}")
+                time.sleep(0.05)
+
+    def __exit__(self, *exc):
+        os.close(self._fd)
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+def _dpapi(function, data):
+    """Run CryptProtectData or CryptUnprotectData (DPAPI, current Windows user) on `data`."""
+    buffer = ctypes.create_string_buffer(data, len(data))
+    blob_in = _DataBlob(len(data), ctypes.cast(buffer, ctypes.POINTER(ctypes.c_char)))
+    blob_out = _DataBlob()
+    CRYPTPROTECT_UI_FORBIDDEN = 0x1
+    if not function(ctypes.byref(blob_in), None, None, None, None, CRYPTPROTECT_UI_FORBIDDEN, ctypes.byref(blob_out)):
+        raise ctypes.WinError()
+    try:
+        return ctypes.string_at(blob_out.pbData, blob_out.cbData)
+    finally:
+        ctypes.windll.kernel32.LocalFree(blob_out.pbData)
+
+def _protect(text):
+    """The bytes stored in TOKEN_CACHE_FILE: encrypted for the current user on Windows, plain elsewhere."""
+    data = text.encode("utf-8")
+    if os.name == "nt":
+        data = _dpapi(ctypes.windll.crypt32.CryptProtectData, data)
+    return data
+
+def _unprotect(data):
+    if os.name == "nt":
+        data = _dpapi(ctypes.windll.crypt32.CryptUnprotectData, data)
+    return data.decode("utf-8")
+
+def _load_token_cache():
+    """Return the token cache, read from TOKEN_CACHE_FILE if TOKEN_CACHE is on (None if it is off)."""
+    if not config.TOKEN_CACHE:
+        return None
+    cache = SerializableTokenCache()
+    try:
+        if os.path.exists(config.TOKEN_CACHE_FILE):
+            with _CacheFileLock(config.TOKEN_CACHE_FILE):
+                with open(config.TOKEN_CACHE_FILE, "rb") as f:
+                    cache.deserialize(_unprotect(f.read()))
+            logger.info(f"Loaded token cache from {config.TOKEN_CACHE_FILE}.")
+    except Exception as e:
+        # A damaged or unreadable cache only costs a new login.
+        logger.warning(f"Could not read token cache {config.TOKEN_CACHE_FILE}: {e}")
+    return cache
+
+def _save_token_cache():
     """
-    # Import PublicClientApplication handle for console apps.
-    from msal import PublicClientApplication
+    Write the token cache back to TOKEN_CACHE_FILE if it changed: encrypted on Windows,
+    owner read/write only elsewhere.
+    """
+    cache = _token_cache
+    if cache is None or not cache.has_state_changed:
+        return
+    tmp_file = config.TOKEN_CACHE_FILE + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(config.TOKEN_CACHE_FILE), mode=0o700, exist_ok=True)
+        with _CacheFileLock(config.TOKEN_CACHE_FILE):
+            fd = os.open(tmp_file, os.O_CREAT | os.O_TRUNC | os.O_WRONLY | getattr(os, "O_BINARY", 0), 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(_protect(cache.serialize()))
+            os.replace(tmp_file, config.TOKEN_CACHE_FILE)
+            os.chmod(config.TOKEN_CACHE_FILE, 0o600)
+        cache.has_state_changed = False
+    except Exception as e:
+        logger.warning(f"Could not write token cache {config.TOKEN_CACHE_FILE}: {e}")
+
+def _acquire_token(parent_window_handle=None, force_refresh=False):
+    """Acquire a token from MSAL and return the MSAL result (with access_token and expires_in)."""
+    global _token_cache
     if parent_window_handle is None:
         parent_window_handle = PublicClientApplication.CONSOLE_WINDOW_HANDLE
     # Initialize msal_app in config if needed.
     if config.msal_app is None:
+        _token_cache = _load_token_cache()
         config.msal_app = PublicClientApplication(
             client_id = config.client_id,
             authority = config.authority,
-            enable_broker_on_windows=True
+            enable_broker_on_windows=True,
+            token_cache=_token_cache
         )
     accounts = config.msal_app.get_accounts()
-    # Ensure scopes is a list.
-    s = scopes
-    if isinstance(s, str):
-        s = [s]
+    s = _get_scopes()
     result = None
     if accounts:
-        result = config.msal_app.acquire_token_silent(s, account=accounts[0])
+        result = config.msal_app.acquire_token_silent(s, account=accounts[0], force_refresh=force_refresh)
         if result and "access_token" in result:
-            return result["access_token"]
+            _save_token_cache()
+            return result
     result = config.msal_app.acquire_token_interactive(s, parent_window_handle=parent_window_handle)
+    _save_token_cache()
     if "access_token" in result:
         logger.info("Got access token.")
-        return result["access_token"]
+        return result
     else:
         logger.info("Failed to get access token.")
         raise Exception('Failed to get access token')
 
-def refresh_token(stop_event):
-    """Background thread to refresh token every hour."""
-    while not stop_event.is_set():
+def get_access_token(parent_window_handle=None):
+    """Acquire an access token using MSAL.
+
+    If a parent_window_handle is provided (for GUI apps), it will be used.
+    Otherwise, if running in console mode, PublicClientApplication.CONSOLE_WINDOW_HANDLE is used.
+    Most callers should use get_token(), which reuses the shared token until it expires.
+    """
+    return _acquire_token(parent_window_handle)["access_token"]
+
+def cached_token():
+    """Return the shared token if it is valid for at least TOKEN_REFRESH_MARGIN seconds, else None."""
+    with config.token_lock:
+        if config.access_token and time.monotonic() < _expires_at - config.TOKEN_REFRESH_MARGIN:
+            return config.access_token
+    return None
+
+def _refresh(force_refresh=False):
+    """Acquire a new token and publish it to every caller. Must be called with _refresh_lock held."""
+    global _expires_at
+    result = _acquire_token(force_refresh=force_refresh)
+    expires_in = float(result.get("expires_in") or 3600)
+    if expires_in <= config.TOKEN_REFRESH_MARGIN and not force_refresh:
+        # A cached token that is about to expire: ask for a new one instead.
+        result = _acquire_token(force_refresh=True)
+        expires_in = float(result.get("expires_in") or 3600)
+    with config.token_lock:
+        config.access_token = result["access_token"]
+        _expires_at = time.monotonic() + expires_in
+    logger.info(f"Access token refreshed; valid for {expires_in:.0f} seconds.")
+    return result["access_token"]
+
+def get_token():
+    """
+    Return a valid access token shared by every job, the chat window and the web app.
+    If the token is missing or about to expire, one caller refreshes it while the others wait
+    for that refresh instead of starting their own.
+    """
+    token = cached_token()
+    if token:
+        return token
+    with _refresh_lock:
+        # Another caller may have refreshed the token while we waited for the lock.
+        token = cached_token()
+        if token:
+            return token
+        return _refresh()
+
+def refresh_after_401(stale_token):
+    """
+    Called when a request made with `stale_token` got a 401. The first caller forces a
+    refresh; callers that arrive afterwards get the token it obtained.
+    """
+    with _refresh_lock:
+        with config.token_lock:
+            current = config.access_token
+        if current and current != stale_token:
+            return current
+        logger.info("Received 401; refreshing the access token.")
+        return _refresh(force_refresh=True)
+
+def start_background_refresh():
+    """
+    Start the process-wide refresher thread (once). It renews the shared token shortly
+    before it expires, so workers rarely have to wait for a refresh.
+    """
+    global _refresher
+    with _refresh_lock:
+        if _refresher is not None and _refresher.is_alive():
+            return
+        _refresher = threading.Thread(target=_refresh_loop, name="token-refresher", daemon=True)
+        _refresher.start()
+
+def _refresh_loop():
+    while True:
+        with config.token_lock:
+            refresh_in = _expires_at - config.TOKEN_REFRESH_MARGIN - time.monotonic()
+        if refresh_in > 0:
+            time.sleep(min(refresh_in, 60))
+            continue
         try:
-            new_token = get_access_token()  # In console mode; pass window handle for GUI apps.
-            with config.token_lock:
-                config.access_token = new_token
-            print("Access token refreshed.")
-            logger.info("Access Token refreshed.")
+            get_token()
         except Exception as e:
-            print(f"Error refreshing access token: {e}")
-            logger.info("Error refreshing access token.")
-        stop_event.wait(3600)
+            logger.error(f"Error refreshing access token: {e}")
+            time.sleep(30)
 
 if __name__ == "__main__":
     # For testing purposes, call get_access_token() in console mode.
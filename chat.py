@@ -1,12 +1,14 @@
 import tkinter as tk
 from tkinter import scrolledtext, ttk
 import threading
-import requests
+import http_client
 import json
 import time
 import config
-from auth import get_access_token
-from log_config import logger
+from auth import get_token
+from log_config import get_logger
+
+logger = get_logger(__name__)
 
 # Global conversation history for chat mode.
 conversation_history = []
@@ -117,12 +119,7 @@ def send_chat_message(chat_display, message_entry):
         "MaxNumberOfRows": 5000
     }
 
-    with config.token_lock:
-        token = config.access_token
-    if not token:
-        token = get_access_token()
-        with config.token_lock:
-            config.access_token = token
+    token = get_token()
 
     headers = {
         "Authorization": f"Bearer {token}",
@@ -137,7 +134,7 @@ def send_chat_message(chat_display, message_entry):
         # Retry until a valid reply is obtained.
         while reply is None:
             try:
-                response = requests.post(api_endpoint, headers=headers, data=json.dumps(payload), timeout=config.API_TIMEOUT)
+                response = http_client.post(api_endpoint, headers=headers, data=json.dumps(payload), timeout=config.API_TIMEOUT)
                 if response.status_code == 200:
                     data = response.json()
                     messages = data.get("chatHistory", {}).get("messages", [])
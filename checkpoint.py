@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+import config
+from log_config import get_logger
+
+logger = get_logger(__name__)
+
+# Bump when the checkpoint format changes so old checkpoints are ignored.
+CHECKPOINT_VERSION = 1
+
+class InputCursor:
+    """
+    Position in a job's input index (a row number) below which every case is committed to
+    the resume journal.
+
+    Cases are dispatched in row order but finish in any order; the cursor stays at the
+    oldest dispatched case that is not committed yet. Cases that never finish (cancelled,
+    parked for a retry) hold it back, so the cursor never skips a case that still has to run.
+    """
+    def __init__(self, start=0):
+        self._lock = threading.Lock()
+        self._outstanding = deque()  # (row, case_number) of dispatched cases, in row order
+        self._waiting = set()        # case numbers in _outstanding
+        self._committed = set()      # committed case numbers still in _outstanding
+        self._next = start
+
+    def dispatched(self, row, case_number):
+        with self._lock:
+            self._outstanding.append((row, case_number))
+            self._waiting.add(case_number)
+            self._next = row + 1
+
+    def committed(self, case_numbers):
+        """Called by the resume journal once the records of `case_numbers` are durable."""
+        with self._lock:
+            self._committed.update(c for c in case_numbers if c in self._waiting)
+
+    def position(self):
+        with self._lock:
+            while self._outstanding and self._outstanding[0][1] in self._committed:
+                _, case_number = self._outstanding.popleft()
+                self._committed.discard(case_number)
+                self._waiting.discard(case_number)
+            return self._outstanding[0][0] if self._outstanding else self._next
+
+def checkpoint_path(job):
+    """The job's checkpoint file, next to (and named like) its processed tracking file."""
+    return os.path.splitext(job.processed_tracking_file)[0] + ".checkpoint.json"
+
+def write_checkpoint(job):
+    """Atomically write the job's input cursor and progress (temporary file, fsync, rename)."""
+    cursor = getattr(job, "input_cursor", None)
+    if cursor is None or not job.processed_tracking_file:
+        return
+    data = {
+        "version": CHECKPOINT_VERSION,
+        "input_file": job.input_file,
+        "fingerprint": job.input_fingerprint,
+        "row": cursor.position(),
+        "progress_done": job.progress_done,
+        "progress_total": job.progress_total,
+        "time": time.time(),
+    }
+    path = checkpoint_path(job)
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+def load_cursor(job, index):
+    """The row to resume the job's input from: the last checkpoint's cursor if it is for this input, else 0."""
+    path = checkpoint_path(job)
+    if not os.path.exists(path):
+        return 0
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable checkpoint {path}: {e}")
+        return 0
+    if (data.get("version") != CHECKPOINT_VERSION or data.get("fingerprint") != index.fingerprint
+            or not 0 <= data.get("row", 0) <= index.row_count):
+        return 0
+    return data["row"]
+
+def remove_checkpoint(job):
+    path = checkpoint_path(job)
+    if os.path.exists(path):
+        os.remove(path)
+
+# --- Background checkpointer ---
+_jobs = set()
+_lock = threading.Lock()
+_thread = None
+
+def checkpoint_job(job):
+    """Write the job's checkpoint and, for jobs saved in jobs_state (UI jobs), its state file."""
+    try:
+        write_checkpoint(job)
+        if job.ui is not None:
+            from job_manager import save_job_state
+            save_job_state(job)
+    except Exception as e:
+        logger.error(f"Could not checkpoint job {job.job_id[:8]}: {e}")
+
+def _run():
+    while True:
+        time.sleep(max(1, config.CHECKPOINT_INTERVAL_SECONDS))
+        with _lock:
+            jobs = list(_jobs)
+        for job in jobs:
+            checkpoint_job(job)
+
+def register(job):
+    """Checkpoint `job` every CHECKPOINT_INTERVAL_SECONDS while it runs."""
+    global _thread
+    with _lock:
+        _jobs.add(job)
+        if _thread is None:
+            _thread = threading.Thread(target=_run, name="checkpointer", daemon=True)
+            _thread.start()
+
+def unregister(job):
+    """Stop checkpointing `job` and write its final checkpoint."""
+    with _lock:
+        _jobs.discard(job)
+    checkpoint_job(job)
@@ -0,0 +1,49 @@
+import threading
+
+class SharedRequest:
+    """One API request that other jobs asking for the same case can wait on instead of sending their own."""
+    def __init__(self, owner):
+        self.owner = owner
+        self.done = threading.Event()
+        # (status_code, response_text) of a successful response; None if the request failed or was abandoned.
+        self.result = None
+
+class InFlightRequests:
+    """
+    Process-wide registry of cases with an API request in flight, keyed by
+    (experiment ID, case number). The first job to claim a key sends the request;
+    jobs that claim it afterwards wait for the result and reuse it.
+    """
+    def __init__(self):
+        self._requests = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key, owner):
+        """Return (shared_request, is_owner); `owner` sends the request if no one else is already."""
+        with self._lock:
+            shared = self._requests.get(key)
+            if shared is not None:
+                return shared, False
+            shared = SharedRequest(owner)
+            self._requests[key] = shared
+            return shared, True
+
+    def finish(self, key, owner, result=None):
+        """Publish the result of `owner`'s request for `key` and wake any waiting jobs."""
+        with self._lock:
+            shared = self._requests.get(key)
+            if shared is None or shared.owner is not owner:
+                return
+            del self._requests[key]
+        shared.result = result
+        shared.done.set()
+
+    def release_owner(self, owner):
+        """Abandon every request still registered to `owner` (e.g. a job that ended with retries parked)."""
+        with self._lock:
+            keys = [key for key, shared in self._requests.items() if shared.owner is owner]
+        for key in keys:
+            self.finish(key, owner)
+
+# Shared by every job in the process.
+in_flight = InFlightRequests()
@@ -1,7 +1,6 @@
 import configparser
 import os
 import threading
-import hashlib
 
 def load_configuration(config_file='config.ini'):
     """Load configuration settings from an INI file."""
@@ -44,11 +43,28 @@ PROCESSED_TRACKING_FILE = os.path.join(
 API_401_ERROR_TRACKING_FILE = os.path.join(
     OUTPUT_DIR, CONFIG.get('Paths', 'API_401_ERROR_TRACKING_FILE', fallback="50CasesLinuxAPI401Errors.txt")
 )
+# Byte-offset indexes of input files, reused while an input file is unchanged.
+INPUT_INDEX_DIR = os.path.join(
+    OUTPUT_DIR, CONFIG.get('Paths', 'INPUT_INDEX_DIR', fallback="InputIndex")
+)
+# Inputs piped to standard input (-f -) are saved here, named after their content.
+INPUT_SPOOL_DIR = os.path.join(
+    OUTPUT_DIR, CONFIG.get('Paths', 'INPUT_SPOOL_DIR', fallback="Input")
+)
+# Read buffer for input files, including compressed (.gz, .zst) and directory inputs.
+INPUT_READ_BUFFER_KB = CONFIG.getint('Paths', 'INPUT_READ_BUFFER_KB', fallback=1024)
 
 # --- API and MSAL Configuration ---
 apiUrl = CONFIG.get('API', 'apiUrl', fallback='https://zebra-ai-api-prd.azurewebsites.net/')
 experimentId = CONFIG.get('API', 'experimentId', fallback='582c5e80-b307-43f9-bc86-efd0a6551907')
 API_TIMEOUT = CONFIG.getint('API', 'API_TIMEOUT', fallback=30)
+# Keep-alive connection pool shared by all API callers (see http_client.py).
+HTTP_POOL_SIZE = CONFIG.getint('API', 'HTTP_POOL_SIZE', fallback=10)
+HTTP_WARMUP_CONNECTIONS = CONFIG.getint('API', 'HTTP_WARMUP_CONNECTIONS', fallback=4)
+# Default number of concurrent requests for the asyncio processing engine.
+ASYNC_MAX_IN_FLIGHT = CONFIG.getint('API', 'ASYNC_MAX_IN_FLIGHT', fallback=200)
+# "auto" uses orjson when it is installed; "stdlib" always uses the json module (see json_codec.py).
+JSON_BACKEND = CONFIG.get('API', 'JSON_BACKEND', fallback='auto').strip().lower()
 ##### For Managed Identity #####
 #APP_CLIENT_ID = CONFIG.get('API', 'APP_CLIENT_ID', fallback='https://zebra-ai-api-prd.azurewebsites.net/')
 #RESOURCE_TENANT_ID = CONFIG.get('API', 'RESOURCE_TENANT_ID', fallback='https://zebra-ai-api-prd.azurewebsites.net/')
@@ -57,11 +73,89 @@ API_TIMEOUT = CONFIG.getint('API', 'API_TIMEOUT', fallback=30)
 #AUDIENCE = CONFIG.get('API', 'AUDIENCE', fallback='https://zebra-ai-api-prd.azurewebsites.net/')
 ##### For Managed Identity #####
 
+# --- Adaptive Concurrency (AIMD limit on in-flight API requests per job) ---
+ADAPTIVE_CONCURRENCY = CONFIG.getboolean('Concurrency', 'ADAPTIVE_CONCURRENCY', fallback=True)
+MIN_CONCURRENCY = CONFIG.getint('Concurrency', 'MIN_CONCURRENCY', fallback=1)
+MAX_CONCURRENCY = CONFIG.getint('Concurrency', 'MAX_CONCURRENCY', fallback=32)
+# Cut the limit when recent latency exceeds the baseline by this factor.
+LATENCY_TOLERANCE = CONFIG.getfloat('Concurrency', 'LATENCY_TOLERANCE', fallback=2.0)
+
+# --- Request Hedging (a second request for cases slower than a latency percentile) ---
+HEDGING = CONFIG.getboolean('Hedging', 'HEDGING', fallback=False)
+HEDGE_PERCENTILE = CONFIG.getfloat('Hedging', 'HEDGE_PERCENTILE', fallback=95.0)
+# Hedges may not exceed this percentage of a job's requests.
+HEDGE_MAX_PERCENT = CONFIG.getfloat('Hedging', 'HEDGE_MAX_PERCENT', fallback=5.0)
+# Latency samples needed before the first hedge.
+HEDGE_MIN_SAMPLES = CONFIG.getint('Hedging', 'HEDGE_MIN_SAMPLES', fallback=20)
+
+# --- Circuit Breaker (holds dispatch to an experiment while its backend is failing) ---
+CIRCUIT_BREAKER = CONFIG.getboolean('CircuitBreaker', 'CIRCUIT_BREAKER', fallback=True)
+# Open when this fraction of the last WINDOW_SIZE requests (at least MIN_REQUESTS) failed.
+BREAKER_FAILURE_THRESHOLD = CONFIG.getfloat('CircuitBreaker', 'FAILURE_THRESHOLD', fallback=0.5)
+BREAKER_WINDOW_SIZE = CONFIG.getint('CircuitBreaker', 'WINDOW_SIZE', fallback=20)
+BREAKER_MIN_REQUESTS = CONFIG.getint('CircuitBreaker', 'MIN_REQUESTS', fallback=10)
+# Seconds to hold dispatch before sending PROBE_REQUESTS probes.
+BREAKER_OPEN_SECONDS = CONFIG.getfloat('CircuitBreaker', 'OPEN_SECONDS', fallback=30.0)
+BREAKER_PROBE_REQUESTS = CONFIG.getint('CircuitBreaker', 'PROBE_REQUESTS', fallback=3)
+
+# --- Response Cache (successful API responses kept on disk across runs) ---
+RESPONSE_CACHE = CONFIG.getboolean('ResponseCache', 'RESPONSE_CACHE', fallback=True)
+RESPONSE_CACHE_FILE = os.path.join(
+    OUTPUT_DIR, CONFIG.get('ResponseCache', 'CACHE_FILE', fallback="response_cache.sqlite3")
+)
+RESPONSE_CACHE_TTL_HOURS = CONFIG.getfloat('ResponseCache', 'TTL_HOURS', fallback=24.0)
+RESPONSE_CACHE_MAX_MB = CONFIG.getfloat('ResponseCache', 'MAX_SIZE_MB', fallback=500.0)
+
+# --- Per-Experiment Settings ---
+def get_experiment_option(section, experiment_id, fallback=None):
+    """
+    Return the value configured for an experiment in a per-experiment section of config.ini.
+    Keys may be the experiment ID or its friendly name from [Experiments]; the `default`
+    key of the section applies to experiments that are not listed.
+    """
+    if not CONFIG.has_section(section):
+        return fallback
+    if experiment_id and CONFIG.has_option(section, experiment_id):
+        return CONFIG.get(section, experiment_id)
+    if CONFIG.has_section("Experiments"):
+        for name, exp_id in CONFIG.items("Experiments"):
+            if exp_id == experiment_id and CONFIG.has_option(section, name):
+                return CONFIG.get(section, name)
+    return CONFIG.get(section, "default", fallback=fallback)
+
+def get_rate_limit(experiment_id):
+    """
+    Return (requests_per_second, burst) for an experiment from the [RateLimits] section.
+    Values are "<rate>" or "<rate>, <burst>"; a rate of 0 means unlimited.
+    """
+    value = get_experiment_option('RateLimits', experiment_id, fallback="0")
+    parts = [p.strip() for p in str(value).split(",") if p.strip()]
+    try:
+        rate = float(parts[0]) if parts else 0.0
+        burst = float(parts[1]) if len(parts) > 1 else None
+    except ValueError:
+        raise ValueError(f"Invalid [RateLimits] value for experiment {experiment_id}: {value!r}")
+    return rate, burst
+
 # --- Authentication Settings ---
 client_id = CONFIG.get('Authentication', 'client_id', fallback='751c47e2-782e-4d75-b304-37f68a9d45fd')
 authority = CONFIG.get('Authentication', 'authority', fallback='https://login.microsoftonline.com/72f988bf-86f1-41af-91ab-2d7cd011db47')
 scopes = CONFIG.get('Authentication', 'scopes', fallback='api://9021b3a5-1f0d-4fb7-ad3f-d6989f0432d8/.default').split(',')
 
+# Renew the shared access token this many seconds before it expires.
+TOKEN_REFRESH_MARGIN = CONFIG.getint('Authentication', 'TOKEN_REFRESH_MARGIN', fallback=300)
+# Keep the MSAL token cache on disk so later runs start without a login. Off by default: the
+# cache holds a refresh token. It is kept per user, outside OUTPUT_DIR (a relative
+# TOKEN_CACHE_FILE is under TOKEN_CACHE_DIR), and encrypted for the Windows user with DPAPI.
+TOKEN_CACHE = CONFIG.getboolean('Authentication', 'TOKEN_CACHE', fallback=False)
+TOKEN_CACHE_DIR = os.path.join(
+    os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "AIFuse"
+)
+TOKEN_CACHE_FILE = os.path.join(
+    TOKEN_CACHE_DIR, CONFIG.get('Authentication', 'TOKEN_CACHE_FILE', fallback="msal_token_cache.bin")
+)
+
 # --- Shared Globals for Authentication (used by auth.py) ---
 access_token = None
 token_lock = threading.Lock()
@@ -75,12 +169,54 @@ progress_lock = threading.Lock()
 processing_details = []
 details_lock = threading.Lock()
 
+# --- Resume Journal (finished cases in processed_tracking_file, see resume_journal.py) ---
+# The output writer flushes the output files and commits buffered journal records every
+# FLUSH_RECORDS finished cases or FLUSH_INTERVAL_MS milliseconds.
+JOURNAL_FLUSH_RECORDS = CONFIG.getint('Journal', 'FLUSH_RECORDS', fallback=100)
+JOURNAL_FLUSH_INTERVAL_MS = CONFIG.getint('Journal', 'FLUSH_INTERVAL_MS', fallback=200)
+# fsync the output files and the journal on each commit, so a power loss cannot lose committed cases.
+JOURNAL_FSYNC = CONFIG.getboolean('Journal', 'FSYNC', fallback=True)
+# Write-behind output writer (see output_writer.py): queued writes before workers wait, and file buffer size.
+WRITE_QUEUE_SIZE = CONFIG.getint('Journal', 'WRITE_QUEUE_SIZE', fallback=10000)
+WRITE_BUFFER_KB = CONFIG.getint('Journal', 'WRITE_BUFFER_KB', fallback=256)
+
+# --- Job Store (optional per-job SQLite database, see job_store.py) ---
+JOB_STORE = CONFIG.getboolean('JobStore', 'JOB_STORE', fallback=False)
+# Also keep each case's written result in the store.
+JOB_STORE_RESULTS = CONFIG.getboolean('JobStore', 'STORE_RESULTS', fallback=True)
+
+# --- Checkpoints (see checkpoint.py) ---
+# Running jobs write their input cursor, progress and state every CHECKPOINT_INTERVAL_SECONDS.
+CHECKPOINT_INTERVAL_SECONDS = CONFIG.getint('Checkpoint', 'INTERVAL_SECONDS', fallback=10)
+
+# --- Application Log (see log_config.py) ---
+LOG_FILE_NAME = CONFIG.get('Logging', 'LOG_FILE', fallback='app.log')
+LOG_LEVEL = CONFIG.get('Logging', 'LEVEL', fallback='INFO').upper()
+# Messages at or above this level are also shown on the console.
+LOG_CONSOLE_LEVEL = CONFIG.get('Logging', 'CONSOLE_LEVEL', fallback='WARNING').upper()
+# The log file is rotated at LOG_MAX_MB, keeping LOG_BACKUPS old files.
+LOG_MAX_MB = CONFIG.getint('Logging', 'MAX_MB', fallback=10)
+LOG_BACKUPS = CONFIG.getint('Logging', 'BACKUPS', fallback=5)
+# Console (--no-ui) runs print one status line every STATUS_INTERVAL_SECONDS instead of per-case messages.
+STATUS_INTERVAL_SECONDS = CONFIG.getint('Logging', 'STATUS_INTERVAL_SECONDS', fallback=5)
+# Levels of single modules, e.g. "processing = DEBUG" or "http_client = WARNING".
+LOG_LEVELS = {key: value.strip().upper() for key, value in CONFIG.items('LogLevels')} if CONFIG.has_section('LogLevels') else {}
+
+# --- Job Logs (see job_log.py) ---
+# Log entries kept in memory per job; the full log is in the job's log file under jobs_state.
+JOB_LOG_MEMORY_ENTRIES = CONFIG.getint('JobLog', 'MEMORY_ENTRIES', fallback=1000)
+# Entries the job log view shows before dropping the oldest, and entries per "older entries" page.
+JOB_LOG_VIEW_ENTRIES = CONFIG.getint('JobLog', 'VIEW_ENTRIES', fallback=2000)
+JOB_LOG_PAGE_ENTRIES = CONFIG.getint('JobLog', 'PAGE_ENTRIES', fallback=500)
+
 # --- Flags for Resume and Retry Options (used by processing.py) ---
 resume_mode = False
 retry_401_flag = False
 
 # --- ARGS will be set in main.py after command-line parsing ---
 ARGS = None
+# Job built for the console/curses modes (set by processing.processing_main).
+current_job = None
 
 def generate_filename(source_file_path, experiment_id, basename, extension):
     """
@@ -89,10 +225,9 @@ def generate_filename(source_file_path, experiment_id, basename, extension):
     The final filename will be: <md5>_<experiment_id>_<basename>.<extension>
     and will be placed in the OUTPUT_DIR.
     """
+    import input_source
     try:
-        with open(source_file_path, 'rb') as f:
-            content = f.read()
-        md5sum = hashlib.md5(content).hexdigest()
+        md5sum = input_source.content_md5(source_file_path)
     except Exception as e:
         raise RuntimeError(f"Error reading file {source_file_path}: {e}") from e
     filename = f"{md5sum}_{experiment_id}_{basename}.{extension}"
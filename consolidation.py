@@ -1,37 +1,23 @@
 import os
 import csv
-import json
 import re
 import pandas as pd
 from openpyxl.styles import Alignment
 import config
-from log_config import logger
+import input_index
+import json_codec
+import job_store
+from log_config import get_logger
+
+logger = get_logger(__name__)
 
 def load_original_cases(file_name):
-    cases = {}
-    ext = os.path.splitext(file_name)[1].lower()
-    with open(file_name, 'r', encoding='latin-1') as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                if ext == ".txt":
-                    # For text files, assume each line is the case number.
-                    case_num = line
-                    # Create a minimal data structure for compatibility.
-                    cases[case_num] = {"Incidents_IncidentId": case_num, "raw": line}
-                else:
-                    try:
-                        data = json.loads(line)
-                        case_num = data.get("Incidents_IncidentId", "").strip()
-                        if case_num:
-                            cases[case_num] = data
-                        else:
-                            print(f"Warning: No case number found in line: {line}")
-                            logger.info("Warning: No case number found in line: {line}")
-                    except json.JSONDecodeError as e:
-                        print(f"Warning: Invalid JSON line: {line} Error: {e}")
-                        logger.info("Warning: Invalid JSON line: {line} Error: {e}")
-    return cases
+    """
+    Return {case_number: original data} for the input file, backed by its byte-offset index:
+    a case's line is read and parsed only when it is looked up. Invalid lines are reported
+    once, when the index is built (see input_index.scan_input()).
+    """
+    return input_index.get_index(file_name).original_cases()
 
 def load_error_log(file_name):
     errors = {}
@@ -48,6 +34,19 @@ def load_error_log(file_name):
                         print(f"Warning: Could not extract case number from error: {line}")
     return errors
 
+def load_job_errors(job):
+    """
+    Return {case_number: error message} for a job: from its job store if it has one
+    (an indexed query), otherwise by scanning its API error log.
+    """
+    store = job_store.open_store(job)
+    if store is None:
+        return load_error_log(job.api_error_log_file)
+    try:
+        return store.errors()
+    finally:
+        store.close()
+
 def load_api_responses(file_name):
     if not os.path.exists(file_name) or os.stat(file_name).st_size == 0:
         # No responses to load — return empty header + dict
@@ -102,38 +101,28 @@ def load_api_responses(file_name):
 
 def consolidate_data(original_file, original_cases, error_log, api_header, api_dict, output_csv):
     consolidated_rows = []
-    json_keys = set()
-    for data in original_cases.values():
-        json_keys.update(data.keys())
-    json_keys = sorted(json_keys)
+    # The index already holds the key union and the offset of every row, so each row is parsed once here.
+    index = input_index.get_index(original_file)
+    json_keys = index.json_keys
     if api_header is None:
         api_header = ["API_Column"]
     consolidated_header = api_header + json_keys + ["Error_Message"]
     consolidated_rows.append(consolidated_header)
-    with open(original_file, 'r', encoding='latin-1') as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                data = json.loads(line)
-            except json.JSONDecodeError:
-                continue
-            case_num = data.get("Incidents_IncidentId", "").strip()
-            json_values = [data.get(key, "") for key in json_keys]
-            if case_num in error_log:
-                placeholders = ["Information not found"] * len(api_header)
-                error_msg = error_log[case_num]
-                row = placeholders + json_values + [error_msg]
-                consolidated_rows.append(row)
-            else:
-                if case_num in api_dict:
-                    for api_row in api_dict[case_num]:
-                        row = api_row + json_values + [""]
-                        consolidated_rows.append(row)
-                else:
-                    row = ["Missing"] * len(api_header) + json_values + [""]
+    for case_num, data in index.iter_parsed_rows():
+        json_values = [data.get(key, "") for key in json_keys]
+        if case_num in error_log:
+            placeholders = ["Information not found"] * len(api_header)
+            error_msg = error_log[case_num]
+            row = placeholders + json_values + [error_msg]
+            consolidated_rows.append(row)
+        else:
+            if case_num in api_dict:
+                for api_row in api_dict[case_num]:
+                    row = api_row + json_values + [""]
                     consolidated_rows.append(row)
+            else:
+                row = ["Missing"] * len(api_header) + json_values + [""]
+                consolidated_rows.append(row)
     with open(output_csv, 'w', newline='', encoding='latin-1') as f:
         writer = csv.writer(f, quoting=csv.QUOTE_ALL)
         writer.writerows(consolidated_rows)
@@ -142,21 +131,9 @@ def consolidate_data(original_file, original_cases, error_log, api_header, api_d
 def load_original_cases_txt(input_file):
     """
     Load original cases from the input file.
-    Returns a dictionary mapping case numbers to their JSON objects.
+    Returns a mapping of case numbers to their JSON objects, read through the input index.
     """
-    cases = {}
-    with open(input_file, 'r', encoding='latin-1') as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                try:
-                    data = json.loads(line)
-                    case_num = data.get("Incidents_IncidentId", "").strip()
-                    if case_num:
-                        cases[case_num] = data
-                except json.JSONDecodeError as e:
-                    logger.info(f"Invalid JSON line: {line} Error: {e}")
-    return cases
+    return input_index.get_index(input_file).original_cases()
 
 def load_error_log_txt(error_log_file):
     """
@@ -229,7 +206,6 @@ def simple_txt_consolidator(input_file, error_log_file, api_response_file, outpu
     print(f"TXT consolidation written to {output_txt}")
 
 def consolidate_case_txt(job, case_number, original_line, api_output, error_message):
-    print(f"[DEBUG] Writing TXT consolidation for case {case_number} to file: {job.consolidated_txt}")
     """
     Immediately consolidates a single case for TXT mode.
     Writes a block containing:
@@ -238,9 +214,10 @@ def consolidate_case_txt(job, case_number, original_line, api_output, error_mess
       - Either the API response (if available) or the error message,
       - A separator line.
     """
+    logger.debug("Writing TXT consolidation for case %s to %s", case_number, job.consolidated_txt)
     try:
-        original_data = json.loads(original_line)
-        original_str = json.dumps(original_data, indent=2)
+        original_data = json_codec.loads(original_line)
+        original_str = json_codec.dumps_pretty(original_data)
     except Exception as e:
         logger.info(f"Error parsing original data for case {case_number}: {e}")
         original_str = original_line
@@ -255,7 +232,11 @@ def consolidate_case_txt(job, case_number, original_line, api_output, error_mess
         block += "No API response or error found.\n"
     block += "\n" + "-" * 50 + "\n\n"
 
-    # Write the block with thread safety.
+    # The job's output writer appends it in the background; otherwise write it with thread safety.
+    writer = getattr(job, "output_writer", None)
+    if writer is not None:
+        writer.write(job.consolidated_txt, block, encoding='latin-1')
+        return
     with job.consolidation_lock:
         with open(job.consolidated_txt, 'a', encoding='latin-1') as f:
             f.write(block)
@@ -2,45 +2,46 @@ import curses
 import time
 import itertools
 import threading
-from log_config import logger
+from log_config import get_logger
 import processing
 import config
 import utils
 from config import generate_filename
 
+logger = get_logger(__name__)
+
 def curses_main(stdscr):
     curses.curs_set(0)
     # Temporarily disable non-blocking mode for resume prompt:
     stdscr.nodelay(False)
-    job.processed_tracking_file = generate_filename(config.ARGS.file, config.experimentId, "processed", "txt")
-    job.api_401_tracking_file = generate_filename(config.ARGS.file, config.experimentId, "401", "txt")
+    job = processing.create_headless_job()
+    
+    # Prompt for resume/start fresh options using the existing function.
+    processing.check_resume_option(stdscr, job)
+
     # After the prompt, re-enable non-blocking mode for the spinner/UI loop:
     stdscr.nodelay(True)
     spinner_cycle = itertools.cycle(["|", "/", "-", "\\"])
     start_time = time.time()
-    
-    # Prompt for resume/start fresh options using the existing function.
-    processing.check_resume_option(stdscr)
 
     # Start processing in a background thread.
-    processing_thread = threading.Thread(target=processing.processing_main)
+    processing_thread = threading.Thread(target=processing.processing_main, args=(job,))
     processing_thread.start()
 
     # Update the curses UI until processing is complete.
-    while processing_thread.is_alive() or config.cases_processed < config.total_cases:
+    while processing_thread.is_alive():
         elapsed_time = time.time() - start_time
         minutes, seconds = divmod(int(elapsed_time), 60)
         stdscr.move(0, 0)
         stdscr.clrtoeol()
-        stdscr.addstr(0, 0, f"Processing cases: {config.cases_processed}/{config.total_cases}")
+        stdscr.addstr(0, 0, f"Processing cases: {job.progress_done}/{job.progress_total}")
         stdscr.move(1, 0)
         stdscr.clrtoeol()
         stdscr.addstr(1, 0, f"{next(spinner_cycle)}")
         stdscr.move(2, 0)
         stdscr.clrtoeol()
         stdscr.addstr(2, 0, f"Elapsed time: {minutes:02}:{seconds:02}")
-        with config.details_lock:
-            details_to_show = config.processing_details[-20:]
+        details_to_show = job.logs.tail(20)
         for i, msg in enumerate(details_to_show):
             stdscr.move(4 + i, 0)
             stdscr.clrtoeol()
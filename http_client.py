@@ -0,0 +1,72 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+import config
+from log_config import get_logger
+
+logger = get_logger(__name__)
+
+# Process-wide pooled session shared by processing jobs, the chat window and the web app.
+_session = None
+_pool_size = 0
+_session_lock = threading.Lock()
+
+def get_session(pool_size=None):
+    """
+    Return the shared keep-alive session.
+    The connection pool is grown (never shrunk) so that it holds at least
+    `pool_size` connections per host, or HTTP_POOL_SIZE from config.ini.
+    """
+    global _session, _pool_size
+    wanted = max(pool_size or 0, config.HTTP_POOL_SIZE, 1)
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+        if wanted > _pool_size:
+            # Mounting a new adapter replaces the old pool; requests already in flight
+            # on the old adapter finish normally and its connections are released.
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=wanted)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            _pool_size = wanted
+            logger.info(f"HTTP connection pool sized to {wanted} connections per host.")
+        return _session
+
+def warm_up(pool_size=None, url=None):
+    """
+    Open up to HTTP_WARMUP_CONNECTIONS connections to the API host before the first case,
+    so the TCP and TLS handshakes are not paid by the first requests of a job.
+    Failures are ignored; the real requests will surface any connectivity problem.
+    """
+    session = get_session(pool_size)
+    url = url or config.apiUrl
+    count = min(max(pool_size or 1, 1), config.HTTP_WARMUP_CONNECTIONS)
+    if not url or count <= 0:
+        return
+
+    def open_connection():
+        try:
+            session.head(url, timeout=config.API_TIMEOUT)
+        except Exception as e:
+            logger.debug("Connection warm-up to %s failed: %s", url, e)
+
+    threads = [threading.Thread(target=open_connection, daemon=True) for _ in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    logger.info(f"Warmed up {count} connection(s) to {url}.")
+
+def post(url, **kwargs):
+    """POST through the shared session, defaulting the timeout to API_TIMEOUT."""
+    kwargs.setdefault("timeout", config.API_TIMEOUT)
+    return get_session().post(url, **kwargs)
+
+def close_session():
+    """Close the shared session and all of its pooled connections."""
+    global _session, _pool_size
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _pool_size = 0
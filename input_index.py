@@ -0,0 +1,413 @@
+import hashlib
+import json
+import mmap
+import os
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+import config
+import input_source
+import json_codec
+from log_config import get_logger
+
+logger = get_logger(__name__)
+
+# Bump when the sidecar format changes so old index files are rebuilt.
+INDEX_VERSION = 2
+
+def _case_key(case_number):
+    """The integer key of a plain numeric case number (no sign or leading zero, fits 64 bits), else None."""
+    if (case_number.isascii() and case_number.isdigit() and len(case_number) <= 18
+            and (case_number[0] != "0" or case_number == "0")):
+        return int(case_number)
+    return None
+
+class InputIndex:
+    """
+    Byte-offset index of an input file, built in one pass.
+
+    Every valid input row, in file order, has an offset and a length into the (decompressed)
+    input and the key of its case number, kept in `array` columns rather than as Python
+    objects: a plain numeric case number is its own key, any other case number is stored
+    once in `names` and keyed by its negative position there. `is_first` marks the first row
+    of each case number, the one that is processed; later rows are its duplicates. Case
+    lookups go through the sorted keys of the first rows. `invalid` lists
+    [offset, length, reason] for lines without a case number or with invalid JSON, and
+    `json_keys` is the sorted union of the keys of all rows. Lines of a plain file are read
+    back through a memory map; compressed and directory inputs are read forward from the
+    start instead.
+    """
+    def __init__(self, path, fingerprint, offsets, lengths, keys, is_first, names, invalid, json_keys,
+                 sorted_keys=None, sorted_rows=None):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.offsets = offsets
+        self.lengths = lengths
+        self.keys = keys
+        self.is_first = is_first
+        self.names = names
+        self._name_ids = {name: i for i, name in enumerate(names)}
+        self.invalid = invalid
+        self.json_keys = json_keys
+        self.is_txt = input_source.is_txt(path)
+        if sorted_keys is None:
+            rows = sorted((i for i in range(len(keys)) if is_first[i]), key=keys.__getitem__)
+            sorted_rows = array("q", rows)
+            sorted_keys = array("q", (keys[i] for i in rows))
+        self.sorted_keys = sorted_keys
+        self.sorted_rows = sorted_rows
+        self.first_row = FirstRows(self)
+
+    @property
+    def row_count(self):
+        return len(self.offsets)
+
+    @property
+    def unique_count(self):
+        return len(self.sorted_keys)
+
+    @property
+    def duplicate_count(self):
+        return self.row_count - self.unique_count
+
+    def case_at(self, row):
+        key = self.keys[row]
+        return str(key) if key >= 0 else self.names[-1 - key]
+
+    def _key_of(self, case_number):
+        key = _case_key(case_number)
+        if key is None:
+            name_id = self._name_ids.get(case_number)
+            return None if name_id is None else -1 - name_id
+        return key
+
+    def first_row_of(self, case_number):
+        """The row of the case's first input row, or None if the case is not in the input."""
+        key = self._key_of(case_number)
+        if key is None:
+            return None
+        i = bisect_left(self.sorted_keys, key)
+        if i < len(self.sorted_keys) and self.sorted_keys[i] == key:
+            return self.sorted_rows[i]
+        return None
+
+    def _entry(self, tag, row):
+        return tag, self.offsets[row], self.lengths[row]
+
+    def _read_lines(self, entries):
+        """
+        For each (tag, offset, length) of `entries`, which must be in file order, yield
+        (tag, stripped line at that offset).
+        """
+        if input_source.is_mappable(self.path):
+            with open(self.path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    for tag, offset, length in entries:
+                        yield tag, data[offset:offset + length].decode("latin-1").strip()
+        else:
+            with input_source.open_input(self.path) as f:
+                position = 0
+                for tag, offset, length in entries:
+                    input_source.skip(f, offset - position)
+                    position = offset + length
+                    yield tag, f.read(length).decode("latin-1").strip()
+
+    def _parse(self, case_number, line):
+        if self.is_txt:
+            # For text files each line is the case number; keep the shape load_original_cases always had.
+            return {"Incidents_IncidentId": case_number, "raw": line}
+        return json_codec.loads(line)
+
+    def iter_rows(self, first_only=False):
+        """Yield (case_number, original_line) for every valid row (or only each case's first row) in file order."""
+        is_first = self.is_first
+        rows = (i for i in range(self.row_count) if not first_only or is_first[i])
+        return self._read_lines(self._entry(self.case_at(i), i) for i in rows)
+
+    def unique_cases(self):
+        """Yield (case_number, original_line) once per case number, in file order."""
+        return self.iter_rows(first_only=True)
+
+    def pending_cases(self, processed=(), start=0):
+        """
+        Yield (row, case_number, original_line) for the first row of each case from row `start`
+        on, skipping cases in `processed` without reading their lines.
+        """
+        def entries():
+            for i in range(start, self.row_count):
+                if self.is_first[i]:
+                    case_number = self.case_at(i)
+                    if case_number not in processed:
+                        yield self._entry((i, case_number), i)
+        for (i, case_number), line in self._read_lines(entries()):
+            yield i, case_number, line
+
+    def selected_cases(self, case_numbers):
+        """Yield (row, case_number, original_line) for the first row of each of `case_numbers` in the input, in file order."""
+        selected = sorted(row for row in map(self.first_row_of, case_numbers) if row is not None)
+        entries = (self._entry((i, self.case_at(i)), i) for i in selected)
+        for (i, case_number), line in self._read_lines(entries):
+            yield i, case_number, line
+
+    def duplicate_rows(self):
+        """
+        A read-only {case_number: [original lines of its duplicate rows]} mapping. For a plain
+        file only the positions of the duplicate rows are held and their lines are read when a
+        case is looked up; compressed and directory inputs cannot be read at an offset without
+        decompressing from the start, so their duplicate lines are read up front.
+        """
+        if not self.duplicate_count:
+            return DuplicateRows(self, array("q"))
+        is_first = self.is_first
+        rows = [i for i in range(self.row_count) if not is_first[i]]
+        if not input_source.is_mappable(self.path):
+            lines = {}
+            for case_number, line in self._read_lines(self._entry(self.case_at(i), i) for i in rows):
+                lines.setdefault(case_number, []).append(line)
+            return lines
+        rows.sort(key=self.keys.__getitem__)  # stable: each case's rows stay in file order
+        return DuplicateRows(self, array("q", rows))
+
+    def iter_parsed_rows(self):
+        """Yield (case_number, data) for every valid row in file order, parsing each line once."""
+        for case_number, line in self.iter_rows():
+            yield case_number, self._parse(case_number, line)
+
+    def invalid_lines(self):
+        """Yield (line, reason) for every line that was skipped (and logged) when the index was built."""
+        for reason, line in self._read_lines((reason, offset, length) for offset, length, reason in self.invalid):
+            yield line, reason
+
+    def original_cases(self):
+        """A read-only {case_number: data} mapping that parses a case only when it is looked up."""
+        return IndexedCases(self)
+
+    def load_case(self, case_number):
+        lines = self._read_lines([self._entry(case_number, self.first_row_of(case_number))])
+        try:
+            return self._parse(*next(lines))
+        finally:
+            lines.close()
+
+class FirstRows(Mapping):
+    """Mapping view of an InputIndex: case number -> row of its first input row, in file order."""
+    def __init__(self, index):
+        self.index = index
+
+    def __getitem__(self, case_number):
+        row = self.index.first_row_of(case_number)
+        if row is None:
+            raise KeyError(case_number)
+        return row
+
+    def __contains__(self, case_number):
+        return self.index.first_row_of(case_number) is not None
+
+    def __iter__(self):
+        index = self.index
+        return (index.case_at(i) for i in range(index.row_count) if index.is_first[i])
+
+    def __len__(self):
+        return self.index.unique_count
+
+class IndexedCases(Mapping):
+    """Mapping view of an InputIndex: case number -> parsed original data (first row of the case)."""
+    def __init__(self, index):
+        self.index = index
+        self.json_keys = index.json_keys
+
+    def __getitem__(self, case_number):
+        if case_number not in self.index.first_row:
+            raise KeyError(case_number)
+        return self.index.load_case(case_number)
+
+    def __iter__(self):
+        return iter(self.index.first_row)
+
+    def __len__(self):
+        return self.index.unique_count
+
+class DuplicateRows(Mapping):
+    """Mapping view of the duplicate rows of an InputIndex: case number -> original lines of its later rows."""
+    def __init__(self, index, rows):
+        self.index = index
+        self.rows = rows  # duplicate rows sorted by case key, each case's in file order
+        self._keys = array("q", (index.keys[i] for i in rows))
+        self._count = len(set(self._keys))
+
+    def __getitem__(self, case_number):
+        index = self.index
+        key = index._key_of(case_number)
+        i = bisect_left(self._keys, key) if key is not None else len(self._keys)
+        entries = []
+        while i < len(self._keys) and self._keys[i] == key:
+            entries.append(index._entry(case_number, self.rows[i]))
+            i += 1
+        if not entries:
+            raise KeyError(case_number)
+        return [line for _, line in index._read_lines(entries)]
+
+    def __iter__(self):
+        previous = None
+        for i, key in enumerate(self._keys):
+            if key != previous:
+                previous = key
+                yield self.index.case_at(self.rows[i])
+
+    def __len__(self):
+        return self._count
+
+def scan_input(path):
+    """
+    Scan an input (a plain, .gz or .zst file, or a directory of them) once, yielding
+    (row, case_number, original_line, is_first) for every valid row as it is read, so the
+    caller can start on the first cases before the scan ends. When the scan completes, the
+    index is saved next to the others and get_index() returns it without scanning again.
+    """
+    is_txt = input_source.is_txt(path)
+    fingerprint = input_source.fingerprint(path)
+    offsets, lengths, keys, is_first = array("q"), array("q"), array("q"), bytearray()
+    names, name_ids, seen = [], {}, set()
+    invalid = []
+    json_keys = set(["Incidents_IncidentId", "raw"]) if is_txt else set()
+    offset = 0
+    with input_source.open_input(path) as f:
+        for raw in f:
+            length = len(raw)
+            line = raw.decode("latin-1").strip()
+            case_number = None
+            if line:
+                if is_txt:
+                    case_number = line
+                else:
+                    try:
+                        data = json_codec.loads(line)
+                        case_number = data.get("Incidents_IncidentId", "").strip()
+                        if case_number:
+                            json_keys.update(data.keys())
+                        else:
+                            invalid.append([offset, length, "No case number found"])
+                    except (json.JSONDecodeError, AttributeError) as e:
+                        invalid.append([offset, length, f"Invalid JSON format: {e}"])
+                    if not case_number:
+                        # Reported here only: runs that reuse the index do not repeat them.
+                        logger.warning(f"{invalid[-1][2]} in line: {line}")
+            if case_number:
+                key = _case_key(case_number)
+                if key is None:
+                    name_id = name_ids.get(case_number)
+                    if name_id is None:
+                        name_id = name_ids[case_number] = len(names)
+                        names.append(case_number)
+                    key = -1 - name_id
+                first = key not in seen
+                if first:
+                    seen.add(key)
+                offsets.append(offset)
+                lengths.append(length)
+                keys.append(key)
+                is_first.append(first)
+                yield len(offsets) - 1, case_number, line, first
+            offset += length
+    del seen, name_ids
+    index = InputIndex(path, fingerprint, offsets, lengths, keys, is_first, names, invalid, sorted(json_keys))
+    _save_sidecar(index)
+    logger.info(f"Indexed {path}: {index.row_count} rows, {index.unique_count} cases, "
+                f"{len(index.invalid)} invalid lines.")
+    with _indexes_lock:
+        _indexes[os.path.abspath(path)] = index
+
+def build_index(path):
+    """Scan the input file once and return its InputIndex."""
+    for _ in scan_input(path):
+        pass
+    return _indexes[os.path.abspath(path)]
+
+def _sidecar_path(path):
+    name = hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()[:32]
+    return os.path.join(config.INPUT_INDEX_DIR, f"{name}.idx")
+
+# Sidecar layout: one JSON header line, then the raw bytes of these columns.
+_COLUMNS = ("offsets", "lengths", "keys", "sorted_keys", "sorted_rows")
+
+def _load_sidecar(path, fingerprint):
+    sidecar = _sidecar_path(path)
+    if not os.path.exists(sidecar):
+        return None
+    try:
+        with open(sidecar, "rb") as f:
+            header = json_codec.loads(f.readline())
+            if (header.get("version") != INDEX_VERSION or header.get("fingerprint") != fingerprint
+                    or header.get("byteorder") != sys.byteorder):
+                return None
+            columns = {}
+            for name in _COLUMNS:
+                columns[name] = array("q")
+                columns[name].fromfile(f, header["unique" if name.startswith("sorted") else "rows"])
+            is_first = bytearray(f.read(header["rows"]))
+            if len(is_first) != header["rows"]:
+                raise EOFError("truncated file")
+    except (OSError, ValueError, EOFError, KeyError) as e:
+        logger.warning(f"Ignoring unreadable input index {sidecar}: {e}")
+        return None
+    return InputIndex(path, fingerprint, columns["offsets"], columns["lengths"], columns["keys"], is_first,
+                      header["names"], header["invalid"], header["json_keys"],
+                      columns["sorted_keys"], columns["sorted_rows"])
+
+def _save_sidecar(index):
+    sidecar = _sidecar_path(index.path)
+    tmp_file = sidecar + ".tmp"
+    try:
+        os.makedirs(config.INPUT_INDEX_DIR, exist_ok=True)
+        with open(tmp_file, "wb") as f:
+            f.write(json_codec.dumps({
+                "version": INDEX_VERSION,
+                "path": os.path.abspath(index.path),
+                "fingerprint": index.fingerprint,
+                "byteorder": sys.byteorder,
+                "rows": index.row_count,
+                "unique": index.unique_count,
+                "json_keys": index.json_keys,
+                "names": index.names,
+                "invalid": index.invalid,
+            }).encode("utf-8") + b"\n")
+            for name in _COLUMNS:
+                getattr(index, name).tofile(f)
+            f.write(index.is_first)
+        os.replace(tmp_file, sidecar)
+    except OSError as e:
+        logger.warning(f"Could not write input index {sidecar}: {e}")
+
+# Indexes already loaded in this process, by absolute path.
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def cached_index(path):
+    """
+    Return the index of an input from memory, or from its sidecar file if the input has not
+    changed since (same size and modification time); None if the input has to be scanned.
+    """
+    abs_path = os.path.abspath(path)
+    fingerprint = input_source.fingerprint(path)
+    with _indexes_lock:
+        index = _indexes.get(abs_path)
+        if index is not None and index.fingerprint == fingerprint:
+            return index
+        index = _load_sidecar(path, fingerprint)
+        if index is not None:
+            _indexes[abs_path] = index
+        return index
+
+def get_index(path):
+    """
+    Return the index of an input (a plain, .gz or .zst file, or a directory of them): from
+    memory, from its sidecar file, or by scanning the input once.
+    """
+    index = cached_index(path)
+    if index is None:
+        index = build_index(path)
+    return index
@@ -0,0 +1,183 @@
+import gzip
+import hashlib
+import io
+import os
+import sys
+import config
+from log_config import get_logger
+
+logger = get_logger(__name__)
+
+try:
+    import zstandard
+except ImportError:  # Optional: only needed for .zst inputs.
+    zstandard = None
+
+COMPRESSED_SUFFIXES = (".gz", ".zst")
+INPUT_EXTENSIONS = (".json", ".jsonl", ".txt")
+STDIN = "-"
+
+def read_buffer_size():
+    return max(64, config.INPUT_READ_BUFFER_KB) * 1024
+
+def compression(path):
+    """The compression suffix of an input file (".gz" or ".zst"), or None for plain files."""
+    suffix = os.path.splitext(path)[1].lower()
+    return suffix if suffix in COMPRESSED_SUFFIXES else None
+
+def directory_members(path):
+    """The input files of a directory input, in name order (compressed files included)."""
+    members = []
+    for name in sorted(os.listdir(path)):
+        member = os.path.join(path, name)
+        if os.path.isfile(member) and base_extension(member) in INPUT_EXTENSIONS:
+            members.append(member)
+    return members
+
+def base_extension(path):
+    """
+    The extension that decides how lines are parsed: ".txt" (one case number per line) or a
+    JSON extension. Compression suffixes are ignored; a directory is ".txt" only if all its
+    input files are.
+    """
+    if os.path.isdir(path):
+        members = directory_members(path)
+        if members and all(base_extension(m) == ".txt" for m in members):
+            return ".txt"
+        return ".jsonl"
+    if compression(path):
+        path = path[:-len(compression(path))]
+    return os.path.splitext(path)[1].lower()
+
+def is_txt(path):
+    return base_extension(path) == ".txt"
+
+def is_mappable(path):
+    """True for a plain (uncompressed) file, whose rows can be read back through a memory map."""
+    return os.path.isfile(path) and compression(path) is None
+
+def _open_file(path):
+    raw = open(path, "rb", buffering=read_buffer_size())
+    kind = compression(path)
+    try:
+        if kind == ".gz":
+            return io.BufferedReader(gzip.GzipFile(fileobj=raw), read_buffer_size())
+        if kind == ".zst":
+            if zstandard is None:
+                raise RuntimeError(f"Reading {path} requires the 'zstandard' package.")
+            return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True),
+                                     read_buffer_size())
+    except Exception:
+        raw.close()
+        raise
+    return raw
+
+class _ConcatenatedReader(io.RawIOBase):
+    """The decompressed contents of several input files read as one stream, with a newline after each file."""
+    def __init__(self, paths):
+        self._paths = list(paths)
+        self._current = None
+        self._separator = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while True:
+            if self._separator:
+                n = min(len(buffer), len(self._separator))
+                buffer[:n] = self._separator[:n]
+                self._separator = self._separator[n:]
+                return n
+            if self._current is None:
+                if not self._paths:
+                    return 0
+                self._current = _open_file(self._paths.pop(0))
+            data = self._current.read(len(buffer))
+            if data:
+                buffer[:len(data)] = data
+                return len(data)
+            # A file that does not end with a newline must not run into the next one.
+            self._current.close()
+            self._current = None
+            self._separator = b"\n"
+
+    def close(self):
+        if self._current is not None:
+            self._current.close()
+            self._current = None
+        super().close()
+
+def open_input(path):
+    """
+    Open an input for reading as one binary stream of its (decompressed) lines, with a large
+    read buffer. `path` may be a plain, .gz or .zst file, or a directory of such files.
+    """
+    if os.path.isdir(path):
+        return io.BufferedReader(_ConcatenatedReader(directory_members(path)), read_buffer_size())
+    return _open_file(path)
+
+def skip(stream, count):
+    """Read past `count` bytes of a stream that cannot seek."""
+    chunk = read_buffer_size()
+    while count > 0:
+        data = stream.read(min(count, chunk))
+        if not data:
+            break
+        count -= len(data)
+
+def fingerprint(path):
+    """Size and modification time of an input; for a directory, over all its input files."""
+    if os.path.isdir(path):
+        stats = [os.stat(m) for m in directory_members(path)]
+        return {"size": sum(s.st_size for s in stats),
+                "mtime_ns": max((s.st_mtime_ns for s in stats), default=0),
+                "files": len(stats)}
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def content_md5(path):
+    """MD5 of the input's stored bytes, read in chunks (for a directory, of its files in order)."""
+    md5 = hashlib.md5()
+    for member in (directory_members(path) if os.path.isdir(path) else [path]):
+        with open(member, "rb") as f:
+            for chunk in iter(lambda: f.read(read_buffer_size()), b""):
+                md5.update(chunk)
+    return md5.hexdigest()
+
+def spool_stdin(stream=None):
+    """
+    Save an input piped to standard input under INPUT_SPOOL_DIR and return its path.
+    The input is read several times (index, processing, consolidation), so it needs one copy.
+    Compressed data is kept compressed. The file is named after its content, so piping the
+    same input again resumes the same job.
+    """
+    stream = stream or sys.stdin.buffer
+    os.makedirs(config.INPUT_SPOOL_DIR, exist_ok=True)
+    tmp_file = os.path.join(config.INPUT_SPOOL_DIR, f"stdin-{os.getpid()}.tmp")
+    md5 = hashlib.md5()
+    head = b""
+    with open(tmp_file, "wb") as out:
+        for chunk in iter(lambda: stream.read(read_buffer_size()), b""):
+            if not head:
+                head = chunk[:4]
+            md5.update(chunk)
+            out.write(chunk)
+    if head.startswith(b"\x1f\x8b"):
+        suffix = ".jsonl.gz"
+    elif head.startswith(b"\x28\xb5\x2f\xfd"):
+        suffix = ".jsonl.zst"
+    else:
+        suffix = ".jsonl"
+    path = os.path.join(config.INPUT_SPOOL_DIR, f"stdin-{md5.hexdigest()[:16]}{suffix}")
+    if os.path.exists(path):
+        # Same input as an earlier run: keep the existing file (and its modification time, so its index is reused).
+        os.remove(tmp_file)
+    else:
+        os.replace(tmp_file, path)
+    logger.info(f"Standard input saved to {path}.")
+    return path
+
+def is_spooled(path):
+    """True if `path` is an input saved by spool_stdin()."""
+    return os.path.dirname(os.path.abspath(path)) == os.path.abspath(config.INPUT_SPOOL_DIR)
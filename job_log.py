@@ -0,0 +1,149 @@
+import atexit
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from log_config import get_logger
+
+logger = get_logger(__name__)
+
+# Job logs with a file open, flushed when the program exits.
+_open_logs = weakref.WeakSet()
+
+class JobLog:
+    """
+    A job's log: every entry is appended to the job's log file, and only the most recent
+    `max_entries` entries are kept in memory (for the job views and the console).
+
+    Entries are numbered in the order they are added (len() is the next number), so a view
+    can ask for what it has not shown yet with entries_since(). Entries that have left the
+    memory buffer are read back from the file a page at a time with read_before().
+
+    File writes are buffered and flushed at most every FLUSH_SECONDS (or when the buffer
+    fills), before the file is read back, on close() and when the program exits.
+    """
+    FLUSH_SECONDS = 1.0
+
+    def __init__(self, path=None, max_entries=1000):
+        self.path = path
+        self._entries = deque(maxlen=max(1, max_entries))  # (number, file offset, text)
+        self._count = 0
+        self._size = 0
+        self._file = None
+        self._flushed_at = 0.0
+        self._lock = threading.RLock()
+        if path and os.path.exists(path):
+            self._size = os.path.getsize(path)
+            for offset, text in self.read_before(self._size, self._entries.maxlen)[1]:
+                self._entries.append((self._count, offset, text))
+                self._count += 1
+
+    def append(self, entry):
+        entry = str(entry)
+        data = (entry + "\n").encode("utf-8", errors="replace")
+        with self._lock:
+            offset = self._size
+            if self.path:
+                try:
+                    if self._file is None:
+                        self._file = open(self.path, "ab")
+                        _open_logs.add(self)
+                    self._file.write(data)
+                    self._size += len(data)
+                    now = time.monotonic()
+                    if now - self._flushed_at >= self.FLUSH_SECONDS:
+                        self._file.flush()
+                        self._flushed_at = now
+                except OSError as e:
+                    # Keep logging in memory; the entry is only missing from the file.
+                    logger.error(f"Could not write to job log {self.path}: {e}")
+            self._entries.append((self._count, offset, entry))
+            self._count += 1
+
+    def extend(self, entries):
+        for entry in entries:
+            self.append(entry)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        with self._lock:
+            return iter([text for _, _, text in self._entries])
+
+    def tail(self, count):
+        """The last `count` entries (at most the ones in memory)."""
+        with self._lock:
+            return [text for _, _, text in list(self._entries)[-count:]] if count > 0 else []
+
+    def entries_since(self, number):
+        """(number, file offset, text) of the entries in memory numbered `number` or later."""
+        with self._lock:
+            return [entry for entry in self._entries if entry[0] >= number]
+
+    def read_before(self, offset, count):
+        """
+        Read up to `count` log lines that end before byte `offset` of the log file.
+        Returns (offset of the first line read, [(offset, text), ...]).
+        """
+        if not self.path or offset <= 0 or count <= 0:
+            return 0, []
+        with self._lock:
+            try:
+                self.flush()
+                with open(self.path, "rb") as f:
+                    start = offset
+                    data = b""
+                    # Read backwards in chunks until `count` complete lines (or the start of the file).
+                    while start > 0 and data.count(b"\n") <= count:
+                        chunk = min(start, 64 * 1024)
+                        start -= chunk
+                        f.seek(start)
+                        data = f.read(chunk) + data
+            except OSError as e:
+                logger.error(f"Could not read job log {self.path}: {e}")
+                return offset, []
+        lines = data.split(b"\n")
+        if lines and lines[-1] == b"":
+            lines.pop()
+        position = start
+        if start > 0:
+            # The first piece is the end of a line that starts before the chunk.
+            position += len(lines.pop(0)) + 1
+        for line in lines[:-count]:
+            position += len(line) + 1
+        result = []
+        for line in lines[-count:]:
+            result.append((position, line.decode("utf-8", errors="replace")))
+            position += len(line) + 1
+        return (result[0][0] if result else offset), result
+
+    def flush(self):
+        """Write the buffered entries to the log file."""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                self._flushed_at = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                _open_logs.discard(self)
+
+    def remove(self):
+        """Close and delete the log file."""
+        self.close()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+def _flush_all():
+    for log in list(_open_logs):
+        try:
+            log.flush()
+        except OSError as e:
+            logger.error(f"Could not write to job log {log.path}: {e}")
+
+atexit.register(_flush_all)
@@ -2,12 +2,13 @@ import threading
 import uuid
 import json
 import os
-import hashlib
+import input_source
 import config
+import job_log
 import time
 
 class Job:
-    def __init__(self, job_id=None, input_file=None, experiment_id=None, experiment_name=None, parsing_method=None, threads=0, batch_size=0):
+    def __init__(self, job_id=None, input_file=None, experiment_id=None, experiment_name=None, parsing_method=None, threads=0, batch_size=0, engine="threads", max_in_flight=0, cache_mode="use", cases_per_request=0):
         self.job_id = job_id or str(uuid.uuid4())
         self.input_file = input_file
         self.experiment_id = experiment_id
@@ -15,11 +16,16 @@ class Job:
         self.parsing_method = parsing_method
         self.threads = threads  # Add thread count parameter
         self.batch_size = batch_size  # Add batch size parameter
+        self.engine = engine  # "threads" or "asyncio"
+        self.max_in_flight = max_in_flight  # asyncio engine concurrency (0 = config default)
+        self.cases_per_request = cases_per_request  # multi-case requests for CSV parsing (0 = one case per request)
+        self.cache_mode = cache_mode  # response cache: "use", "refresh" (re-request and update) or "off"
         self.cancel_event = threading.Event()
         self.status = "running"  # possible values: running, paused, finished, cancelled
         self.progress_total = 0
         self.progress_done = 0
-        self.logs = []
+        # Recent log entries in memory; the whole log is in the job's log file (see job_log.py).
+        self.logs = job_log.JobLog(job_log_path(self.job_id), config.JOB_LOG_MEMORY_ENTRIES)
         self.result_file = None  # path to output result if finished
         # File paths for job-specific outputs:
         self.processed_tracking_file = ""
@@ -36,13 +42,46 @@ class Job:
         self.api_header = None
         self.total_cases = 0
         self.cases_processed = 0
-        self.processing_details = []
         self.resume_mode = False       # Indicates if the job should resume from saved progress
         self.retry_401_flag = False    # For handling repeated 401 errors
         
         # NEW: Consolidation lock for TXT mode
         self.consolidation_lock = threading.Lock()
         
+        # Adaptive concurrency limiter for the running job (runtime only, not persisted)
+        self.concurrency_limiter = None
+        # Process-wide rate limiter of the job's experiment (runtime only, not persisted)
+        self.rate_limiter = None
+        # Cases parked for a delayed retry (runtime only, not persisted)
+        self.retry_queue = None
+        # Extra input rows per duplicated case number, read on lookup (runtime only, not persisted)
+        self.duplicate_rows = {}
+        # Process-wide response cache and this run's hit/miss counts (runtime only, not persisted)
+        self.response_cache = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Request latencies and the optional request hedger (runtime only, not persisted)
+        self.latencies = None
+        self.hedger = None
+        self.hedge_executor = None
+        # Process-wide circuit breaker of the job's experiment (runtime only, not persisted)
+        self.circuit_breaker = None
+        # Retry policy and retry budget of the running job (runtime only, not persisted)
+        self.retry_policy = None
+        self.retry_budget = None
+        # Resume journal and write-behind output writer of the running job (runtime only, not persisted)
+        self.journal = None
+        self.output_writer = None
+        # Optional SQLite store of case status, attempts, errors and results (runtime only, not persisted)
+        self.job_store = None
+        # Last state written by save_job_state, to skip rewriting an unchanged state file (runtime only, not persisted)
+        self.saved_state = None
+        # Cursor into the input index and the index fingerprint, for checkpoints (runtime only, not persisted)
+        self.input_cursor = None
+        self.input_fingerprint = None
+        # Per-case detail messages logged so far, for the console status line (runtime only, not persisted)
+        self.case_messages = 0
+        
         # Placeholder for UI components in the Tkinter tab
         self.ui = {}
 
@@ -60,10 +99,14 @@ class Job:
         self.progress_lock = threading.Lock()  # Add this new lock
 
 
-    def log(self, message):
+    def log(self, message, echo=True):
         timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
         log_entry = f"[{timestamp}] {message}"
         self.logs.append(log_entry)
+        # Jobs without a UI (headless console mode) echo their log to the console;
+        # per-case details (echo=False) are summed up in the periodic status line instead.
+        if self.ui is None and echo:
+            print(log_entry)
 
     def to_dict(self):
         return {
@@ -74,10 +117,13 @@ class Job:
             'parsing_method': self.parsing_method,
             'threads': self.threads,
             'batch_size': self.batch_size,
+            'engine': self.engine,
+            'max_in_flight': self.max_in_flight,
+            'cache_mode': self.cache_mode,
+            'cases_per_request': self.cases_per_request,
             "status": self.status,
             "progress_total": self.progress_total,
             "progress_done": self.progress_done,
-            "logs": self.logs,
             "result_file": self.result_file,
             # File paths
             "processed_tracking_file": self.processed_tracking_file,
@@ -104,12 +150,18 @@ class Job:
             experiment_name=data.get('experiment_name'),
             parsing_method=data.get('parsing_method'),
             threads=data.get('threads', 0),  # Default to 0 if not present (backward compatibility)
-            batch_size=data.get('batch_size', 0)  # Default to 0 if not present
+            batch_size=data.get('batch_size', 0),  # Default to 0 if not present
+            engine=data.get('engine', "threads"),
+            max_in_flight=data.get('max_in_flight', 0),
+            cache_mode=data.get('cache_mode', "use"),
+            cases_per_request=data.get('cases_per_request', 0)
         )
         job.status = data["status"]
         job.progress_total = data["progress_total"]
         job.progress_done = data["progress_done"]
-        job.logs = data["logs"]
+        if data.get("logs") and len(job.logs) == 0:
+            # State saved by older versions carries the whole log: move it to the log file.
+            job.logs.extend(data["logs"])
         job.result_file = data.get("result_file")
         job.processed_tracking_file = data.get("processed_tracking_file", "")
         job.api_401_tracking_file = data.get("api_401_tracking_file", "")
@@ -130,10 +182,7 @@ class Job:
 
 def get_input_file_md5(input_file):
     try:
-        with open(input_file, "rb") as f:
-            content = f.read()
-        md5sum = hashlib.md5(content).hexdigest()
-        return md5sum
+        return input_source.content_md5(input_file)
     except Exception:
         return None
 
@@ -142,25 +191,98 @@ JOBS_STATE_DIR = os.path.join(config.OUTPUT_DIR, "jobs_state")
 if not os.path.exists(JOBS_STATE_DIR):
     os.makedirs(JOBS_STATE_DIR)
 
+def job_log_path(job_id):
+    return os.path.join(JOBS_STATE_DIR, f"{job_id}.log")
+
+# Summary of every saved job (id, status, input, experiment, progress), read at UI start-up
+# instead of every job's state file.
+CATALOG_FILE = os.path.join(JOBS_STATE_DIR, "catalog.json")
+CATALOG_FIELDS = ("status", "input_file", "experiment_id", "progress_done", "progress_total")
+_catalog = None
+
+# The UI and the background checkpointer both save job state.
+_save_lock = threading.Lock()
+
+def _write_file(file_path, text):
+    tmp_file = file_path + ".tmp"
+    with open(tmp_file, "w", encoding="latin-1") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, file_path)
+
+def _state_files():
+    return {filename[:-len(".json")] for filename in os.listdir(JOBS_STATE_DIR)
+            if filename.endswith(".json") and filename != os.path.basename(CATALOG_FILE)}
+
+def _load_catalog():
+    """The catalog, kept in memory; rebuilt from the state files if it is missing or out of date."""
+    global _catalog
+    if _catalog is not None:
+        return _catalog
+    catalog = {}
+    if os.path.exists(CATALOG_FILE):
+        try:
+            with open(CATALOG_FILE, "r", encoding="latin-1") as f:
+                catalog = json.load(f)
+        except ValueError:
+            catalog = {}
+    job_ids = _state_files()
+    changed = set(catalog) != job_ids
+    catalog = {job_id: entry for job_id, entry in catalog.items() if job_id in job_ids}
+    for job_id in job_ids - set(catalog):
+        # Saved without a catalog entry (older versions or an interrupted save).
+        try:
+            with open(os.path.join(JOBS_STATE_DIR, f"{job_id}.json"), "r", encoding="latin-1") as f:
+                data = json.load(f)
+        except ValueError:
+            continue
+        catalog[job_id] = {field: data.get(field) for field in CATALOG_FIELDS}
+    _catalog = catalog
+    if changed:
+        _write_file(CATALOG_FILE, json.dumps(_catalog, separators=(",", ":")))
+    return _catalog
+
+def load_job_catalog():
+    """Return {job_id: {status, input_file, experiment_id, progress_done, progress_total}} of the saved jobs."""
+    with _save_lock:
+        return {job_id: dict(entry) for job_id, entry in _load_catalog().items()}
+
 def save_job_state(job: Job):
-    file_path = os.path.join(JOBS_STATE_DIR, f"{job.job_id}.json")
-    with open(file_path, "w", encoding="latin-1") as f:
-        json.dump(job.to_dict(), f, indent=4)
+    """Write the job's (compact) state file; skipped when the state has not changed since the last save."""
+    data = job.to_dict()
+    state = json.dumps(data, separators=(",", ":"))
+    with _save_lock:
+        if state == job.saved_state:
+            return
+        _write_file(os.path.join(JOBS_STATE_DIR, f"{job.job_id}.json"), state)
+        job.saved_state = state
+        catalog = _load_catalog()
+        entry = {field: data.get(field) for field in CATALOG_FIELDS}
+        if catalog.get(job.job_id) != entry:
+            catalog[job.job_id] = entry
+            _write_file(CATALOG_FILE, json.dumps(catalog, separators=(",", ":")))
 
 def load_all_jobs():
     jobs = {}
-    for filename in os.listdir(JOBS_STATE_DIR):
-        if filename.endswith(".json"):
-            with open(os.path.join(JOBS_STATE_DIR, filename), "r", encoding="latin-1") as f:
-                data = json.load(f)
-                job = Job.from_dict(data)
-                jobs[job.job_id] = job
+    for job_id in _state_files():
+        job = load_job(job_id)
+        if job is not None:
+            jobs[job.job_id] = job
     return jobs
 
-def clear_job_state(job_id):
+def clear_job_state(job_id, job=None):
     file_path = os.path.join(JOBS_STATE_DIR, f"{job_id}.json")
-    if os.path.exists(file_path):
-        os.remove(file_path)
+    with _save_lock:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        catalog = _load_catalog()
+        if catalog.pop(job_id, None) is not None:
+            _write_file(CATALOG_FILE, json.dumps(catalog, separators=(",", ":")))
+    if job is not None:
+        job.logs.remove()
+    elif os.path.exists(job_log_path(job_id)):
+        os.remove(job_log_path(job_id))
 
 def load_job(job_id):
     file_path = os.path.join(JOBS_STATE_DIR, f"{job_id}.json")
@@ -0,0 +1,140 @@
+import os
+import sqlite3
+import threading
+import time
+import config
+from log_config import get_logger
+
+logger = get_logger(__name__)
+
+# Case status values in the cases table.
+DONE = "done"
+FAILED = "failed"
+RETRYING = "retrying"
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS cases ("
+    "case_number TEXT PRIMARY KEY, status TEXT, attempts INTEGER DEFAULT 0, status_code INTEGER, updated REAL)",
+    "CREATE INDEX IF NOT EXISTS cases_status ON cases (status)",
+    "CREATE INDEX IF NOT EXISTS cases_status_code ON cases (status_code)",
+    "CREATE TABLE IF NOT EXISTS attempts ("
+    "case_number TEXT, attempt INTEGER, status_code INTEGER, reason TEXT, created REAL)",
+    "CREATE INDEX IF NOT EXISTS attempts_case ON attempts (case_number)",
+    "CREATE TABLE IF NOT EXISTS errors (case_number TEXT PRIMARY KEY, message TEXT, created REAL)",
+    "CREATE TABLE IF NOT EXISTS results (case_number TEXT PRIMARY KEY, payload TEXT)",
+)
+
+def store_path(job):
+    """The job's database file, next to (and named like) its processed tracking file."""
+    return os.path.splitext(job.processed_tracking_file)[0] + ".sqlite3"
+
+def remove_store(job):
+    """Delete the job's database (for a fresh run)."""
+    path = store_path(job)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+def open_store(job):
+    """Open the job's existing database for queries; None if JOB_STORE is off or the job has none."""
+    if not config.JOB_STORE or not job.processed_tracking_file or not os.path.exists(store_path(job)):
+        return None
+    try:
+        return JobStore(store_path(job))
+    except sqlite3.Error as e:
+        logger.warning(f"Could not open job store {store_path(job)}: {e}")
+        return None
+
+class JobStore:
+    """
+    Optional per-job SQLite database (WAL mode) with indexed tables for case status,
+    attempts, errors and result payloads.
+
+    While a job runs, only its OutputWriter thread writes to the store, in the same units
+    as the output files, and commits it when it flushes them. Resume checks, the retry-401
+    prompt and consolidation read it with indexed queries instead of scanning text files.
+    """
+    def __init__(self, path, store_results=True):
+        self.path = path
+        self.store_results = store_results
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            self._db.execute(statement)
+        self._db.commit()
+
+    # --- Writes (from the job's output writer) ---
+    def record_attempt(self, case_number, attempt, status_code, reason):
+        """Record a failed attempt of a case."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT INTO attempts VALUES (?, ?, ?, ?, ?)",
+                             (case_number, attempt, status_code, reason, now))
+            self._db.execute(
+                "INSERT INTO cases (case_number, status, attempts, status_code, updated) VALUES (?, ?, 1, ?, ?) "
+                "ON CONFLICT(case_number) DO UPDATE SET status = excluded.status, attempts = attempts + 1, "
+                "status_code = excluded.status_code, updated = excluded.updated",
+                (case_number, RETRYING, status_code, now))
+
+    def record_status_code(self, case_number, status_code):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO cases (case_number, status, status_code, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(case_number) DO UPDATE SET status_code = excluded.status_code, updated = excluded.updated",
+                (case_number, FAILED, status_code, time.time()))
+
+    def record_result(self, case_number, success, result=None, error=None):
+        """Record a finished case: its status, the written result (if any) and its error message (if any)."""
+        now = time.time()
+        status = DONE if success else FAILED
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO cases (case_number, status, attempts, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(case_number) DO UPDATE SET status = excluded.status, "
+                "attempts = attempts + excluded.attempts, updated = excluded.updated",
+                (case_number, status, 1 if success else 0, now))
+            if error:
+                self._db.execute("INSERT OR REPLACE INTO errors VALUES (?, ?, ?)", (case_number, error, now))
+            else:
+                self._db.execute("DELETE FROM errors WHERE case_number = ?", (case_number,))
+            if result is not None and self.store_results:
+                self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?)", (case_number, result))
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+    # --- Queries ---
+    def processed_cases(self):
+        with self._lock:
+            rows = self._db.execute("SELECT case_number FROM cases WHERE status IN (?, ?)", (DONE, FAILED))
+            return {row[0] for row in rows}
+
+    def status_counts(self):
+        """Return {status: number of cases}."""
+        with self._lock:
+            return dict(self._db.execute("SELECT status, COUNT(*) FROM cases GROUP BY status").fetchall())
+
+    def cases_with_status_code(self, status_code):
+        """Case numbers whose last response had `status_code` and that did not succeed later (e.g. 401s to retry)."""
+        with self._lock:
+            rows = self._db.execute("SELECT case_number FROM cases WHERE status_code = ? AND status != ?",
+                                    (status_code, DONE))
+            return [row[0] for row in rows]
+
+    def errors(self):
+        """Return {case_number: error message} of the failed cases."""
+        with self._lock:
+            return dict(self._db.execute("SELECT case_number, message FROM errors").fetchall())
+
+    def result(self, case_number):
+        with self._lock:
+            row = self._db.execute("SELECT payload FROM results WHERE case_number = ?", (case_number,)).fetchone()
+            return row[0] if row else None
@@ -0,0 +1,104 @@
+import json
+import sys
+import time
+import config
+
+try:
+    import orjson
+except ImportError:  # Optional: the standard library is used when orjson is not installed.
+    orjson = None
+
+if config.JSON_BACKEND == "stdlib":
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+def loads(data):
+    """Parse a JSON document (str or bytes)."""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # The standard library accepts a few documents orjson rejects (NaN, integers
+            # beyond 64 bits); for anything else it raises the usual json.JSONDecodeError.
+            pass
+    return json.loads(data)
+
+def dumps(obj):
+    """Serialize `obj` as compact JSON text."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(obj, separators=(",", ":"))
+
+def _has_float(obj):
+    if isinstance(obj, float):
+        return True
+    if isinstance(obj, dict):
+        return any(_has_float(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(_has_float(item) for item in obj)
+    return False
+
+def dumps_pretty(obj):
+    """Serialize `obj` exactly like json.dumps(obj, indent=2), using orjson when the result is the same."""
+    # orjson formats some floats differently (1e16 vs. 1e+16, NaN as null).
+    if orjson is not None and not _has_float(obj):
+        try:
+            text = orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode("utf-8")
+            # json.dumps escapes non-ASCII characters (output files are latin-1), orjson does not.
+            if text.isascii():
+                return text
+        except TypeError:
+            pass
+    return json.dumps(obj, indent=2)
+
+class PayloadTemplate:
+    """
+    A request body serialized once, with one string value left open.
+
+    `build(value)` returns the request object for a given value; render(value) returns the
+    same text as json.dumps(build(value)) without serializing the whole object again.
+    """
+    PLACEHOLDER = "\x00PAYLOAD_VALUE\x00"
+
+    def __init__(self, build):
+        text = json.dumps(build(self.PLACEHOLDER))
+        marker = json.dumps(self.PLACEHOLDER)[1:-1]
+        if text.count(marker) != 1:
+            raise ValueError("The payload template must contain the value exactly once.")
+        self.prefix, self.suffix = text.split(marker)
+
+    def render(self, value):
+        return self.prefix + json.dumps(value)[1:-1] + self.suffix
+
+def _benchmark(lines=1_000_000):
+    """Time input parsing and request serialization on a synthetic input, stdlib vs. the active backend."""
+    import processing
+    rows = [json.dumps({"Incidents_IncidentId": str(100000000 + i), "Title": f"Case title {i}",
+                        "Severity": i % 4, "Tags": ["linux", "kernel"], "Owner": "team@example.com"})
+            for i in range(lines)]
+    case_numbers = [str(100000000 + i) for i in range(lines)]
+
+    def timed(label, func):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        print(f"{label:<45} {elapsed:8.2f} s")
+        return elapsed
+
+    print(f"{lines} synthetic input lines; JSON backend: {BACKEND}")
+    stdlib = timed("json.loads (stdlib)", lambda: [json.loads(row) for row in rows])
+    fast = timed(f"json_codec.loads ({BACKEND})", lambda: [loads(row) for row in rows])
+    print(f"{'input parsing speed-up':<45} {stdlib / fast:8.2f} x")
+    stdlib = timed("json.dumps(build_run_model(case))",
+                   lambda: [json.dumps(processing.build_run_model(c)) for c in case_numbers])
+    fast = timed("build_run_model_body(case) (template)",
+                 lambda: [processing.build_run_model_body(c) for c in case_numbers])
+    print(f"{'request body speed-up':<45} {stdlib / fast:8.2f} x")
+
+if __name__ == "__main__":
+    # Micro-benchmark: python json_codec.py [number_of_lines]
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
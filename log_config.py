@@ -1,5 +1,9 @@
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
+import config
 from config import OUTPUT_DIR  # Make sure OUTPUT_DIR is defined in config.py
 
 # Ensure the output directory exists.
@@ -7,18 +11,54 @@ if not os.path.exists(OUTPUT_DIR):
     os.makedirs(OUTPUT_DIR)
 
 # Define the log file path.
-LOG_FILE = os.path.join(OUTPUT_DIR, "app.log")
-
-# Configure the logging.
-logging.basicConfig(
-    #level=logging.DEBUG,  # Set default logging level (adjust as needed)
-    level=logging.INFO,  # Set default logging level (adjust as needed)
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(LOG_FILE, mode="a", encoding="latin-1"),
-        logging.StreamHandler()  # Optional: also output to console
-    ]
-)
+LOG_FILE = os.path.join(OUTPUT_DIR, config.LOG_FILE_NAME)
+
+# Parent of the application's module loggers (see get_logger()).
+APP_LOGGER = "aifuse"
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the logging thread as they are. The standard QueueHandler formats
+    each record in the calling thread; here message formatting, tracebacks and all file and
+    console I/O happen on the logging thread.
+    """
+    def prepare(self, record):
+        return record
+
+def _level(name, fallback=logging.INFO):
+    level = logging.getLevelName(name)
+    return level if isinstance(level, int) else fallback
+
+def _configure():
+    formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
+    file_handler = logging.handlers.RotatingFileHandler(
+        LOG_FILE, mode="a", maxBytes=max(1, config.LOG_MAX_MB) * 1024 * 1024,
+        backupCount=max(0, config.LOG_BACKUPS), encoding="latin-1", errors="backslashreplace")
+    file_handler.setFormatter(formatter)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+    console_handler.setLevel(_level(config.LOG_CONSOLE_LEVEL, logging.WARNING))
+    # Records from every thread go through one queue to a single logging thread.
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler,
+                                              respect_handler_level=True)
+    root = logging.getLogger()
+    root.handlers[:] = [_QueueHandler(log_queue)]
+    root.setLevel(_level(config.LOG_LEVEL))
+    for name, level in config.LOG_LEVELS.items():
+        logging.getLogger(f"{APP_LOGGER}.{name}").setLevel(_level(level))
+    listener.start()
+    # Write out what is still queued when the program exits.
+    atexit.register(listener.stop)
+
+_configure()
+
+def get_logger(name):
+    """
+    The logger of a module (`name` is its __name__). Its level can be set in the
+    [LogLevels] section of config.ini, e.g. "processing = DEBUG".
+    """
+    return logging.getLogger(f"{APP_LOGGER}.{name}")
 
 # Create the logger.
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
@@ -6,12 +6,15 @@ import config
 import auth
 import processing
 import consolidation
+import input_source
 import utils
-from log_config import logger
+from log_config import get_logger
 import curses
 from curses_ui import curses_main
 from win_ui import tk_ui_main
 
+logger = get_logger(__name__)
+
 def validate_config():
     missing = []
     if not config.OUTPUT_DIR:
@@ -50,10 +53,11 @@ def validate_config():
 
 def consolidation_phase():
     print("\nStarting consolidation phase...")
-    original_file = config.ARGS.file
+    job = config.current_job
+    original_file = job.input_file
     original_cases = consolidation.load_original_cases(original_file)
     print(f"Loaded {len(original_cases)} original cases.")
-    error_log = consolidation.load_error_log(job.api_error_log_file)
+    error_log = consolidation.load_job_errors(job)
     print(f"Loaded {len(error_log)} error entries.")
     api_hdr, api_dict = consolidation.load_api_responses(job.api_response_file)
     if api_hdr:
@@ -64,8 +68,8 @@ def consolidation_phase():
         logger.info("No API header found.")
     total_api_rows = sum(len(v) for v in api_dict.values())
     print(f"Loaded {total_api_rows} API response entries.")
-    consolidation.consolidate_data(original_file, original_cases, error_log, api_hdr, api_dict, config.default_consolidated_csv)
-    utils.write_csv_to_excel(config.default_consolidated_csv, config.default_consolidated_excel)
+    consolidation.consolidate_data(original_file, original_cases, error_log, api_hdr, api_dict, job.consolidated_csv)
+    utils.write_csv_to_excel(job.consolidated_csv, job.consolidated_excel)
     print("Consolidation phase complete.")
     logger.info("Data Consolidation Completed.")
 
@@ -73,11 +77,23 @@ def main():
     logger.info("Application started.")
     parser = argparse.ArgumentParser(description="Integrated API processing and consolidation tool")
     parser.add_argument("-f", "--file", default="",
-                        help="Input JSON file with one case per line")
+                        help="Input JSON file with one case per line (.gz/.zst compressed, a directory of such "
+                             "files, or - to read standard input with --no-ui)")
     parser.add_argument("-t", "--threads", type=int, default=0,
                         help="Maximum number of threads for API processing (0 for sequential)")
     parser.add_argument("-b", "--batch", type=int, default=0,
                         help="Batch size for processing (0 means no batching)")
+    parser.add_argument("--engine", choices=["threads", "asyncio"], default="threads",
+                        help="Processing engine: OS threads, or an asyncio event loop for many concurrent requests")
+    parser.add_argument("--max-in-flight", type=int, default=0,
+                        help="Maximum concurrent requests for the asyncio engine (0 uses ASYNC_MAX_IN_FLIGHT from config.ini)")
+    parser.add_argument("--cases-per-request", type=int, default=0,
+                        help="Send this many case numbers in one API request (CSV parsing, threads engine; 0 for one case per request)")
+    cache_group = parser.add_mutually_exclusive_group()
+    cache_group.add_argument("--no-cache", dest="cache_mode", action="store_const", const="off", default="use",
+                             help="Do not read or write the on-disk response cache")
+    cache_group.add_argument("--refresh-cache", dest="cache_mode", action="store_const", const="refresh",
+                             help="Request every case again and update the response cache")
     parser.add_argument("--consolidated-csv", default=config.default_consolidated_csv,
                         help="Output consolidated CSV file")
     parser.add_argument("--consolidated-excel", default=config.default_consolidated_excel,
@@ -97,6 +113,11 @@ def main():
             if not config.ARGS.file:
                 print("No input file provided. Exiting.")
                 sys.exit(1)
+        if config.ARGS.file == input_source.STDIN:
+            if not config.ARGS.no_ui:
+                print("Reading the input from standard input requires --no-ui. Exiting.")
+                sys.exit(1)
+            config.ARGS.file = input_source.spool_stdin()
 
     # Mode selection.
     if config.ARGS.no_ui:
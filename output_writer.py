@@ -0,0 +1,196 @@
+import csv
+import io
+import locale
+import os
+import threading
+import time
+from contextlib import contextmanager
+from queue import Queue, Empty
+from log_config import get_logger
+
+logger = get_logger(__name__)
+
+# Marks the end of the write stream.
+_STOP = object()
+
+def encode_text(text, encoding=None, newline=None):
+    """Encode `text` the way open(path, "a", encoding=encoding, newline=newline).write(text) stores it."""
+    if newline is None and os.linesep != "\n":
+        text = text.replace("\n", os.linesep)
+    return text.encode(encoding or locale.getpreferredencoding(False))
+
+def _describe(op):
+    """A write request's kind and target, for log messages."""
+    kind = op[0]
+    if kind in ("write", "csv"):
+        return f"{kind} to {op[1]}"
+    if kind == "processed":
+        return f"processed record of case {op[1]}"
+    return f"store call {op[1]}"
+
+class OutputWriter:
+    """
+    Per-job write-behind thread that owns every output file of the job.
+
+    Workers hand write requests to a queue and go back to the network; the writer thread
+    appends them through long-lived buffered file handles. Everything a worker submits inside
+    transaction() (a case's output and its "processed" record) is queued as one unit and
+    written without other cases' output in between, which is what the resume journal relies
+    on. The optional job store (job_store.py) is updated through the same queue. The handles,
+    the store and the journal are flushed every `flush_records` processed cases or
+    `flush_interval` seconds, and when the writer is closed (job finished or cancelled).
+    """
+    def __init__(self, journal=None, flush_records=100, flush_interval=0.2, fsync=True,
+                 queue_size=10000, buffer_size=256 * 1024, name="writer", store=None):
+        self.journal = journal
+        self.store = store
+        self.flush_records = max(1, flush_records)
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.buffer_size = buffer_size
+        self.name = name
+        self._queue = Queue(maxsize=max(1, queue_size))
+        self._local = threading.local()
+        self._handles = {}
+        self._dirty = False
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    @contextmanager
+    def transaction(self):
+        """Queue everything submitted by this thread inside the block as one unit."""
+        depth = getattr(self._local, "depth", 0)
+        if depth == 0:
+            self._local.batch = []
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if depth == 0:
+                batch, self._local.batch = self._local.batch, None
+                if batch:
+                    self._queue.put(batch)
+
+    def _submit(self, op):
+        batch = getattr(self._local, "batch", None)
+        if batch is not None:
+            batch.append(op)
+        else:
+            self._queue.put([op])
+
+    def write(self, path, text, encoding=None, newline=None):
+        """Append text to `path`; encoding and newline have the meaning they have for open()."""
+        self._submit(("write", path, encode_text(text, encoding, newline)))
+
+    def write_csv_rows(self, path, rows, encoding=None):
+        """Append CSV rows to `path`, all fields quoted; rows[0] is the header, written only to an empty file."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+        writer.writerow(rows[0])
+        header = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows[1:])
+        self._submit(("csv", path, encode_text(header, encoding, ""), encode_text(buffer.getvalue(), encoding, "")))
+
+    def record_processed(self, case_number):
+        """Mark a case as processed in the resume journal, after the output submitted before it."""
+        self._submit(("processed", case_number))
+
+    def store_call(self, method, *args):
+        """Call a JobStore method from the writer thread, in order with the output; a no-op without a store."""
+        if self.store is not None:
+            self._submit(("store", method, args))
+
+    def _handle(self, path):
+        handle = self._handles.get(path)
+        if handle is None:
+            handle = open(path, "ab", buffering=self.buffer_size)
+            self._handles[path] = handle
+        return handle
+
+    def _position(self, path):
+        handle = self._handles.get(path)
+        if handle is not None:
+            return handle.tell()
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def _apply(self, op):
+        self._dirty = True
+        kind = op[0]
+        if kind == "write":
+            self._handle(op[1]).write(op[2])
+        elif kind == "csv":
+            handle = self._handle(op[1])
+            if handle.tell() == 0:
+                handle.write(op[2])
+            handle.write(op[3])
+        elif kind == "processed":
+            if self.journal is not None:
+                self.journal.record(op[1], {key: self._position(path) for key, path in self.journal.outputs()})
+            self._unflushed += 1
+        elif kind == "store":
+            getattr(self.store, op[1])(*op[2])
+
+    def _run(self):
+        while True:
+            try:
+                batch = self._queue.get(timeout=self.flush_interval)
+            except Empty:
+                batch = None
+            if batch is _STOP:
+                break
+            for i, op in enumerate(batch or ()):
+                try:
+                    self._apply(op)
+                except Exception as e:
+                    # The writer must outlive a failed write (disk full, unencodable data, ...).
+                    # The rest of the unit is dropped: a case whose output failed must not be
+                    # journaled as processed, so resuming requests it again.
+                    dropped = batch[i + 1:]
+                    logger.error(f"{self.name}: {_describe(op)} failed: {e}"
+                                 + (f"; dropped the rest of its unit ({', '.join(map(_describe, dropped))})"
+                                    if dropped else ""))
+                    break
+            if self._dirty and (self._unflushed >= self.flush_records
+                                or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush()
+        self._flush()
+        for handle in self._handles.values():
+            handle.close()
+        self._handles = {}
+
+    def _flush(self):
+        """
+        Flush (and fsync) the output files, commit the store, then commit the journal records
+        that refer to them. A crash in between leaves the store ahead of the journal, never
+        behind: resumed cases are written to it again.
+        """
+        try:
+            for handle in self._handles.values():
+                handle.flush()
+                if self.fsync:
+                    os.fsync(handle.fileno())
+            if self.store is not None:
+                self.store.commit()
+            if self.journal is not None:
+                self.journal.commit()
+        except Exception as e:
+            logger.error(f"{self.name}: could not flush output files: {e}")
+        self._dirty = False
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        """Write everything still queued, flush and close the files, and stop the thread."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
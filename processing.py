@@ -1,35 +1,65 @@
 import os
 import sys
-import threading
+import logging
 import requests
-import json
 import time
 import csv
+import io
 import curses
 import itertools
-import re
-from queue import Queue
-from threading import Semaphore
-from log_config import logger
+import contextlib
+import threading
+import concurrent.futures
+import log_config
+from log_config import get_logger
 import config
-from auth import get_access_token, refresh_token
+import auth
+import http_client
+from worker_pool import WorkerPool, DelayedRetryQueue
+import throttling
+import retry_policy
+import coalescing
+import input_index
+import input_source
+import json_codec
+import response_cache
+import resume_journal
+import output_writer
+import job_store
+import job_log
+import checkpoint
 import utils  # Contains the shared utilities (e.g., check_resume_status)
 
+logger = get_logger(__name__)
+
 # --- Tracking File Functions ---
 def load_processed_cases(job):
-    processed = set()
-    if os.path.exists(job.processed_tracking_file):
-        with open(job.processed_tracking_file, 'r') as f:
-            for line in f:
-                processed.add(line.strip())
-    return processed
+    return resume_journal.read_processed_cases(job.processed_tracking_file)[0]
 
 def update_processed_cases(job, case_number):
+    writer = getattr(job, "output_writer", None)
+    if writer is not None:
+        writer.record_processed(case_number)
+        return
     with job.tracking_file_lock:  # Use lock to ensure thread safety
         with open(job.processed_tracking_file, 'a') as f:
             f.write(str(case_number) + "\n")
 
+def output_transaction(job):
+    """
+    Context in which a case's output is written and the case recorded as processed. The job's
+    output writer writes them as one unit, so the resume journal can tie the two together.
+    """
+    writer = getattr(job, "output_writer", None)
+    return writer.transaction() if writer is not None else contextlib.nullcontext()
+
 def load_401_errors(job):
+    store = job_store.open_store(job)
+    if store is not None:
+        try:
+            return set(store.cases_with_status_code(401))
+        finally:
+            store.close()
     errors = set()
     if os.path.exists(job.api_401_tracking_file):
         with open(job.api_401_tracking_file, 'r') as f:
@@ -40,6 +70,9 @@ def load_401_errors(job):
     return errors
 
 def update_401_error(job, case_number, error_message):
+    writer = getattr(job, "output_writer", None)
+    if writer is not None:
+        writer.store_call("record_status_code", case_number, 401)
     with job.api_401_lock:  # Use lock for thread safety
         with open(job.api_401_tracking_file, 'a') as f:
             f.write(str(case_number) + "\n")
@@ -52,7 +85,7 @@ def clear_401_tracking_file(job):
 
 # --- Curses Prompt for Resume/Start Fresh ---
 def check_resume_option(stdscr, job):
-    status = utils.check_resume_status()
+    status = utils.check_resume_status(job)
     total_input = status["total_input"]
     processed_count = status["processed_count"]
     
@@ -84,9 +117,8 @@ def check_resume_option(stdscr, job):
             stdscr.addstr(3, 0, f"User selected: {'RESUME' if job.resume_mode else 'START FRESH'}.")
             stdscr.refresh()
             time.sleep(2)
-            if job.resume_mode and os.path.exists(job.api_401_tracking_file):
-                with open(job.api_401_tracking_file, 'r') as f:
-                    retry_lines = [line.strip() for line in f if line.strip()]
+            if job.resume_mode:
+                retry_lines = load_401_errors(job)
                 if retry_lines:
                     stdscr.addstr(4, 0, f"There are {len(retry_lines)} cases with persistent 401 errors.")
                     logger.info("Cases with 401 Errors Found.")
@@ -110,11 +142,13 @@ def check_resume_option(stdscr, job):
 
 # --- Logging and Progress Helpers ---
 def append_processing_detail(job, message):
+    """Log a per-case detail; console jobs write it to the log file, not to the console."""
     if job is not None:
-        if not hasattr(job, 'processing_details'):
-            job.processing_details = []
-        job.processing_details.append(message)
-        job.log(message)
+        job.log(message, echo=False)
+        with job.logs_lock:
+            job.case_messages += 1
+        if job.ui is None:
+            logger.info("Job %s: %s", job.job_id[:8], message)
     else:
         with config.details_lock:
             config.processing_details.append(message)
@@ -131,11 +165,23 @@ def clear_output_files(job):
     logger.info("Output files cleared.")
     
 def log_api_error(job, message):
+    writer = getattr(job, "output_writer", None)
+    if writer is not None:
+        writer.write(job.api_error_log_file, f"{message}\n")
+        return
     with job.error_file_lock:  # Make sure this is used
         with open(job.api_error_log_file, 'a') as f:
             f.write(f"{message}\n")
 
 def log_script_error(job, message):
+    if job is None:
+        # Input parsing runs before a job's files are set up.
+        logger.error(message)
+        return
+    writer = getattr(job, "output_writer", None)
+    if writer is not None:
+        writer.write(job.script_error_log_file, f"{message}\n")
+        return
     with job.script_error_lock:  # Make sure this is used
         with open(job.script_error_log_file, 'a') as f:
             f.write(f"{message}\n")
@@ -151,229 +197,125 @@ def update_progress(job):
     # ...
 
 def parse_input_file(file_name):
-    import os, json
-    cases = []
-    _, ext = os.path.splitext(file_name)
+    """
+    Return every valid (case_number, original_line) row of the input file, in file order.
+    Rows are read back through the file's byte-offset index, so the file is scanned once per change.
+    """
     try:
-        with open(file_name, 'r', encoding='latin-1') as file:
-            for line in file:
-                line = line.strip()
-                if not line:
-                    continue
-                if ext.lower() == ".txt":
-                    case_number = line
-                    cases.append((case_number, line))
-                else:
-                    try:
-                        data = json.loads(line)
-                        case_number = data.get("Incidents_IncidentId", "").strip()
-                        if case_number:
-                            cases.append((case_number, line))
-                        else:
-                            log_script_error(None, f"No case number found in line: {line}")
-                    except json.JSONDecodeError as e:
-                        log_script_error(None, f"Invalid JSON format in line: {line}. Error: {e}")
-    except IOError as e:
+        return list(input_index.get_index(file_name).iter_rows())
+    except (IOError, RuntimeError) as e:
         log_script_error(None, f"Error reading file {file_name}: {e}")
-    return cases
+        return []
 
 # --- Revised Error Logging ---
 def log_and_write_error(job, case_number, original_data, error_message):
-    log_api_error(job, error_message)
-    append_processing_detail(job, f"Case {case_number}: Error logged.")
-    update_progress(job)
-    update_processed_cases(job, case_number)
-
-# --- API Call Function (Non-job version remains unchanged) ---
-def call_experiment_api(case_number, original_data):
-    with config.token_lock:
-        token = config.access_token
-    if not token:
-        log_api_error(None, "No access token available.")
-        update_progress(None)
-        return
+    with output_transaction(job):
+        log_api_error(job, error_message)
+        append_processing_detail(job, f"Case {case_number}: Error logged.")
+        update_progress(job)
+        update_processed_cases(job, case_number)
 
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Content-Type': 'application/json',
-        'Accept': 'application/json'
-    }
-    run_model = {
-        "DataSearchOptions": {
-            "Search": case_number,
-            "SearchMode": "any"
-        },
-        "MaxNumberOfRows": 5000
-    }
-    max_retries = 3
-    attempt = 0
-    success = False
-    response = None
-    while attempt < max_retries and not success:
-        try:
-            response = requests.post(f'{config.apiUrl}experiment/{job.experimentId}', headers=headers, data=json.dumps(run_model), timeout=config.API_TIMEOUT)
-            if response.status_code == 200:
-                success = True
-                break
-            elif response.status_code == 401:
-                error_message = f"Error 401: {response.text} for case {case_number}"
-                append_processing_detail(None, f"Case {case_number}: Received 401 error. Retrying in 5 seconds (attempt {attempt+1}/{max_retries}).")
-                time.sleep(5)
-            elif response.status_code == 400:
-                error_message = f"Error 400: {response.text} for case {case_number}"
-                log_and_write_error(None, case_number, original_data, error_message)
-                return
-            elif response.status_code == 429:
-                match = re.search(r"Try again in (\d+) seconds", response.text)
-                wait_time = int(match.group(1)) if match else 60
-                new_wait = wait_time * 2
-                append_processing_detail(None, f"Case {case_number}: Received 429. Retrying in {new_wait} seconds (attempt {attempt+1}/{max_retries}).")
-                time.sleep(new_wait)
-            elif response.status_code in [500, 502]:
-                append_processing_detail(None, f"Case {case_number}: Received {response.status_code}. Retrying in 5 seconds (attempt {attempt+1}/{max_retries}).")
-                time.sleep(5)
-            else:
-                error_message = f"Error {response.status_code}: {response.text} for case {case_number}"
-                log_and_write_error(None, case_number, original_data, error_message)
-                return
-        except requests.exceptions.Timeout as te:
-            append_processing_detail(None, f"Case {case_number}: Timeout occurred: {te}. Retrying in 5 seconds (attempt {attempt+1}/{max_retries}).")
-            time.sleep(5)
-        except Exception as e:
-            append_processing_detail(None, f"Case {case_number}: Exception occurred: {e}. Retrying in 5 seconds (attempt {attempt+1}/{max_retries}).")
-            time.sleep(5)
-        attempt += 1
+# --- Headless (Console/Curses) Processing ---
+def create_headless_job():
+    """
+    Build a Job for the console and curses modes from the command-line arguments.
+    Output files are named with generate_filename() (no job suffix) so that a later run
+    on the same input file and experiment finds them again when resuming.
+    """
+    from config import generate_filename
+    from job_manager import Job
+    file_name = config.ARGS.file
+    experiment_id = config.experimentId
+    job = Job(
+        input_file=file_name,
+        experiment_id=experiment_id,
+        experiment_name=experiment_id,
+        parsing_method="CSV",
+        threads=config.ARGS.threads,
+        batch_size=config.ARGS.batch,
+        engine=getattr(config.ARGS, "engine", "threads"),
+        max_in_flight=getattr(config.ARGS, "max_in_flight", 0),
+        cache_mode=getattr(config.ARGS, "cache_mode", "use"),
+        cases_per_request=getattr(config.ARGS, "cases_per_request", 0)
+    )
+    # Console runs are not saved as jobs: their log goes to the console, not to a job log file.
+    job.logs = job_log.JobLog(None, config.JOB_LOG_MEMORY_ENTRIES)
+    job.processed_tracking_file = generate_filename(file_name, experiment_id, "processed", "txt")
+    job.api_401_tracking_file = generate_filename(file_name, experiment_id, "401", "txt")
+    job.raw_output_file = generate_filename(file_name, experiment_id, "APIResponseRaw", "csv")
+    job.api_response_file = generate_filename(file_name, experiment_id, "APIResponse", "csv")
+    job.api_error_log_file = generate_filename(file_name, experiment_id, "APIError", "log")
+    job.script_error_log_file = generate_filename(file_name, experiment_id, "ScriptError", "log")
+    job.consolidated_csv = config.ARGS.consolidated_csv
+    job.consolidated_excel = config.ARGS.consolidated_excel
+    job.resume_mode = config.resume_mode
+    job.retry_401_flag = config.retry_401_flag
+    return job
 
-    if not success:
-        if response is not None and response.status_code == 401:
-            error_message = f"Error 401: {response.text} for case {case_number} after {max_retries} attempts."
-        elif response is not None:
-            error_message = f"Error {response.status_code}: {response.text} for case {case_number} after {max_retries} attempts."
-        else:
-            error_message = f"Failed to get a successful response for case {case_number} after {max_retries} attempts."
-        log_and_write_error(None, case_number, original_data, error_message)
+def resume_spooled_input(job):
+    """
+    Resume a console job whose input was piped to standard input if an earlier run of the
+    same input stopped part-way: spooled inputs are named after their content, so that run's
+    output files are the job's.
+    """
+    if job.resume_mode or not input_source.is_spooled(job.input_file):
         return
-
-    try:
-        response_content = response.json()
-        content_to_write = (response_content["chatHistory"]["messages"][-1]["content"]).replace("\\n", "\n")
-        if not content_to_write:
-            raise ValueError(f"No content found in API response for case {case_number}.")
-        with open(config.RAW_OUTPUT_FILE, 'a') as file:
-            file.write(content_to_write)
-        csv_reader = csv.reader(content_to_write.splitlines())
-        rows = list(csv_reader)
-        if not rows:
-            raise ValueError(f"No CSV rows found in API response for case {case_number}.")
-        if config.api_header is None:
-            config.api_header = rows[0]
-            with open(config.API_RESPONSE_FILE, 'a', newline='') as file:
-                writer = csv.writer(file, quoting=csv.QUOTE_ALL)
-                writer.writerow(config.api_header)
-        with open(config.API_RESPONSE_FILE, 'a', newline='') as file:
-            writer = csv.writer(file, quoting=csv.QUOTE_ALL)
-            for row in rows[1:]:
-                writer.writerow(row)
-        append_processing_detail(None, f"Output written for case {case_number}.")
-        update_progress(None)
-        update_processed_cases(None, case_number)
-    except Exception as e:
-        log_and_write_error(None, case_number, original_data, f"Exception while processing case {case_number}: {e}")
-
-# --- Batch Processing ---
-def process_batch(batch):
-    for case_number, original_data in batch:
-        call_experiment_api(case_number, original_data)
+    status = utils.check_resume_status(job)
+    if status["resume_possible"]:
+        job.resume_mode = True
+        job.log(f"Standard input matches an earlier run: resuming after its "
+                f"{status['processed_count']} of {status['total_input']} processed cases.")
 
 # --- Main Processing Loop (Non-job mode) ---
-def processing_main():
-    from config import generate_filename
-    config.PROCESSED_TRACKING_FILE = generate_filename(config.ARGS.file, config.experimentId, "processed", "txt")
-    config.API_401_ERROR_TRACKING_FILE = generate_filename(config.ARGS.file, config.experimentId, "401", "txt")
-
-    if not config.resume_mode:
-        if os.path.exists(config.PROCESSED_TRACKING_FILE):
-            os.remove(config.PROCESSED_TRACKING_FILE)
-        clear_output_files(None)
-        clear_401_tracking_file(None)
-    else:
-        append_processing_detail(None, "Resuming processing using previous outputs.")
-
-    file_name = config.ARGS.file
-    use_threading = config.ARGS.threads > 0
-    max_threads = config.ARGS.threads if use_threading else None
-    batching = config.ARGS.batch > 0
-    batch_size = config.ARGS.batch if batching else None
-
-    cases = parse_input_file(file_name)
-    if config.resume_mode:
-        processed = load_processed_cases(None)
-        cases = [case for case in cases if case[0] not in processed]
-        if config.retry_401_flag:
-            with open(config.API_401_ERROR_TRACKING_FILE, 'r') as f:
-                retry_cases_set = set(line.strip() for line in f if line.strip())
-            all_cases = parse_input_file(file_name)
-            retry_cases = [case for case in all_cases if case[0] in retry_cases_set]
-            cases = retry_cases + cases
-    if not cases:
-        print("No valid cases found or all cases have been processed in the input file.")
-        sys.exit(1)
-
-    config.total_cases = len(cases)
-    config.cases_processed = 0
-
-    stop_event = threading.Event()
-    token_thread = threading.Thread(target=refresh_token, args=(stop_event,), daemon=True)
-    token_thread.start()
-
-    while config.access_token is None:
-        time.sleep(1)
-
-    if use_threading and batching:
-        total_batches = (len(cases) + batch_size - 1) // batch_size
-        #append_processing_detail(None, f"Processing {len(cases)} cases in {total_batches} batches of size {batch_size}.")
-        append_processing_detail(None,f"Processing {len(cases)} cases using {max_threads} threads with efficient grouping " +
-                f"(group size: {batch_size}, {total_batches} groups)")
-        # This mode creates one thread per group of cases, rather than one thread per case
-        # Each case still gets its own API call, but thread management is more efficient
-        q = Queue()
-        for i in range(0, len(cases), batch_size):
-            q.put(cases[i:i + batch_size])
-        sem = Semaphore(max_threads)
-        thread_list = []
-        while not q.empty():
-            batch_group = q.get()
-            sem.acquire()
-            t = threading.Thread(target=lambda b=batch_group: (process_batch(b), sem.release()))
-            thread_list.append(t)
-            t.start()
-        for t in thread_list:
-            t.join()
-    elif use_threading:
-        sem = Semaphore(max_threads)
-        thread_list = []
-        append_processing_detail(None, f"Processing {len(cases)} cases with individual threads max of {max_threads} threads.")
-        for case_number, original_data in cases:
-            sem.acquire()
-            t = threading.Thread(target=lambda c=case_number, d=original_data: (call_experiment_api(c, d), sem.release()))
-            thread_list.append(t)
-            t.start()
-        for t in thread_list:
-            t.join()
-    elif batching:
-        total_batches = (len(cases) + batch_size - 1) // batch_size
-        append_processing_detail(None, f"Processing {len(cases)} cases in {total_batches} sequential groups " +  f"(group size: {batch_size})")
-        for i in range(0, len(cases), batch_size):
-            process_batch(cases[i:i + batch_size])
-    else:
-        append_processing_detail(None, f"Processing {len(cases)} cases in sequential mode.")
-        for case_number, original_data in cases:
-            call_experiment_api(case_number, original_data)
+def processing_main(job=None):
+    """
+    Run the processing phase for the console and curses modes.
+    Headless runs go through the same job pipeline as the Tkinter UI; the job is kept
+    in config.current_job so the consolidation phase can find its output files.
+    """
+    if job is None:
+        job = create_headless_job()
+        # No Tkinter tab to show the log in: echo it to the console instead.
+        job.ui = None
+        resume_spooled_input(job)
+    config.current_job = job
+    status = None
+    if job.ui is None:
+        stop_status = threading.Event()
+        status = threading.Thread(target=print_status_lines, args=(job, stop_status, config.STATUS_INTERVAL_SECONDS),
+                                  name="status-line", daemon=True)
+        status.start()
+    try:
+        processing_main_job(job)
+    finally:
+        if status is not None:
+            stop_status.set()
+            status.join()
+    return job
 
-    append_processing_detail(None, "Processing complete.")
-    print("Processing complete.")
-    stop_event.set()
-    token_thread.join()
+def print_status_lines(job, stop_event, interval):
+    """
+    Print one status line for a console job every `interval` seconds (and once when
+    `stop_event` is set): progress, throughput and the per-case messages since the last line.
+    """
+    last_done, last_messages, last_time = job.progress_done, job.case_messages, time.monotonic()
+    while True:
+        stopped = stop_event.wait(max(1, interval))
+        now = time.monotonic()
+        done, messages = job.progress_done, job.case_messages
+        if stopped and done == last_done and messages == last_messages:
+            return
+        line = (f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {done}/{job.progress_total} cases processed, "
+                f"{(done - last_done) / max(now - last_time, 1e-9):.1f} cases/s")
+        retry_queue = getattr(job, "retry_queue", None)
+        if retry_queue is not None and len(retry_queue):
+            line += f", {len(retry_queue)} parked for retry"
+        if messages > last_messages:
+            line += f", {messages - last_messages} case messages (see {os.path.basename(log_config.LOG_FILE)})"
+        print(line, flush=True)
+        last_done, last_messages, last_time = done, messages, now
+        if stopped:
+            return
 
 # --- Job-Specific Processing Loop ---
 def processing_main_job(job):
@@ -385,7 +327,6 @@ def processing_main_job(job):
         
     # ——— ISOLATE PER-JOB STATE ———
     job.api_header = None
-    job.processing_details = []
     # Redirect global file paths to the job's own paths:
     config.PROCESSED_TRACKING_FILE   = job.processed_tracking_file
     config.API_401_ERROR_TRACKING_FILE = job.api_401_tracking_file
@@ -396,6 +337,7 @@ def processing_main_job(job):
     if not job.resume_mode:
         if os.path.exists(job.processed_tracking_file):
             os.remove(job.processed_tracking_file)
+        checkpoint.remove_checkpoint(job)
         for file_path in [job.raw_output_file, job.api_response_file, job.api_error_log_file, job.script_error_log_file, job.api_401_tracking_file]:
             with open(file_path, 'w') as f:
                 f.write("")
@@ -409,97 +351,327 @@ def processing_main_job(job):
     batching = job.batch_size > 0
     batch_size = job.batch_size if batching else None
 
-    cases = parse_input_file(file_name)
-    if job.resume_mode:
-        processed = load_processed_cases(job)
-        remaining_cases = [case for case in cases if case[0] not in processed]
+    try:
+        index = input_index.cached_index(file_name)
+        # A new input is scanned while its first cases are already being requested. That
+        # needs a fresh CSV run: resuming needs the processed counts up front, and JSON/TXT
+        # output needs every case's duplicate rows before its result is written.
+        if index is None and (job.resume_mode or job.parsing_method.upper() != "CSV"):
+            index = input_index.get_index(file_name)
+    except (IOError, RuntimeError) as e:
+        log_script_error(None, f"Error reading file {file_name}: {e}")
+        job.log(f"Could not read input file {file_name}: {e}")
+        return
+    job.duplicate_rows = {}
+    if index is not None:
+        report_input_index(job, index)
+    # Finished cases are journaled in processed_tracking_file; resuming also rolls back
+    # output written after the last journaled case.
+    job.journal = resume_journal.ResumeJournal(job, config.JOURNAL_FSYNC)
+    processed = set()
+    retry_cases = set()
+    start_row = 0
+    if index is None:
+        # The totals grow as the scan finds cases.
+        job.progress_total = 0
+        job.progress_done = 0
+        job.initial_total = 0
+        remaining = None
+    elif job.resume_mode:
+        processed = job.journal.load()
+        # Every case before the last checkpoint's cursor is done: start reading the input there.
+        start_row = checkpoint.load_cursor(job, index)
+        if start_row:
+            job.log(f"Resuming from the last checkpoint: skipping the first {start_row} input rows.")
         # Preserve original total: if not already stored, save it now.
         if not hasattr(job, "initial_total") or job.initial_total == 0:
-            job.initial_total = len(cases)
+            job.initial_total = index.unique_count
         job.progress_total = job.initial_total
-        # Do not reset progress_done; it should reflect already processed cases.
-        cases = remaining_cases
+        remaining = index.unique_count - sum(1 for case_number in processed if case_number in index.first_row)
+        if job.retry_401_flag:
+            # Cases that kept failing with 401 are requested again first, even if already processed.
+            retry_cases = {case_number for case_number in load_401_errors(job) if case_number in index.first_row}
+            remaining += len(retry_cases & processed)
+            if retry_cases:
+                job.log(f"Retrying {len(retry_cases)} cases with 401 errors first.")
+        # The journal, not the (possibly stale) saved state, says how many cases are done.
+        job.progress_done = index.unique_count - remaining
     else:
-        job.progress_total = len(cases)
+        job.progress_total = index.unique_count
         job.progress_done = 0
-        job.initial_total = len(cases)
-        
-    if not cases:
+        job.initial_total = index.unique_count
+        remaining = index.unique_count
+
+    if remaining == 0:
         job.log("No valid cases found or all cases have been processed in the input file.")
         return
-    
-    stop_event = threading.Event()
-    token_thread = threading.Thread(target=refresh_token, args=(stop_event,), daemon=True)
-    token_thread.start()
+    cases_label = f"{remaining} cases" if remaining is not None else "the cases of the input while indexing it"
 
-    while config.access_token is None:
-        if job.cancel_event.is_set():
-            job.log("Job cancelled while waiting for token.")
-            stop_event.set()
-            token_thread.join()
-            return
-        time.sleep(1)
-
-    if use_threading and batching:
-        total_batches = (len(cases) + batch_size - 1) // batch_size
-        job.log(f"Processing {len(cases)} cases in {total_batches} batches of size {batch_size} using {max_threads} threads in parallel.")
-        q = Queue()
-        for i in range(0, len(cases), batch_size):
-            q.put(cases[i:i + batch_size])
-        sem = Semaphore(max_threads)
-        thread_list = []
-        while not q.empty():
-            if job.cancel_event.is_set():
-                job.log("Job cancellation requested during batching.")
-                break
-            batch_group = q.get()
-            sem.acquire()
-            t = threading.Thread(target=lambda b=batch_group: (process_batch_job(job, b), sem.release()))
-            thread_list.append(t)
-            t.start()
-        for t in thread_list:
-            t.join()
+    # The token is shared by every job and renewed in the background before it expires.
+    try:
+        auth.get_token()
+    except Exception as e:
+        job.log(f"Could not acquire an access token: {e}")
+        return
+    auth.start_background_refresh()
+    if job.cancel_event.is_set():
+        job.log("Job cancelled while waiting for token.")
+        return
+
+    use_asyncio = getattr(job, "engine", "threads") == "asyncio"
+    if use_asyncio:
+        import async_processing
+        if not async_processing.is_available():
+            job.log("The asyncio engine requires the 'aiohttp' package; falling back to the threading engine.")
+            use_asyncio = False
+    max_in_flight = job.max_in_flight or config.ASYNC_MAX_IN_FLIGHT
+
+    # Multi-case mode: one API request per group of cases (CSV parsing only).
+    cases_per_request = job.cases_per_request if job.cases_per_request > 1 else 0
+    if cases_per_request and job.parsing_method.upper() != "CSV":
+        job.log("Multi-case requests need CSV parsing; sending one request per case.")
+        cases_per_request = 0
+    if cases_per_request and use_asyncio:
+        job.log("Multi-case requests are not supported on the asyncio engine; sending one request per case.")
+        cases_per_request = 0
+
+    # Failed attempts wait here for their retry instead of holding a worker.
+    job.retry_queue = DelayedRetryQueue()
+    job.retry_policy = retry_policy.get_retry_policy(job.experiment_id)
+    job.retry_budget = job.retry_policy.new_budget()
+    job.log(f"Retry policy: {job.retry_policy.describe()}.")
+    # Adaptive concurrency starts at the configured threads / in-flight count. In threading
+    # mode the pool gets enough workers for the limiter to grow up to MAX_CONCURRENCY.
+    job.concurrency_limiter = None
+    pool_size = max_threads
+    # The request rate limit is shared with every other job calling the same experiment.
+    job.rate_limiter = throttling.get_rate_limiter(job.experiment_id)
+    if job.rate_limiter.rate > 0:
+        job.log(f"Rate limit for this experiment: {job.rate_limiter.rate:g} requests/s (shared by all jobs).")
+    if use_asyncio:
+        job.concurrency_limiter = create_concurrency_limiter(job, max_in_flight, max_in_flight)
     elif use_threading:
-        sem = Semaphore(max_threads)
-        thread_list = []
-        job.log(f"Processing {len(cases)} cases in threading mode with a maximum of {max_threads} threads.")
-        for case_number, original_data in cases:
-            if job.cancel_event.is_set():
-                job.log("Job cancellation requested during threading mode.")
-                break
-            sem.acquire()
-            t = threading.Thread(target=lambda c=case_number, d=original_data: (call_experiment_api_job(job, c, d), sem.release()))
-            thread_list.append(t)
-            t.start()
-        for t in thread_list:
-            t.join()
-    elif batching:
-        total_batches = (len(cases) + batch_size - 1) // batch_size
-        job.log(f"Processing {len(cases)} cases in {total_batches} batches of size {batch_size}.")
-        for i in range(0, len(cases), batch_size):
-            if job.cancel_event.is_set():
-                job.log("Job cancellation requested during batching sequential mode.")
-                break
-            process_batch_job(job, cases[i:i + batch_size])
+        job.concurrency_limiter = create_concurrency_limiter(job, max_threads, max(max_threads, config.MAX_CONCURRENCY))
+        if job.concurrency_limiter is not None:
+            pool_size = job.concurrency_limiter.max_limit
+
+    if not use_asyncio:
+        # One pooled connection per worker thread, opened before the first case.
+        http_client.get_session(pool_size or 1)
+        http_client.warm_up(max_threads or 1)
+
+    # Latencies feed the hedging threshold and the p50/p99 report at the end of the job.
+    job.latencies = throttling.LatencyTracker()
+    job.hedger = None
+    job.hedge_executor = None
+    if config.HEDGING:
+        job.hedger = throttling.RequestHedger(job.latencies, config.HEDGE_PERCENTILE,
+                                              config.HEDGE_MAX_PERCENT / 100.0, config.HEDGE_MIN_SAMPLES)
+        if not use_asyncio:
+            # Both requests of a hedge run here while the worker waits for the first answer.
+            job.hedge_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=2 * (pool_size or 1) + 2, thread_name_prefix=f"hedge-{job.job_id[:8]}")
+        job.log(f"Request hedging enabled: requests slower than p{config.HEDGE_PERCENTILE:g} are hedged "
+                f"(at most {config.HEDGE_MAX_PERCENT:g}% of requests).")
+
+    # Successful responses are cached on disk so a re-run does not request them again.
+    job.response_cache = response_cache.get_response_cache() if job.cache_mode != "off" else None
+    job.cache_hits = 0
+    job.cache_misses = 0
+    if job.response_cache is not None and job.cache_mode == "refresh":
+        job.log("Refreshing the response cache: every case is requested again.")
+
+    # The circuit breaker is shared with every other job calling the same experiment.
+    breaker_listener = attach_circuit_breaker(job)
+    # Optional per-job SQLite store of case status, attempts, errors and results.
+    job.job_store = None
+    if config.JOB_STORE:
+        if not job.resume_mode:
+            job_store.remove_store(job)
+        job.job_store = job_store.JobStore(job_store.store_path(job), config.JOB_STORE_RESULTS)
+    # All output files are written by one write-behind thread, so workers never wait on disk.
+    job.output_writer = output_writer.OutputWriter(
+        job.journal, config.JOURNAL_FLUSH_RECORDS, config.JOURNAL_FLUSH_INTERVAL_MS / 1000.0, config.JOURNAL_FSYNC,
+        queue_size=config.WRITE_QUEUE_SIZE, buffer_size=config.WRITE_BUFFER_KB * 1024,
+        name=f"writer-{job.job_id[:8]}", store=job.job_store)
+    job.output_writer.start()
+    # The cursor follows the journal commits; the checkpointer saves it (and the job state) periodically.
+    job.input_cursor = checkpoint.InputCursor(start_row)
+    job.input_fingerprint = index.fingerprint if index is not None else input_source.fingerprint(file_name)
+    job.journal.cursor = job.input_cursor
+    checkpoint.register(job)
+    # Cases are read from the input lazily, one at a time, as the engines ask for them.
+    if index is None:
+        cases = iter_scanned_cases(job, file_name, job.input_cursor)
     else:
-        job.log(f"Processing {len(cases)} cases in sequential mode.")
-        for case_number, original_data in cases:
+        cases = iter_pending_cases(index, processed, start_row, job.input_cursor, retry_cases)
+    try:
+        if use_asyncio:
+            job.log(f"Processing {cases_label} on the asyncio engine with up to {max_in_flight} requests in flight.")
+            async_processing.run_job_async(job, cases, min(max_in_flight, remaining if remaining is not None else max_in_flight))
+        elif use_threading:
+            # A fixed pool of worker threads fed from a bounded queue. With grouping enabled,
+            # workers take dynamic groups of up to batch_size cases from the queue.
+            items = cases
+            if cases_per_request:
+                job.log(f"Processing {cases_label} using {max_threads} pooled threads, {cases_per_request} cases per request.")
+                items = iter_groups(cases, cases_per_request)
+            elif batching:
+                job.log(f"Processing {cases_label} using {max_threads} pooled threads in groups of up to {batch_size} cases.")
+            else:
+                job.log(f"Processing {cases_label} in threading mode with a pool of {max_threads} threads.")
+            pool = WorkerPool(pool_size,
+                              lambda item: dispatch_item(job, item),
+                              chunk_size=1 if cases_per_request else batch_size or 1,
+                              cancel_event=job.cancel_event,
+                              name=f"job-{job.job_id[:8]}",
+                              retry_queue=job.retry_queue)
+            pool.run(items)
             if job.cancel_event.is_set():
-                job.log("Job cancellation requested in sequential mode.")
-                break
-            call_experiment_api_job(job, case_number, original_data)
+                job.log("Job cancellation requested during threading mode.")
+        elif cases_per_request:
+            job.log(f"Processing {cases_label} sequentially, {cases_per_request} cases per request.")
+            for group in iter_groups(cases, cases_per_request):
+                if job.cancel_event.is_set():
+                    job.log("Job cancellation requested in multi-case mode.")
+                    break
+                run_due_retries(job)
+                call_experiment_api_batch(job, group)
+            drain_retries(job)
+        elif batching:
+            if remaining is not None:
+                total_batches = (remaining + batch_size - 1) // batch_size
+                job.log(f"Processing {remaining} cases in {total_batches} batches of size {batch_size}.")
+            else:
+                job.log(f"Processing {cases_label} in batches of size {batch_size}.")
+            for batch in iter_groups(cases, batch_size):
+                if job.cancel_event.is_set():
+                    job.log("Job cancellation requested during batching sequential mode.")
+                    break
+                run_due_retries(job)
+                process_batch_job(job, batch)
+            drain_retries(job)
+        else:
+            job.log(f"Processing {cases_label} in sequential mode.")
+            for case_number, original_data in cases:
+                if job.cancel_event.is_set():
+                    job.log("Job cancellation requested in sequential mode.")
+                    break
+                run_due_retries(job)
+                call_experiment_api_job(job, case_number, original_data)
+            drain_retries(job)
+    finally:
+        # Releases the input file if the job stopped before reading all of it.
+        cases.close()
+        # Writes everything still queued and flushes it, also after a cancel.
+        job.output_writer.close()
+        job.output_writer = None
+        job.journal = None
+        checkpoint.unregister(job)
+        job.input_cursor = None
+        if job.job_store is not None:
+            job.job_store.close()
+            job.job_store = None
+        if breaker_listener is not None:
+            job.circuit_breaker.remove_listener(breaker_listener)
+        # Jobs waiting on a request this job never finished send their own.
+        coalescing.in_flight.release_owner(job)
+        if job.hedge_executor is not None:
+            job.hedge_executor.shutdown(wait=False)
 
+    p50 = job.latencies.percentile(50)
+    if p50 is not None:
+        job.log(f"Request latency: p50 {p50:.2f} s, p99 {job.latencies.percentile(99):.2f} s "
+                f"over {job.latencies.count} successful requests.")
+    if job.hedger is not None:
+        job.log(f"Hedged requests: {job.hedger.hedges} of {job.hedger.requests} eligible "
+                f"({job.hedger.hedge_wins} answered first).")
+
+    if job.response_cache is not None:
+        try:
+            job.response_cache.flush()
+        except Exception as e:
+            logger.warning(f"Could not write the response cache: {e}")
+        if job.cache_mode == "use":
+            job.log(f"Response cache: {job.cache_hits} hits, {job.cache_misses} misses.")
     job.log("Processing complete.")
+    try:
+        job.logs.flush()
+    except OSError as e:
+        logger.error(f"Could not write the log of job {job.job_id[:8]}: {e}")
     print("Processing complete.")
-    stop_event.set()
-    token_thread.join()
+
+def iter_pending_cases(index, processed=(), start=0, cursor=None, retry=()):
+    """
+    Yield (case_number, original_line) for each case of the input from index row `start` on
+    that is not in `processed`, reading each line from the input file only when it is asked
+    for. Each case is reported to `cursor` (a checkpoint.InputCursor) as it is dispatched.
+    The cases in `retry` (e.g. 401 errors to retry) come first, wherever they are in the input.
+    """
+    if retry:
+        retry_rows = index.selected_cases(retry)
+        try:
+            for _, case_number, original_data in retry_rows:
+                yield case_number, original_data
+        finally:
+            retry_rows.close()
+        processed = set(processed) | set(retry)
+    rows = index.pending_cases(processed, start)
+    try:
+        for row, case_number, original_data in rows:
+            if cursor is not None:
+                cursor.dispatched(row, case_number)
+            yield case_number, original_data
+    finally:
+        rows.close()
+
+def iter_scanned_cases(job, file_name, cursor=None):
+    """
+    Yield (case_number, original_line) for the first row of each case of an input that has
+    no index yet, while the input is scanned for it; job.progress_total grows with the cases
+    found. Once the scan completes, the index is reported like that of an indexed input.
+    """
+    scan = input_index.scan_input(file_name)
+    try:
+        for row, case_number, original_data, is_first in scan:
+            if not is_first:
+                continue
+            with job.progress_lock:
+                job.progress_total += 1
+                job.initial_total = job.progress_total
+            if cursor is not None:
+                cursor.dispatched(row, case_number)
+            yield case_number, original_data
+    finally:
+        scan.close()
+    report_input_index(job, input_index.get_index(file_name))
+
+def report_input_index(job, index):
+    """Log the input's duplicate rows and keep them for write_case_result() (invalid lines are logged by the index scan)."""
+    # Duplicate rows share the result of their case: in CSV mode consolidation writes the
+    # case's API rows for every input row, in JSON/TXT mode write_case_result() does.
+    job.duplicate_rows = index.duplicate_rows()
+    if job.duplicate_rows:
+        extra_rows = index.duplicate_count
+        total_rows = index.unique_count + extra_rows
+        job.log(f"Found {extra_rows} duplicate rows for {len(job.duplicate_rows)} cases: "
+                f"sending {index.unique_count} requests instead of {total_rows} ({extra_rows / total_rows:.0%} fewer).")
+
+def iter_groups(items, size):
+    """Yield lists of up to `size` consecutive items, consuming `items` lazily."""
+    items = iter(items)
+    while True:
+        group = list(itertools.islice(items, size))
+        if not group:
+            return
+        yield group
 
 def process_batch_job(job, batch):
     """Process a group of cases sequentially.
     
     This function processes each case in the group with its own individual API call.
-    The grouping is for thread management efficiency, not for sending multiple cases
-    in a single API call.
+    The grouping is for thread management efficiency; see call_experiment_api_batch()
+    for sending multiple cases in a single API call.
     """
     for case_number, original_data in batch:
         if job.cancel_event.is_set():
@@ -507,174 +679,688 @@ def process_batch_job(job, batch):
             break
         call_experiment_api_job(job, case_number, original_data)
 
-def call_experiment_api_job(job, case_number, original_data):
-    if job.cancel_event.is_set():
-        job.log(f"Skipping case {case_number} due to cancellation.")
-        return
-
-    with config.token_lock:
-        token = config.access_token
-    if not token:
-        job.log("No access token available.")
-        update_progress(job)
-        update_processed_cases(job, case_number)
-        return
-
-    headers = {
+# --- API Request/Response Helpers (shared by the threading and asyncio engines) ---
+def build_api_headers(token):
+    return {
         'Authorization': f'Bearer {token}',
         'Content-Type': 'application/json',
         'Accept': 'application/json'
     }
-    run_model = {
+
+def _case_filter(case_numbers):
+    if isinstance(case_numbers, str):
+        case_numbers = [case_numbers]
+    case_filter = " or ".join(f"CaseNumber eq '{case_number}'" for case_number in case_numbers)
+    return f"(IsEUSchrems eq false) and ({case_filter})"
+
+# Rows the API returns at most for one request; a multi-case response this long may be cut off.
+MAX_NUMBER_OF_ROWS = 5000
+
+def _run_model_with_filter(search_filter):
+    return {
         "DataSearchOptions": {
             "Search": "",
             "SearchMode": "any",
-            "Filter": f"(IsEUSchrems eq false) and (CaseNumber eq '{case_number}')"
+            "Filter": search_filter
         },
-        "MaxNumberOfRows": 5000
+        "MaxNumberOfRows": MAX_NUMBER_OF_ROWS
     }
+
+def build_run_model(case_numbers):
+    """Build the request body for one case number, or for a list of them (multi-case mode)."""
+    return _run_model_with_filter(_case_filter(case_numbers))
+
+# The request body is serialized once; only the case filter is filled in per request.
+_RUN_MODEL_TEMPLATE = json_codec.PayloadTemplate(_run_model_with_filter)
+
+def build_run_model_body(case_numbers):
+    """The serialized request body, identical to json.dumps(build_run_model(case_numbers))."""
+    return _RUN_MODEL_TEMPLATE.render(_case_filter(case_numbers))
+
+def build_failure_message(job, case_number, status_code, response_text, attempts):
+    """Build the error message for a case that is given up on after `attempts` attempts (and track 401s)."""
+    if status_code == 401:
+        error_message = f"Error 401: {response_text} for case {case_number} after {attempts} attempts."
+        update_401_error(job, case_number, error_message)
+    elif status_code is not None:
+        error_message = f"Error {status_code}: {response_text} for case {case_number} after {attempts} attempts."
+    else:
+        error_message = f"Failed to get a successful response for case {case_number} after {attempts} attempts."
+    return error_message
+
+def extract_api_content(job, response_content, case_number):
+    """Return the text to write for a successful API response, according to the job's parsing method."""
+    if job.parsing_method.upper() == "JSON":
+        content_to_write = json_codec.dumps_pretty(response_content)
+    else:
+        # Check if the expected keys exist
+        if ("chatHistory" in response_content and 
+            "messages" in response_content["chatHistory"] and 
+            len(response_content["chatHistory"]["messages"]) > 0):
+            # Use the last message's content
+            content_raw = response_content["chatHistory"]["messages"][-1].get("content")
+            if content_raw is None:
+                raise ValueError("Expected 'content' key is missing in the last message.")
+            content_to_write = content_raw.replace("\\n", "\n")
+        else:
+            raise ValueError("The API response does not contain the expected chatHistory/messages structure.")
+    
+    if not content_to_write:
+        raise ValueError(f"No content found in API response for case {case_number}.")
+    return content_to_write
+
+def create_concurrency_limiter(job, initial, max_limit):
+    """Create the job's adaptive concurrency limiter, or None if ADAPTIVE_CONCURRENCY is off."""
+    if not config.ADAPTIVE_CONCURRENCY:
+        return None
+
+    def on_change(old_limit, new_limit, reason):
+        message = f"Adaptive concurrency: limit changed from {old_limit} to {new_limit} ({reason})."
+        append_processing_detail(job, message)
+        logger.info(f"Job {job.job_id[:8]}: {message}")
+
+    limiter = throttling.AdaptiveConcurrencyLimiter(
+        initial=initial,
+        min_limit=min(config.MIN_CONCURRENCY, initial),
+        max_limit=max_limit,
+        latency_tolerance=config.LATENCY_TOLERANCE,
+        on_change=on_change
+    )
+    job.log(f"Adaptive concurrency enabled: limit {limiter.limit} (bounds {limiter.min_limit}-{limiter.max_limit}).")
+    return limiter
+
+def send_api_request(job, session, url, headers, body, record_latency=True):
+    """
+    POST one API request once the experiment's circuit breaker and shared rate limiter allow
+    it, holding a slot of the job's concurrency limiter (if any) while it is in flight.
+    The response's rate-limit headers, outcome and latency are reported back to the limiters
+    (and, with `record_latency`, a successful request's latency to the job's latency tracker).
+    Returns None if the job is cancelled while waiting.
+    """
+    breaker = getattr(job, "circuit_breaker", None)
+    admission = None
+    if breaker is not None:
+        admission = breaker.acquire(job.cancel_event)
+        if admission is None:
+            return None
+    outcome = throttling.CANCELLED
+    try:
+        rate_limiter = getattr(job, "rate_limiter", None)
+        if rate_limiter is not None and not rate_limiter.acquire(job.cancel_event):
+            return None
+        limiter = getattr(job, "concurrency_limiter", None)
+        if limiter is not None and not limiter.acquire(job.cancel_event):
+            return None
+        started = time.monotonic()
+        outcome = throttling.CONNECTION_ERROR
+        try:
+            response = session.post(url, headers=headers, data=body, timeout=config.API_TIMEOUT)
+            outcome = throttling.classify_status(response.status_code)
+            if rate_limiter is not None:
+                rate_limiter.observe_headers(response.headers, response.status_code)
+            return response
+        except requests.exceptions.Timeout:
+            outcome = throttling.TIMEOUT
+            raise
+        finally:
+            latency = time.monotonic() - started
+            if limiter is not None:
+                limiter.release(outcome, latency)
+            if record_latency and outcome == throttling.SUCCESS and getattr(job, "latencies", None) is not None:
+                job.latencies.record(latency)
+    finally:
+        if breaker is not None:
+            breaker.release(outcome, admission)
+
+def send_hedged_request(job, session, url, headers, body):
+    """
+    Send one API request through send_api_request(). With hedging on, a request that has not
+    answered within the job's hedge delay gets a second, identical request and the first
+    successful response wins. A blocking request cannot be aborted, so the losing
+    response is closed as soon as it arrives. Only the winner's latency, measured from the
+    original request, goes to the job's latency tracker.
+    """
+    hedger = getattr(job, "hedger", None)
+    delay = hedger.delay() if hedger is not None else None
+    if delay is None:
+        return send_api_request(job, session, url, headers, body)
+    hedger.record_request()
+    started = time.monotonic()
+    primary = job.hedge_executor.submit(send_api_request, job, session, url, headers, body, False)
+    done, _ = concurrent.futures.wait([primary], timeout=delay)
+    if done or job.cancel_event.is_set() or not hedger.try_hedge():
+        response = primary.result()
+        if response is not None and throttling.classify_status(response.status_code) == throttling.SUCCESS:
+            job.latencies.record(time.monotonic() - started)
+        return response
+    hedge = job.hedge_executor.submit(send_api_request, job, session, url, headers, body, False)
+    pending = {primary, hedge}
+    winner = None
+    while pending and winner is None:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in (primary, hedge):
+            if future in done and winner is None and _is_successful(future):
+                winner = future
+                job.latencies.record(time.monotonic() - started)
+    for loser in pending:
+        loser.add_done_callback(_close_losing_response)
+    if winner is None:
+        # Neither request succeeded: report the original request's outcome.
+        return primary.result()
+    if winner is hedge:
+        hedger.record_win()
+    return winner.result()
+
+def _is_successful(future):
+    return future.exception() is None and future.result() is not None and future.result().status_code == 200
+
+def _close_losing_response(future):
+    if future.exception() is None and future.result() is not None:
+        future.result().close()
+
+def attach_circuit_breaker(job):
+    """
+    Attach the experiment's shared circuit breaker to the job and log its state changes.
+    Returns the listener to detach when the job ends, or None if CIRCUIT_BREAKER is off.
+    """
+    job.circuit_breaker = throttling.get_circuit_breaker(job.experiment_id)
+    if job.circuit_breaker is None:
+        return None
+
+    def on_change(old_state, new_state, reason):
+        if new_state == throttling.OPEN:
+            message = (f"Circuit breaker open ({reason}): holding dispatch for "
+                       f"{job.circuit_breaker.open_seconds:g} seconds; cases are not marked failed.")
+        elif new_state == throttling.HALF_OPEN:
+            message = f"Circuit breaker half-open: {reason} with {job.circuit_breaker.probe_requests} request(s)."
+        else:
+            message = f"Circuit breaker closed ({reason}): resuming at full speed."
+        job.log(message)
+        logger.info(f"Job {job.job_id[:8]}: {message}")
+
+    job.circuit_breaker.add_listener(on_change)
+    if job.circuit_breaker.state != throttling.CLOSED:
+        job.log(f"Circuit breaker for this experiment is {job.circuit_breaker.state}; dispatch is on hold.")
+    return on_change
+
+def held_by_circuit_breaker(job, status_code=None):
+    """
+    True if a failed attempt should not count against its case because the backend is
+    failing and the circuit breaker is holding dispatch (5xx, timeouts and connection errors).
+    """
+    breaker = getattr(job, "circuit_breaker", None)
+    return (breaker is not None and breaker.state != throttling.CLOSED
+            and (status_code is None or status_code >= 500))
+
+def fresh_token_after_401(job, stale_token):
+    """Refresh the shared token after a 401 (one refresh for all workers) and return the token to retry with."""
+    try:
+        return auth.refresh_after_401(stale_token)
+    except Exception as e:
+        job.log(f"Could not refresh the access token: {e}")
+        return stale_token
+
+def plan_retry(job, case_number, attempt, previous_delay, reason,
+               status_code=None, headers=None, response_text=None, record_attempt=True):
+    """
+    Decide whether a failed attempt (`attempt` attempts made so far) is retried, and after
+    how many seconds, using the job's retry policy and retry budget. Logs the decision.
+    Returns the delay, or None if the case should fail now.
+    """
+    writer = getattr(job, "output_writer", None)
+    if reason is not None and record_attempt and writer is not None:
+        writer.store_call("record_attempt", case_number, attempt, status_code, reason)
+    if reason is None or attempt >= job.retry_policy.max_attempts:
+        return None
+    if not job.retry_budget.try_spend():
+        append_processing_detail(job, f"Case {case_number}: {reason}. Not retrying: the job's retry budget is exhausted.")
+        return None
+    delay = job.retry_policy.delay_for(previous_delay, status_code, headers, response_text)
+    append_processing_detail(job, f"Case {case_number}: {reason}. Retrying in {delay:.1f} seconds (attempt {attempt}/{job.retry_policy.max_attempts}).")
+    return delay
+
+# Returned by request_case() when a retry has been parked; the case is not finished yet.
+PARKED = object()
+
+def schedule_retry(job, case_number, original_data, attempt, delay, lookup=True):
+    """
+    Park a case for another attempt after `delay` seconds so the worker can move on.
+    Returns False if the job has no retry queue, in which case the caller waits in place.
+    """
+    retry_queue = getattr(job, "retry_queue", None)
+    if retry_queue is None:
+        return False
+    retry_queue.park((case_number, original_data, attempt, delay, lookup), delay)
+    return True
+
+def schedule_group_retry(job, group, attempt, delay):
+    """Park a multi-case request for another attempt after `delay` seconds (see schedule_retry())."""
+    retry_queue = getattr(job, "retry_queue", None)
+    if retry_queue is None:
+        return False
+    retry_queue.park((group, attempt, delay), delay)
+    return True
+
+def run_due_retries(job):
+    """Sequential modes: run every parked retry that is due now."""
+    while not job.cancel_event.is_set():
+        item = job.retry_queue.pop_due()
+        if item is None:
+            break
+        dispatch_item(job, item)
+
+def drain_retries(job):
+    """Sequential modes: after the last case, wait for and run the remaining parked retries."""
+    while len(job.retry_queue) and not job.cancel_event.is_set():
+        job.retry_queue.wait(job.cancel_event)
+        run_due_retries(job)
+
+def call_experiment_api_job(job, case_number, original_data, attempt=0, previous_delay=None, lookup=True):
+    """
+    Call the experiment API for one case, starting at attempt number `attempt`.
+    A fresh response from the response cache is used if there is one; otherwise, if another
+    job is already requesting the same case from the same experiment, its response is reused
+    instead of sending a second request. `lookup=False` skips both (the caller has already
+    looked the case up, e.g. a case missing from a multi-case response).
+    """
+    key = (job.experiment_id, case_number)
+    if attempt == 0 and lookup:
+        if use_cached_response(job, case_number, original_data):
+            return
+        shared, is_owner = coalescing.in_flight.claim(key, job)
+        if not is_owner and wait_for_shared_request(job, case_number, original_data, shared):
+            return
+    result = request_case(job, case_number, original_data, attempt, previous_delay)
+    if result is not PARKED:
+        coalescing.in_flight.finish(key, job, result)
+        if result is not None:
+            store_cached_response(job, case_number, result[1])
+
+def response_cache_key(job, case_number):
+    return response_cache.ResponseCache.make_key(
+        job.experiment_id, case_number, build_run_model_body(case_number))
+
+def use_cached_response(job, case_number, original_data):
+    """
+    Write the case's result from the response cache if the job reads the cache and holds a
+    fresh entry for it. Returns True if the case was served from the cache.
+    """
+    cache = getattr(job, "response_cache", None)
+    if cache is None or job.cache_mode != "use" or job.cancel_event.is_set():
+        return False
+    try:
+        response_text = cache.get(response_cache_key(job, case_number))
+    except Exception as e:
+        logger.warning(f"Response cache lookup failed for case {case_number}: {e}")
+        response_text = None
+    with job.progress_lock:
+        if response_text is None:
+            job.cache_misses += 1
+        else:
+            job.cache_hits += 1
+    if response_text is None:
+        return False
+    write_api_response(job, case_number, original_data, response_text)
+    return True
+
+def store_cached_response(job, case_number, response_text):
+    """Save a successful response in the response cache (unless the job runs with --no-cache)."""
+    cache = getattr(job, "response_cache", None)
+    if cache is None or job.cache_mode == "off":
+        return
+    try:
+        cache.put(response_cache_key(job, case_number), job.experiment_id, case_number, response_text)
+    except Exception as e:
+        logger.warning(f"Could not cache the response for case {case_number}: {e}")
+
+def wait_for_shared_request(job, case_number, original_data, shared):
+    """
+    Wait for another job's identical request and write its response as this job's result.
+    Returns False if that request did not succeed, in which case the caller sends its own.
+    """
+    append_processing_detail(job, f"Case {case_number}: waiting for the identical request of another job.")
+    while not shared.done.wait(0.5):
+        if job.cancel_event.is_set():
+            append_processing_detail(job, f"Job cancelled during API call for case {case_number}.")
+            return True
+    if shared.result is None:
+        return False
+    write_api_response(job, case_number, original_data, shared.result[1])
+    return True
+
+def write_api_response(job, case_number, original_data, response_text):
+    """Extract the content of a successful API response and write it as the case's result."""
+    content_to_write = None
+    error_message = None
+    try:
+        content_to_write = extract_api_content(job, json_codec.loads(response_text), case_number)
+    except Exception as e:
+        error_message = f"Exception while processing case {case_number}: {e}"
+        job.log(error_message)
+        log_api_error(job, error_message)
+    write_case_result(job, case_number, original_data, True, content_to_write, error_message)
+
+def request_case(job, case_number, original_data, attempt=0, previous_delay=None):
+    """
+    Send the API request for one case, starting at attempt number `attempt`, and write the result.
+    Retryable failures are parked on the job's retry queue (see schedule_retry) and
+    re-dispatched when due, so the calling worker is free to take the next case.
+    The job's retry policy decides whether and when to retry.
+    Returns (status_code, response_text) on success, PARKED if a retry was parked, else None.
+    """
+    if job.cancel_event.is_set():
+        job.log(f"Skipping case {case_number} due to cancellation.")
+        return None
+
+    try:
+        token = auth.get_token()
+    except Exception as e:
+        logger.error(f"Could not acquire an access token: {e}")
+        token = None
+    if not token:
+        job.log("No access token available.")
+        update_progress(job)
+        update_processed_cases(job, case_number)
+        return None
+
+    body = build_run_model_body(case_number)
     
-    max_retries = 3
-    attempt = 0
+    session = http_client.get_session()
+    policy = job.retry_policy
+    max_attempts = policy.max_attempts
     success = False
     response = None
     error_message = None
     content_to_write = None
+    if attempt == 0:
+        job.retry_budget.record_request()
 
-    while attempt < max_retries and not success:
+    while attempt < max_attempts and not success:
         if job.cancel_event.is_set():
-            job.log(f"Job cancelled during API call for case {case_number}.")
-            return
+            append_processing_detail(job, f"Job cancelled during API call for case {case_number}.")
+            return None
+        retry_reason = None
         try:
-            response = requests.post(
+            response = send_hedged_request(
+                job, session,
                 f'{config.apiUrl}experiment/{job.experiment_id}',
-                headers=headers, data=json.dumps(run_model),
-                timeout=config.API_TIMEOUT
+                build_api_headers(token), body
             )
-            logger.debug(f"Raw API response for case {case_number} (attempt {attempt+1}): {response.text}")            
+            if response is None:
+                append_processing_detail(job, f"Job cancelled during API call for case {case_number}.")
+                return None
+            if logger.isEnabledFor(logging.DEBUG):
+                # response.text decodes the whole body: only when the debug log is on.
+                logger.debug("Raw API response for case %s (attempt %d): %s", case_number, attempt + 1, response.text)
             if response.status_code == 200:
                 success = True
                 break
-            elif response.status_code == 401:
-                job.log(f"Case {case_number}: Received 401 error. Retrying in 5 seconds (attempt {attempt+1}/{max_retries}).")
-                time.sleep(5)
-            elif response.status_code == 400:
-                error_message = f"Error 400: {response.text} for case {case_number}"
-                break
-            elif response.status_code == 429:
-                match = re.search(r"Try again in (\d+) seconds", response.text)
-                wait_time = int(match.group(1)) if match else 60
-                new_wait = wait_time * 2
-                job.log(f"Case {case_number}: Received 429. Retrying in {new_wait} seconds (attempt {attempt+1}/{max_retries}).")
-                time.sleep(new_wait)
-            elif response.status_code in [500, 502]:
-                job.log(f"Case {case_number}: Received {response.status_code}. Retrying in 5 seconds (attempt {attempt+1}/{max_retries}).")
-                time.sleep(5)
+            elif policy.is_retryable(response.status_code):
+                retry_reason = f"Received {response.status_code}"
+                if response.status_code == 401:
+                    token = fresh_token_after_401(job, token)
             else:
                 error_message = f"Error {response.status_code}: {response.text} for case {case_number}"
                 break
         except requests.exceptions.Timeout as te:
-            job.log(f"Case {case_number}: Timeout occurred: {te}. Retrying in 5 seconds (attempt {attempt+1}/{max_retries}).")
-            time.sleep(5)
+            response = None
+            retry_reason = f"Timeout occurred: {te}"
         except Exception as e:
-            job.log(f"Case {case_number}: Exception occurred: {e}. Retrying in 5 seconds (attempt {attempt+1}/{max_retries}).")
-            time.sleep(5)
+            response = None
+            retry_reason = f"Exception occurred: {e}"
+        if retry_reason is not None and held_by_circuit_breaker(job, response.status_code if response is not None else None):
+            # The next attempt waits for the breaker and does not use up the case's attempts.
+            append_processing_detail(job, f"Case {case_number}: {retry_reason}. Held until the circuit breaker closes.")
+            continue
         attempt += 1
+        if response is not None:
+            delay = plan_retry(job, case_number, attempt, previous_delay, retry_reason,
+                               response.status_code, response.headers, response.text)
+        else:
+            delay = plan_retry(job, case_number, attempt, previous_delay, retry_reason)
+        if delay is None:
+            break
+        previous_delay = delay
+        if schedule_retry(job, case_number, original_data, attempt, delay):
+            return PARKED
+        time.sleep(delay)
 
     if not success:
         if not error_message:
-            if response is not None and response.status_code == 401:
-                error_message = f"Error 401: {response.text} for case {case_number} after {max_retries} attempts."
-                update_401_error(job, case_number, error_message)
-            elif response is not None:
-                error_message = f"Error {response.status_code}: {response.text} for case {case_number} after {max_retries} attempts."
-            else:
-                error_message = f"Failed to get a successful response for case {case_number} after {max_retries} attempts."
+            status_code = response.status_code if response is not None else None
+            response_text = response.text if response is not None else None
+            error_message = build_failure_message(job, case_number, status_code, response_text, attempt)
         log_api_error(job, error_message)
+        write_case_result(job, case_number, original_data, success, content_to_write, error_message)
+        return None
+    write_api_response(job, case_number, original_data, response.text)
+    return response.status_code, response.text
+
+# --- Multi-Case Requests (CSV parsing) ---
+def dispatch_item(job, item):
+    """
+    Worker entry point: a list is a group of cases for one multi-case request, a tuple a
+    single case or a parked retry (of a group, if its first item is the group's list).
+    """
+    if isinstance(item, list):
+        call_experiment_api_batch(job, item)
+    elif isinstance(item[0], list):
+        call_experiment_api_batch(job, *item)
     else:
+        call_experiment_api_job(job, *item)
+
+def call_experiment_api_batch(job, group, attempt=0, previous_delay=None):
+    """
+    Request a group of cases with one API call, starting at attempt number `attempt`, split
+    the returned CSV rows by their "Case Number" column and write each case's result.
+    Retries are parked on the job's retry queue like those of single cases. Cases missing
+    from the response (or the whole group, if the call fails) fall back to single-case requests.
+    """
+    if attempt == 0:
+        group = [(case_number, original_data) for case_number, original_data in group
+                 if not use_cached_response(job, case_number, original_data)]
+    if not group or job.cancel_event.is_set():
+        return
+    if len(group) == 1 and attempt == 0:
+        call_experiment_api_job(job, *group[0], lookup=False)
+        return
+    case_numbers = [case_number for case_number, _ in group]
+    label = f"{case_numbers[0]} (+{len(case_numbers) - 1} more)"
+    response_text = request_multi_case(job, group, label, attempt, previous_delay)
+    if response_text is PARKED or job.cancel_event.is_set():
+        return
+    rows_by_case = {}
+    if response_text is not None:
+        try:
+            content = extract_api_content(job, json_codec.loads(response_text), label)
+            rows_by_case, truncated = split_rows_by_case(content, case_numbers, MAX_NUMBER_OF_ROWS)
+            if truncated:
+                append_processing_detail(job, f"Case {label}: the multi-case response reached the "
+                                              f"{MAX_NUMBER_OF_ROWS}-row limit and may be cut off.")
+        except Exception as e:
+            append_processing_detail(job, f"Case {label}: could not split the multi-case response: {e}")
+    missing = []
+    for case_number, original_data in group:
+        if case_number in rows_by_case:
+            write_case_result(job, case_number, original_data, True, rows_by_case[case_number], None)
+        else:
+            missing.append((case_number, original_data))
+    if missing:
+        job.log(f"{len(missing)} of {len(group)} cases missing from the multi-case response for {label}; "
+                "requesting them individually.")
+        for case_number, original_data in missing:
+            if not schedule_retry(job, case_number, original_data, 0, 0, lookup=False):
+                call_experiment_api_job(job, case_number, original_data, lookup=False)
+
+def request_multi_case(job, group, label, attempt=0, previous_delay=None):
+    """
+    Send one request for the (case_number, original_data) pairs of `group`, starting at
+    attempt number `attempt`. Retryable failures are parked on the job's retry queue (see
+    schedule_group_retry()) so the worker can move on.
+    Returns the response text of a successful call, PARKED if a retry was parked, else None.
+    """
+    session = http_client.get_session()
+    policy = job.retry_policy
+    case_numbers = [case_number for case_number, _ in group]
+    body = build_run_model_body(case_numbers)
+    if attempt == 0:
+        job.retry_budget.record_request()
+    while attempt < policy.max_attempts and not job.cancel_event.is_set():
         try:
-            response_content = response.json()
-            if job.parsing_method.upper() == "JSON":
-                content_to_write = json.dumps(response_content, indent=2)
+            token = auth.get_token()
+        except Exception as e:
+            append_processing_detail(job, f"Case {label}: no access token available: {e}")
+            return None
+        retry_reason = None
+        try:
+            response = send_hedged_request(
+                job, session,
+                f'{config.apiUrl}experiment/{job.experiment_id}',
+                build_api_headers(token), body
+            )
+            if response is None:
+                return None
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Raw API response for cases %s (attempt %d): %s",
+                             ", ".join(case_numbers), attempt + 1, response.text)
+            if response.status_code == 200:
+                return response.text
+            elif policy.is_retryable(response.status_code):
+                retry_reason = f"Received {response.status_code}"
+                if response.status_code == 401:
+                    fresh_token_after_401(job, token)
             else:
-                # Check if the expected keys exist
-                if ("chatHistory" in response_content and 
-                    "messages" in response_content["chatHistory"] and 
-                    len(response_content["chatHistory"]["messages"]) > 0):
-                    # Use the last message's content
-                    content_raw = response_content["chatHistory"]["messages"][-1].get("content")
-                    if content_raw is None:
-                        raise ValueError("Expected 'content' key is missing in the last message.")
-                    content_to_write = content_raw.replace("\\n", "\n")
-                else:
-                    raise ValueError("The API response does not contain the expected chatHistory/messages structure.")
-            
-            if not content_to_write:
-                raise ValueError(f"No content found in API response for case {case_number}.")
+                append_processing_detail(job, f"Case {label}: Error {response.status_code} for the multi-case request.")
+                return None
+        except requests.exceptions.Timeout as te:
+            response = None
+            retry_reason = f"Timeout occurred: {te}"
         except Exception as e:
-            error_message = f"Exception while processing case {case_number}: {e}"
-            job.log(error_message)
-            log_api_error(job, error_message)
-#        try:
-#            response_content = response.json()
-#            if job.parsing_method.upper() == "JSON":
-#                content_to_write = json.dumps(response_content, indent=2)
-#            else:
-#                content_to_write = (response_content["chatHistory"]["messages"][-1]["content"]).replace("\\n", "\n")
-#            if not content_to_write:
-#                raise ValueError(f"No content found in API response for case {case_number}.")
-#        except Exception as e:
-#            error_message = f"Exception while processing case {case_number}: {e}"
-#            job.log(error_message)
-#            log_api_error(job, error_message)
+            response = None
+            retry_reason = f"Exception occurred: {e}"
+        if held_by_circuit_breaker(job, response.status_code if response is not None else None):
+            append_processing_detail(job, f"Case {label}: {retry_reason}. Held until the circuit breaker closes.")
+            continue
+        attempt += 1
+        if response is not None:
+            delay = plan_retry(job, label, attempt, previous_delay, retry_reason,
+                               response.status_code, response.headers, response.text, record_attempt=False)
+        else:
+            delay = plan_retry(job, label, attempt, previous_delay, retry_reason, record_attempt=False)
+        if delay is None:
+            return None
+        previous_delay = delay
+        if schedule_group_retry(job, group, attempt, delay):
+            return PARKED
+        job.cancel_event.wait(delay)
+    return None
+
+def split_rows_by_case(content, case_numbers, max_rows=None):
+    """
+    Split CSV content returned for several cases into one CSV text (header plus rows) per case,
+    using the "Case Number" column. Cases without rows are left out.
+
+    A response with `max_rows` rows or more was cut off at the API's row limit: the last case
+    in it may be incomplete, so it is left out as well. Returns ({case: csv text}, truncated).
+    """
+    rows = list(csv.reader(content.splitlines()))
+    if not rows:
+        return {}, False
+    header = rows[0]
+    columns = [column.strip().lower() for column in header]
+    if "case number" not in columns:
+        raise ValueError('The response has no "Case Number" column.')
+    case_column = columns.index("case number")
+    wanted = set(case_numbers)
+    rows_by_case = {}
+    last_case = None
+    for row in rows[1:]:
+        if len(row) > case_column and row[case_column].strip() in wanted:
+            last_case = row[case_column].strip()
+            rows_by_case.setdefault(last_case, []).append(row)
+    truncated = max_rows is not None and len(rows) - 1 >= max_rows
+    if truncated:
+        rows_by_case.pop(last_case, None)
+    contents = {}
+    for case_number, case_rows in rows_by_case.items():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(header)
+        writer.writerows(case_rows)
+        contents[case_number] = buffer.getvalue()
+    return contents, truncated
 
+def write_case_result(job, case_number, original_data, success, content_to_write, error_message):
+    """Write a finished case to the job's output files and mark it as processed."""
+    with output_transaction(job):
+        _write_case_output(job, case_number, original_data, success, content_to_write, error_message)
+        writer = getattr(job, "output_writer", None)
+        if writer is not None:
+            writer.store_call("record_result", case_number, success and not error_message,
+                              content_to_write, error_message)
+        update_progress(job)
+        update_processed_cases(job, case_number)
+
+def _write_case_output(job, case_number, original_data, success, content_to_write, error_message):
+    # Duplicate input rows of the case get the same result.
+    original_lines = [original_data] + getattr(job, "duplicate_rows", {}).get(case_number, [])
     if job.parsing_method.upper() == "JSON":
         from consolidation import consolidate_case_txt
-        consolidate_case_txt(
-            job=job,
-            case_number=case_number,
-            original_line=original_data,
-            api_output=content_to_write,
-            error_message=error_message
-        )
+        for original_line in original_lines:
+            consolidate_case_txt(
+                job=job,
+                case_number=case_number,
+                original_line=original_line,
+                api_output=content_to_write,
+                error_message=error_message
+            )
         if success and content_to_write:
-            job.log(f"Output written for case {case_number}.")    
+            append_processing_detail(job, f"Output written for case {case_number}.")    
     elif job.parsing_method.upper() == "TXT":
         from consolidation import consolidate_case_txt
-        consolidate_case_txt(
-            job=job,
-            case_number=case_number,
-            original_line=original_data,
-            api_output=content_to_write,
-            error_message=error_message
-        )
+        for original_line in original_lines:
+            consolidate_case_txt(
+                job=job,
+                case_number=case_number,
+                original_line=original_line,
+                api_output=content_to_write,
+                error_message=error_message
+            )
         if success and content_to_write:
-            job.log(f"Output written for case {case_number}.")
+            append_processing_detail(job, f"Output written for case {case_number}.")
     elif success and job.parsing_method.upper() == "CSV":
         try:
-            with open(job.raw_output_file, 'a') as file:
-                file.write(content_to_write)
             csv_reader = csv.reader(content_to_write.splitlines())
             rows = list(csv_reader)
-            if not rows:
-                raise ValueError(f"No CSV rows found in API response for case {case_number}.")
-            if not os.path.exists(job.api_response_file) or os.stat(job.api_response_file).st_size == 0:
+            writer = getattr(job, "output_writer", None)
+            if writer is not None:
+                writer.write(job.raw_output_file, content_to_write)
+                if not rows:
+                    raise ValueError(f"No CSV rows found in API response for case {case_number}.")
+                writer.write_csv_rows(job.api_response_file, rows)
+            else:
+                with open(job.raw_output_file, 'a') as file:
+                    file.write(content_to_write)
+                if not rows:
+                    raise ValueError(f"No CSV rows found in API response for case {case_number}.")
+                if not os.path.exists(job.api_response_file) or os.stat(job.api_response_file).st_size == 0:
+                    with open(job.api_response_file, 'a', newline='') as file:
+                        writer = csv.writer(file, quoting=csv.QUOTE_ALL)
+                        writer.writerow(rows[0])
                 with open(job.api_response_file, 'a', newline='') as file:
                     writer = csv.writer(file, quoting=csv.QUOTE_ALL)
-                    writer.writerow(rows[0])
-            with open(job.api_response_file, 'a', newline='') as file:
-                writer = csv.writer(file, quoting=csv.QUOTE_ALL)
-                for row in rows[1:]:
-                    writer.writerow(row)
-            job.log(f"Output written for case {case_number}.")
+                    for row in rows[1:]:
+                        writer.writerow(row)
+            append_processing_detail(job, f"Output written for case {case_number}.")
         except Exception as e:
             job.log(f"Exception while processing case {case_number}: {e}")
             log_script_error(job, str(e))
 
-    update_progress(job)
-    update_processed_cases(job, case_number)
-
 def write_raw_output(job, case_number, data):
+    writer = getattr(job, "output_writer", None)
+    if writer is not None:
+        writer.write(job.raw_output_file, f"Case {case_number}:\n{data}\n\n", encoding='utf-8')
+        return
     with job.raw_output_lock:
         with open(job.raw_output_file, 'a', encoding='utf-8') as f:
             f.write(f"Case {case_number}:\n")
@@ -0,0 +1,152 @@
+import atexit
+import hashlib
+import sqlite3
+import threading
+import time
+import config
+from log_config import get_logger
+
+logger = get_logger(__name__)
+
+class ResponseCache:
+    """
+    Persistent cache of successful API responses, keyed by a hash of the experiment ID,
+    the case number and the request payload. Entries older than `ttl_seconds` are not
+    served, and the least recently used entries are evicted once the cached responses
+    exceed `max_bytes`. One instance is shared by all jobs in the process.
+
+    The total size of the cached responses is kept in the one-row `meta` table, updated in
+    the same transaction as the responses. Writes (and the last-used times of cache hits)
+    are committed together every `FLUSH_ROWS` writes or `FLUSH_SECONDS`, and by flush().
+    """
+    FLUSH_ROWS = 200
+    FLUSH_SECONDS = 1.0
+    EVICT_BATCH = 256
+
+    def __init__(self, path, ttl_seconds, max_bytes):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._touched = {}         # key -> last used time of cache hits not written yet
+        self._pending = 0          # writes since the last commit
+        self._first_pending = 0.0  # time of the oldest of them
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, experiment_id TEXT, case_number TEXT, response_text TEXT, "
+            "size INTEGER, created REAL, last_used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 0), total_size INTEGER NOT NULL)")
+        if self._db.execute("SELECT 1 FROM meta").fetchone() is None:
+            # A cache written before the meta table existed: add up its entries once.
+            self._db.execute("INSERT INTO meta SELECT 0, COALESCE(SUM(size), 0) FROM responses")
+        self._db.commit()
+
+    @staticmethod
+    def make_key(experiment_id, case_number, payload):
+        payload_hash = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{experiment_id}\n{case_number}\n{payload_hash}".encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached response text for `key`, or None if it is missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT response_text, created, size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl_seconds:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.execute("UPDATE meta SET total_size = total_size - ?", (row[2],))
+                self._touched.pop(key, None)
+                self._wrote(now)
+                return None
+            self._touched[key] = now
+            self._wrote(now)
+            return row[0]
+
+    def put(self, key, experiment_id, case_number, response_text):
+        """Store a response, evicting least recently used entries beyond the size cap."""
+        now = time.time()
+        size = len(response_text.encode("utf-8"))
+        with self._lock:
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, experiment_id, case_number, response_text, size, now, now)
+            )
+            self._touched.pop(key, None)
+            self._db.execute("UPDATE meta SET total_size = total_size + ?", (size - (old[0] if old else 0),))
+            total = self._db.execute("SELECT total_size FROM meta").fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(total)
+            self._wrote(now)
+
+    def _evict(self, total):
+        # Eviction goes by last use, so write the pending last-used times first.
+        self._write_touched()
+        evicted = 0
+        while total > self.max_bytes:
+            batch = self._db.execute(
+                "SELECT key, size FROM responses ORDER BY last_used LIMIT ?", (self.EVICT_BATCH,)).fetchall()
+            if not batch:
+                break
+            victims = []
+            for old_key, old_size in batch:
+                if total <= self.max_bytes:
+                    break
+                victims.append((old_key,))
+                total -= old_size
+            self._db.executemany("DELETE FROM responses WHERE key = ?", victims)
+            evicted += len(victims)
+        self._db.execute("UPDATE meta SET total_size = ?", (max(0, total),))
+        logger.info(f"Response cache: evicted {evicted} least recently used entries.")
+
+    def _write_touched(self):
+        if self._touched:
+            self._db.executemany("UPDATE responses SET last_used = ? WHERE key = ?",
+                                 [(used, key) for key, used in self._touched.items()])
+            self._touched.clear()
+
+    def _wrote(self, now):
+        """Count one write and commit the batch once it is large or old enough."""
+        if self._pending == 0:
+            self._first_pending = now
+        self._pending += 1
+        if self._pending >= self.FLUSH_ROWS or now - self._first_pending >= self.FLUSH_SECONDS:
+            self._commit()
+
+    def _commit(self):
+        self._write_touched()
+        self._db.commit()
+        self._pending = 0
+
+    def flush(self):
+        """Commit the pending writes and last-used times."""
+        with self._lock:
+            if self._pending:
+                self._commit()
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """Return the process-wide response cache, or None if RESPONSE_CACHE is off or it cannot be opened."""
+    global _cache
+    if not config.RESPONSE_CACHE:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = ResponseCache(
+                    config.RESPONSE_CACHE_FILE,
+                    ttl_seconds=config.RESPONSE_CACHE_TTL_HOURS * 3600,
+                    max_bytes=config.RESPONSE_CACHE_MAX_MB * 1024 * 1024
+                )
+                atexit.register(_cache.flush)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not open response cache {config.RESPONSE_CACHE_FILE}: {e}")
+                return None
+        return _cache
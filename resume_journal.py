@@ -0,0 +1,126 @@
+import os
+from log_config import get_logger
+
+logger = get_logger(__name__)
+
+# Output files whose size is journaled with each case, by the short key used in the journal.
+JOURNALED_OUTPUTS = {
+    "raw": "raw_output_file",
+    "csv": "api_response_file",
+    "txt": "consolidated_txt",
+}
+
+def _parse_line(line):
+    """
+    Parse one journal line: "<case>" (a processed case, as in older tracking files) or
+    "<case>\\traw=<bytes> csv=<bytes> ..." (a processed case and the sizes of the output
+    files right after its output was written). Returns (case_number, sizes or None).
+    """
+    case_number, sep, rest = line.rstrip("\n").partition("\t")
+    sizes = None
+    if sep:
+        try:
+            sizes = {key: int(value) for key, value in (item.split("=", 1) for item in rest.split())}
+        except ValueError:
+            sizes = None
+    return case_number.strip(), sizes
+
+def read_processed_cases(path):
+    """Return (set of processed case numbers, output sizes of the last record that has them)."""
+    processed = set()
+    last_sizes = None
+    if not os.path.exists(path):
+        return processed, last_sizes
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                # A record torn by a crash was never committed.
+                break
+            case_number, sizes = _parse_line(line)
+            if case_number:
+                processed.add(case_number)
+                if sizes is not None:
+                    last_sizes = sizes
+    return processed, last_sizes
+
+class ResumeJournal:
+    """
+    Append-only record of the cases a job has finished, kept in the job's processed_tracking_file.
+
+    A case's output and its journal record form one unit: the job's OutputWriter writes a
+    case's output and then records the case together with the sizes of the output files at
+    that moment. Records are buffered until commit(), which the writer calls after flushing
+    (and fsyncing) the output files. On load, output written after the last committed record
+    (a crash between writing a case and committing it) is cut off, so resuming does not
+    duplicate rows; those cases are simply processed again.
+    """
+    def __init__(self, job, fsync=True):
+        self.job = job
+        self.path = job.processed_tracking_file
+        self.fsync = fsync
+        # Optional checkpoint.InputCursor told about each commit.
+        self.cursor = None
+        self._pending = []
+        self._pending_cases = []
+
+    def outputs(self):
+        """(key, path) of the job's journaled output files."""
+        return [(key, getattr(self.job, attr, "")) for key, attr in JOURNALED_OUTPUTS.items()
+                if getattr(self.job, attr, "")]
+
+    def load(self):
+        """
+        Return the set of processed case numbers. Output written after the last committed
+        record is truncated, and the journal is compacted to one line per case.
+        """
+        processed, last_sizes = read_processed_cases(self.path)
+        if last_sizes:
+            for key, path in self.outputs():
+                size = last_sizes.get(key)
+                if size is not None and os.path.exists(path) and os.path.getsize(path) > size:
+                    with open(path, "r+b") as f:
+                        f.truncate(size)
+                    logger.info(f"Removed output written after the last journaled case from {path}.")
+        if processed:
+            self._compact(processed)
+        elif os.path.exists(self.path):
+            # Nothing committed (at most a torn record): start from an empty journal.
+            os.remove(self.path)
+        return processed
+
+    def _compact(self, processed):
+        tmp_file = self.path + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            cases = sorted(processed)
+            for case_number in cases[:-1]:
+                f.write(case_number + "\n")
+            f.write(self._format(cases[-1], self._current_sizes()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.path)
+
+    def _current_sizes(self):
+        return {key: os.path.getsize(path) if os.path.exists(path) else 0 for key, path in self.outputs()}
+
+    @staticmethod
+    def _format(case_number, sizes):
+        return f"{case_number}\t" + " ".join(f"{key}={size}" for key, size in sizes.items()) + "\n"
+
+    def record(self, case_number, sizes=None):
+        """Buffer a record for a finished case; `sizes` defaults to the current sizes of the output files."""
+        self._pending.append(self._format(str(case_number), sizes if sizes is not None else self._current_sizes()))
+        self._pending_cases.append(str(case_number))
+
+    def commit(self):
+        """Append the buffered records to the journal (and fsync it)."""
+        if not self._pending:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(self._pending)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        if self.cursor is not None:
+            self.cursor.committed(self._pending_cases)
+        self._pending = []
+        self._pending_cases = []
@@ -0,0 +1,150 @@
+import random
+import re
+import threading
+import config
+from throttling import parse_retry_after
+from log_config import get_logger
+
+logger = get_logger(__name__)
+
+# Status codes worth another attempt; anything else (e.g. 400) fails the case immediately.
+RETRYABLE_STATUSES = (401, 429, 500, 502, 503, 504)
+
+def server_retry_after(headers=None, response_text=None):
+    """
+    Seconds the server asked us to wait: the Retry-After header if present, otherwise the
+    "Try again in N seconds" hint in the 429 body. None if the server gave no hint.
+    """
+    if headers:
+        seconds = parse_retry_after(headers.get("Retry-After"))
+        if seconds is not None:
+            return seconds
+    match = re.search(r"Try again in (\d+) seconds", response_text or "")
+    return float(match.group(1)) if match else None
+
+class RetryPolicy:
+    """
+    Decorrelated-jitter exponential backoff ("decorrelated" in config.ini).
+
+    Each delay is drawn uniformly from [base_delay, 3 x previous delay], capped at
+    max_delay, so retries from many workers spread out instead of arriving together.
+    A server Retry-After always wins, plus a little jitter.
+    """
+    name = "decorrelated"
+
+    def __init__(self, max_attempts=3, base_delay=1.0, max_delay=60.0, budget=0.1, min_retries=10):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self.budget = float(budget)
+        self.min_retries = int(min_retries)
+
+    def is_retryable(self, status_code):
+        return status_code in RETRYABLE_STATUSES
+
+    def backoff(self, previous_delay):
+        previous = previous_delay or self.base_delay
+        return min(self.max_delay, random.uniform(self.base_delay, previous * 3))
+
+    def delay_for(self, previous_delay, status_code=None, headers=None, response_text=None):
+        """Seconds to wait before the next attempt (status_code is None for timeouts and connection errors)."""
+        hint = server_retry_after(headers, response_text)
+        if hint is not None:
+            return hint + random.uniform(0, self.base_delay)
+        return self.backoff(previous_delay)
+
+    def new_budget(self):
+        return RetryBudget(self.budget, self.min_retries)
+
+    def describe(self):
+        return (f"{self.name} (max {self.max_attempts} attempts, backoff {self.base_delay:g}-{self.max_delay:g} s, "
+                f"retry budget {self.budget:.0%})")
+
+class FixedRetryPolicy(RetryPolicy):
+    """
+    The original behavior ("fixed" in config.ini): a constant base_delay between attempts,
+    and twice the server's hint (or 120 seconds) after a 429.
+    """
+    name = "fixed"
+
+    def __init__(self, max_attempts=3, base_delay=5.0, max_delay=240.0, budget=1.0, min_retries=10):
+        super().__init__(max_attempts, base_delay, max_delay, budget, min_retries)
+
+    def is_retryable(self, status_code):
+        return status_code in (401, 429, 500, 502)
+
+    def backoff(self, previous_delay):
+        return self.base_delay
+
+    def delay_for(self, previous_delay, status_code=None, headers=None, response_text=None):
+        if status_code == 429:
+            hint = server_retry_after(headers, response_text)
+            return min(self.max_delay, (hint if hint is not None else 60) * 2)
+        return self.backoff(previous_delay)
+
+class RetryBudget:
+    """
+    Per-job cap on retry traffic: retries may not exceed `ratio` of first attempts,
+    with `min_retries` always allowed so small jobs can still retry.
+    """
+    def __init__(self, ratio, min_retries):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.requests = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def try_spend(self):
+        """Take one retry from the budget; False if the budget is exhausted."""
+        with self._lock:
+            if self.retries < max(self.min_retries, self.ratio * self.requests):
+                self.retries += 1
+                return True
+            return False
+
+POLICIES = {
+    RetryPolicy.name: RetryPolicy,
+    FixedRetryPolicy.name: FixedRetryPolicy,
+}
+# Options a policy accepts in config.ini (the constructor arguments, shared by all policies).
+POLICY_OPTIONS = ("max_attempts", "base_delay", "max_delay", "budget", "min_retries")
+
+def parse_policy(value):
+    """
+    Build a policy from a config value such as
+    "decorrelated, max_attempts=5, base_delay=1, max_delay=60, budget=0.1".
+    """
+    parts = [p.strip() for p in str(value).split(",") if p.strip()]
+    name = parts[0].lower() if parts else RetryPolicy.name
+    if name not in POLICIES:
+        raise ValueError(f"Unknown retry policy '{name}'. Available: {', '.join(POLICIES)}")
+    options = {}
+    for part in parts[1:]:
+        key, sep, raw = part.partition("=")
+        key = key.strip()
+        if not sep:
+            raise ValueError(f"Invalid retry policy option '{part}' in '{value}'")
+        if key not in POLICY_OPTIONS:
+            raise ValueError(f"Unknown retry policy option '{key}' in '{value}'. Available: {', '.join(POLICY_OPTIONS)}")
+        try:
+            options[key] = float(raw.strip())
+        except ValueError:
+            raise ValueError(f"Invalid number for retry policy option '{key}' in '{value}'") from None
+    return POLICIES[name](**options)
+
+def get_retry_policy(experiment_id):
+    """
+    Return the retry policy configured for an experiment in the [RetryPolicies] section.
+    An invalid setting is logged and the default policy is used instead.
+    """
+    value = config.get_experiment_option('RetryPolicies', experiment_id, fallback=RetryPolicy.name)
+    try:
+        return parse_policy(value)
+    except ValueError as e:
+        logger.warning(f"Invalid [RetryPolicies] setting for experiment {experiment_id}: {e} "
+                       f"Using the default policy.")
+        return RetryPolicy()
@@ -0,0 +1,92 @@
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# The modules read config.ini and create their output directories in the working directory.
+_WORKDIR = tempfile.mkdtemp(prefix="aifuse-tests-")
+shutil.copy(os.path.join(ROOT, "config.ini"), _WORKDIR)
+os.chdir(_WORKDIR)
+
+import auth
+import http_client
+import job_log
+import processing
+from job_manager import Job
+
+class FakeResponse:
+    def __init__(self, status_code, text, headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+    def close(self):
+        pass
+
+def csv_response(header, rows):
+    """An API response whose last chat message is the CSV text of `header` and `rows`."""
+    lines = [",".join(header)] + [",".join(row) for row in rows]
+    content = "\n".join(lines)
+    return FakeResponse(200, json.dumps({"chatHistory": {"messages": [{"content": content}]}}))
+
+class FakeApi:
+    """
+    Stands in for send_hedged_request(). `handler(case_numbers)` returns the FakeResponse
+    for the case numbers of a request; by default each case gets `rows_per_case` CSV rows.
+    """
+    def __init__(self, handler=None, rows_per_case=1):
+        self.requests = []
+        self.handler = handler or (lambda case_numbers: csv_response(
+            ["Case Number", "Row"],
+            [[case_number, str(i)] for case_number in case_numbers for i in range(rows_per_case)]))
+
+    def __call__(self, job, session, url, headers, body):
+        case_numbers = re.findall(r"CaseNumber eq '([^']*)'", json.loads(body)["DataSearchOptions"]["Filter"])
+        self.requests.append(case_numbers)
+        return self.handler(case_numbers)
+
+    def requested_cases(self):
+        return [case_number for case_numbers in self.requests for case_number in case_numbers]
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    api = FakeApi()
+    monkeypatch.setattr(processing, "send_hedged_request", api)
+    monkeypatch.setattr(auth, "get_token", lambda *args, **kwargs: "token")
+    monkeypatch.setattr(auth, "start_background_refresh", lambda *args, **kwargs: None)
+    monkeypatch.setattr(http_client, "warm_up", lambda *args, **kwargs: None)
+    return api
+
+@pytest.fixture
+def make_job(tmp_path):
+    """Build a console job (CSV parsing, sequential engine, no response cache) over the given case numbers."""
+    def make(case_numbers, **kwargs):
+        input_file = tmp_path / "input.jsonl"
+        with open(input_file, "w") as f:
+            for case_number in case_numbers:
+                f.write(json.dumps({"Incidents_IncidentId": case_number}) + "\n")
+        options = dict(experiment_id="test-experiment", experiment_name="test-experiment",
+                       parsing_method="CSV", cache_mode="off")
+        options.update(kwargs)
+        job = Job(input_file=str(input_file), **options)
+        job.ui = None
+        job.logs = job_log.JobLog(None)
+        job.processed_tracking_file = str(tmp_path / "processed.txt")
+        job.api_401_tracking_file = str(tmp_path / "401.txt")
+        job.raw_output_file = str(tmp_path / "raw.csv")
+        job.api_response_file = str(tmp_path / "response.csv")
+        job.api_error_log_file = str(tmp_path / "error.log")
+        job.script_error_log_file = str(tmp_path / "script_error.log")
+        return job
+    return make
+
+def read_rows(path):
+    """The data rows (without the header) of a CSV output file."""
+    import csv
+    with open(path, newline="") as f:
+        return list(csv.reader(f))[1:]
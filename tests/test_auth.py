@@ -0,0 +1,25 @@
+import os
+import stat
+from msal import SerializableTokenCache
+import auth
+import config
+
+def test_token_cache_is_off_by_default_and_kept_outside_the_output_directory():
+    assert config.TOKEN_CACHE is False
+    output_dir = os.path.abspath(config.OUTPUT_DIR)
+    assert os.path.commonpath([output_dir, os.path.abspath(config.TOKEN_CACHE_FILE)]) != output_dir
+
+def test_token_cache_round_trip(tmp_path, monkeypatch):
+    path = tmp_path / "cache" / "msal_token_cache.bin"
+    monkeypatch.setattr(config, "TOKEN_CACHE", True)
+    monkeypatch.setattr(config, "TOKEN_CACHE_FILE", str(path))
+    cache = SerializableTokenCache()
+    cache.deserialize('{"AccessToken": {}, "RefreshToken": {"k": {"secret": "s"}}}')
+    cache.has_state_changed = True
+    monkeypatch.setattr(auth, "_token_cache", cache)
+
+    auth._save_token_cache()
+
+    if os.name != "nt":
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert auth._load_token_cache().serialize() == cache.serialize()
@@ -0,0 +1,60 @@
+import gzip
+import json
+import input_index
+
+LINES = [json.dumps({"Incidents_IncidentId": case_number, "Row": i})
+         for i, case_number in enumerate(["1", "2", "1", "3", "1", "2"])]
+
+def test_duplicate_rows_are_read_when_looked_up(tmp_path):
+    path = tmp_path / "input.jsonl"
+    path.write_text("\n".join(LINES) + "\n")
+    duplicates = input_index.build_index(str(path)).duplicate_rows()
+
+    assert isinstance(duplicates, input_index.DuplicateRows)
+    # Only the positions of the duplicate rows are held.
+    assert list(duplicates.rows) == [2, 4, 5]
+    assert sorted(duplicates) == ["1", "2"]
+    assert duplicates["1"] == [LINES[2], LINES[4]]
+    assert duplicates.get("2", []) == [LINES[5]]
+    assert duplicates.get("3", []) == []
+
+def test_duplicate_rows_of_a_compressed_input(tmp_path):
+    path = tmp_path / "input.jsonl.gz"
+    with gzip.open(path, "wt") as f:
+        f.write("\n".join(LINES) + "\n")
+    duplicates = input_index.build_index(str(path)).duplicate_rows()
+
+    assert duplicates == {"1": [LINES[2], LINES[4]], "2": [LINES[5]]}
+
+def test_index_round_trips_through_its_sidecar(tmp_path):
+    cases = ["2405160050001621", "0042", "INC-7", "2405160050001621", "0042", "18446744073709551616"]
+    path = tmp_path / "input.jsonl"
+    path.write_text("".join(json.dumps({"Incidents_IncidentId": c}) + "\n" for c in cases))
+    built = input_index.build_index(str(path))
+    input_index._indexes.clear()
+    loaded = input_index.cached_index(str(path))
+
+    assert loaded is not built
+    for index in (built, loaded):
+        assert (index.row_count, index.unique_count, index.duplicate_count) == (6, 4, 2)
+        assert list(index.first_row) == ["2405160050001621", "0042", "INC-7", "18446744073709551616"]
+        assert index.first_row["0042"] == 1 and "42" not in index.first_row
+        assert [case for case, _ in index.unique_cases()] == list(index.first_row)
+        assert index.original_cases()["INC-7"] == {"Incidents_IncidentId": "INC-7"}
+        assert dict(index.duplicate_rows()) == {"2405160050001621": [json.dumps({"Incidents_IncidentId": cases[0]})],
+                                                "0042": [json.dumps({"Incidents_IncidentId": "0042"})]}
+
+def test_invalid_lines_are_reported_only_when_the_index_is_built(tmp_path, caplog):
+    path = tmp_path / "input.jsonl"
+    path.write_text(LINES[0] + "\nnot json\n" + json.dumps({"Row": 1}) + "\n")
+    input_index.get_index(str(path))
+    reported = [r.getMessage() for r in caplog.records if "in line:" in r.getMessage()]
+    assert len(reported) == 2
+    assert reported[1] == 'No case number found in line: {"Row": 1}'
+
+    caplog.clear()
+    input_index.get_index(str(path))
+    input_index._indexes.clear()
+    index = input_index.get_index(str(path))
+    assert not [r for r in caplog.records if "in line:" in r.getMessage()]
+    assert [reason for _, reason in index.invalid_lines()][1] == "No case number found"
@@ -0,0 +1,14 @@
+from job_log import JobLog
+
+def test_buffered_entries_are_read_back_and_written_on_close(tmp_path):
+    path = str(tmp_path / "job.log")
+    log = JobLog(path, max_entries=2)
+    for i in range(5):
+        log.append(f"entry {i}")
+    # Entries that left the memory buffer are read back from the file, buffered or not.
+    offset = log.entries_since(0)[0][1]
+    assert [text for _, text in log.read_before(offset, 10)[1]] == ["entry 0", "entry 1", "entry 2"]
+    log.append("entry 5")
+    log.close()
+
+    assert list(JobLog(path, max_entries=10)) == [f"entry {i}" for i in range(6)]
@@ -0,0 +1,8 @@
+import json
+import json_codec
+
+def test_dumps_pretty_matches_the_standard_library():
+    for obj in [{"a": [1, "b", None, True], "c": {"d": "é"}},
+                {"small": 1e-7, "large": 1e16, "plain": 2.5, "nested": [[1e22]]},
+                [float("nan"), float("inf")]]:
+        assert json_codec.dumps_pretty(obj) == json.dumps(obj, indent=2)
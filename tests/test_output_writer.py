@@ -0,0 +1,35 @@
+from output_writer import OutputWriter
+
+class FakeJournal:
+    def __init__(self):
+        self.records = []
+
+    def outputs(self):
+        return []
+
+    def record(self, case_number, positions):
+        self.records.append(case_number)
+
+    def commit(self):
+        pass
+
+def test_failed_output_drops_the_processed_record_of_its_case(tmp_path):
+    journal = FakeJournal()
+    writer = OutputWriter(journal=journal, fsync=False)
+    writer.start()
+    good = str(tmp_path / "out.txt")
+    with writer.transaction():
+        writer.write(good, "case 1\n")
+        writer.record_processed("1")
+    with writer.transaction():
+        # A directory: the case's output cannot be written.
+        writer.write(str(tmp_path), "case 2\n")
+        writer.record_processed("2")
+    with writer.transaction():
+        writer.write(good, "case 3\n")
+        writer.record_processed("3")
+    writer.close()
+
+    assert journal.records == ["1", "3"]
+    with open(good) as f:
+        assert f.read() == "case 1\ncase 3\n"
@@ -0,0 +1,153 @@
+import argparse
+import concurrent.futures
+import io
+import json
+import time
+from conftest import FakeResponse, csv_response, read_rows
+import config
+import input_index
+import input_source
+import processing
+import retry_policy
+import throttling
+
+def test_resume_retries_401_cases_first(make_job, fake_api):
+    job = make_job(["1", "2", "3", "4", "5"])
+    with open(job.processed_tracking_file, "w") as f:
+        f.write("1\n2\n3\n4\n")
+    with open(job.api_401_tracking_file, "w") as f:
+        f.write("3\n")
+    job.resume_mode = True
+    job.retry_401_flag = True
+
+    processing.processing_main_job(job)
+
+    # The 401 case is requested again, ahead of the one case never processed.
+    assert fake_api.requested_cases() == ["3", "5"]
+    assert sorted(row[0] for row in read_rows(job.api_response_file)) == ["3", "5"]
+    assert job.progress_done == job.progress_total == 5
+
+def test_resume_without_retry_skips_401_cases(make_job, fake_api):
+    job = make_job(["1", "2", "3", "4", "5"])
+    with open(job.processed_tracking_file, "w") as f:
+        f.write("1\n2\n3\n4\n")
+    with open(job.api_401_tracking_file, "w") as f:
+        f.write("3\n")
+    job.resume_mode = True
+    job.retry_401_flag = False
+
+    processing.processing_main_job(job)
+
+    assert fake_api.requested_cases() == ["5"]
+
+def test_group_response_at_the_row_limit_requests_the_last_and_missing_cases_again(make_job, fake_api):
+    def handler(case_numbers):
+        if len(case_numbers) > 1:
+            # Cut off at the row limit: case 2 is incomplete and case 3 is missing.
+            half = processing.MAX_NUMBER_OF_ROWS // 2
+            return csv_response(["Case Number", "Row"],
+                                [[case_number, str(i)] for case_number in ("1", "2") for i in range(half)])
+        return csv_response(["Case Number", "Row"], [[case_numbers[0], "single"]])
+    fake_api.handler = handler
+    job = make_job(["1", "2", "3"], cases_per_request=3)
+
+    processing.processing_main_job(job)
+
+    assert fake_api.requests == [["1", "2", "3"], ["2"], ["3"]]
+    rows = read_rows(job.api_response_file)
+    assert len([row for row in rows if row[0] == "1"]) == processing.MAX_NUMBER_OF_ROWS // 2
+    assert [row for row in rows if row[0] != "1"] == [["2", "single"], ["3", "single"]]
+    assert job.progress_done == job.progress_total == 3
+
+def test_hedged_request_records_only_the_winners_latency(make_job, monkeypatch):
+    job = make_job(["1"])
+    job.latencies = throttling.LatencyTracker()
+    for _ in range(20):
+        job.latencies.record(0.01)
+    job.hedger = throttling.RequestHedger(job.latencies, percentile=50, max_ratio=1.0, min_samples=20)
+    job.hedge_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+    sent = []
+
+    def slow_then_fast(job, session, url, headers, body, record_latency=True):
+        sent.append(record_latency)
+        time.sleep(0.3 if len(sent) == 1 else 0.02)
+        return FakeResponse(200, "ok")
+    monkeypatch.setattr(processing, "send_api_request", slow_then_fast)
+
+    response = processing.send_hedged_request(job, None, "url", {}, "body")
+    job.hedge_executor.shutdown(wait=True)
+
+    assert response.text == "ok"
+    assert sent == [False, False]
+    assert job.hedger.hedge_wins == 1
+    # One sample more than before: the winning hedge, timed from the original request.
+    assert job.latencies.count == 21
+    assert 0.03 <= max(job.latencies._samples) < 0.3
+
+def test_piping_the_same_input_again_resumes_the_console_job(tmp_path, fake_api, monkeypatch):
+    data = "".join(json.dumps({"Incidents_IncidentId": c}) + "\n" for c in ["1", "2", "3"]).encode()
+    monkeypatch.setattr(config, "INPUT_SPOOL_DIR", str(tmp_path / "Input"))
+    monkeypatch.setattr(config, "resume_mode", False)
+    monkeypatch.setattr(config, "ARGS", argparse.Namespace(
+        file=input_source.spool_stdin(io.BytesIO(data)), threads=0, batch=0, cache_mode="off",
+        consolidated_csv=str(tmp_path / "out.csv"), consolidated_excel=str(tmp_path / "out.xlsx")))
+    # An earlier run of the same input stopped after case 1.
+    with open(processing.create_headless_job().processed_tracking_file, "w") as f:
+        f.write("1\n")
+
+    assert input_source.spool_stdin(io.BytesIO(data)) == config.ARGS.file
+    job = processing.processing_main()
+
+    assert job.resume_mode
+    assert fake_api.requested_cases() == ["2", "3"]
+
+def test_console_job_does_not_print_per_case_details(make_job, fake_api, capsys):
+    job = make_job(["1", "2"])
+
+    processing.processing_main_job(job)
+
+    assert "Output written for case" not in capsys.readouterr().out
+    assert any("Output written for case 1" in entry for entry in job.logs)
+
+def test_new_input_is_requested_while_it_is_indexed(make_job, fake_api):
+    job = make_job(["1", "2", "1", "3"])
+    indexed_at_first_request = []
+
+    def handler(case_numbers):
+        if not indexed_at_first_request:
+            indexed_at_first_request.append(input_index.cached_index(job.input_file) is not None)
+        return csv_response(["Case Number", "Row"], [[case_numbers[0], "0"]])
+    fake_api.handler = handler
+
+    processing.processing_main_job(job)
+
+    assert indexed_at_first_request == [False]
+    assert fake_api.requested_cases() == ["1", "2", "3"]
+    assert job.progress_done == job.progress_total == 3
+    assert input_index.cached_index(job.input_file).duplicate_count == 1
+
+def test_failed_multi_case_request_is_parked_instead_of_holding_the_worker(make_job, fake_api, monkeypatch):
+    monkeypatch.setattr(retry_policy, "get_retry_policy",
+                        lambda experiment_id: retry_policy.RetryPolicy(base_delay=0.01, max_delay=0.05))
+    def handler(case_numbers):
+        if case_numbers == ["1", "2"] and fake_api.requests.count(["1", "2"]) == 1:
+            return FakeResponse(503, "unavailable")
+        return csv_response(["Case Number", "Row"], [[c, "0"] for c in case_numbers])
+    fake_api.handler = handler
+    job = make_job(["1", "2", "3", "4"], cases_per_request=2)
+
+    processing.processing_main_job(job)
+
+    # The next group went out while the failed one waited for its retry.
+    assert fake_api.requests == [["1", "2"], ["3", "4"], ["1", "2"]]
+    assert sorted(row[0] for row in read_rows(job.api_response_file)) == ["1", "2", "3", "4"]
+    assert job.progress_done == job.progress_total == 4
+
+def test_case_missing_from_a_multi_case_response_is_looked_up_in_the_cache_once(make_job, fake_api):
+    fake_api.handler = lambda case_numbers: csv_response(["Case Number", "Row"], [[case_numbers[0], "0"]])
+    job = make_job(["m1", "m2"], cases_per_request=2, cache_mode="use", experiment_id="cache-lookup-test")
+
+    processing.processing_main_job(job)
+
+    assert fake_api.requests == [["m1", "m2"], ["m2"]]
+    assert (job.cache_hits, job.cache_misses) == (0, 2)
@@ -0,0 +1,23 @@
+from response_cache import ResponseCache
+
+def test_evicts_least_recently_used_entries_beyond_the_size_cap(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"), ttl_seconds=3600, max_bytes=30)
+    cache.put("a", "exp", "1", "x" * 10)
+    cache.put("b", "exp", "2", "x" * 10)
+    cache.put("c", "exp", "3", "x" * 10)
+    assert cache.get("a") is not None
+    cache.put("d", "exp", "4", "x" * 10)
+    assert cache.get("b") is None
+    assert [cache.get(k) is not None for k in "acd"] == [True, True, True]
+    cache.flush()
+    assert cache._db.execute("SELECT total_size FROM meta").fetchone()[0] == 30
+
+def test_pending_writes_are_visible_to_a_new_connection_after_flush(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(path, ttl_seconds=3600, max_bytes=1000)
+    cache.put("a", "exp", "1", "first")
+    cache.put("a", "exp", "1", "second!")
+    cache.flush()
+    reopened = ResponseCache(path, ttl_seconds=3600, max_bytes=1000)
+    assert reopened.get("a") == "second!"
+    assert reopened._db.execute("SELECT total_size FROM meta").fetchone()[0] == 7
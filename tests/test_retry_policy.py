@@ -0,0 +1,18 @@
+import pytest
+import config
+import retry_policy
+
+def test_parse_policy_options():
+    policy = retry_policy.parse_policy("fixed, max_attempts=5, base_delay=2")
+    assert isinstance(policy, retry_policy.FixedRetryPolicy)
+    assert (policy.max_attempts, policy.base_delay) == (5, 2.0)
+
+def test_parse_policy_rejects_unknown_option():
+    with pytest.raises(ValueError, match="max_atempts"):
+        retry_policy.parse_policy("decorrelated, max_atempts=5")
+
+def test_invalid_config_falls_back_to_default(monkeypatch):
+    monkeypatch.setattr(config, "get_experiment_option", lambda *args, **kwargs: "decorrelated, max_atempts=5")
+    policy = retry_policy.get_retry_policy("test-experiment")
+    assert type(policy) is retry_policy.RetryPolicy
+    assert policy.max_attempts == retry_policy.RetryPolicy().max_attempts
@@ -0,0 +1,41 @@
+import throttling
+from throttling import CircuitBreaker
+
+def open_breaker(breaker):
+    """Trip `breaker` with failed requests and make its open period already over."""
+    admissions = [breaker.try_acquire() for _ in range(breaker.min_requests)]
+    for admission in admissions:
+        breaker.release(throttling.SERVER_ERROR, admission)
+    assert breaker.state == throttling.OPEN
+    breaker._opened_at -= breaker.open_seconds
+
+def test_requests_admitted_before_the_trip_are_not_probes():
+    breaker = CircuitBreaker("test", min_requests=2, window_size=2, probe_requests=2)
+    early = [breaker.try_acquire() for _ in range(3)]
+    open_breaker(breaker)
+    probes = [breaker.try_acquire(), breaker.try_acquire()]
+    assert all(p is not None and p.probe for p in probes)
+    # Requests sent while the breaker was closed finish during the half-open period.
+    for admission in early:
+        breaker.release(throttling.SUCCESS, admission)
+    assert breaker.state == throttling.HALF_OPEN
+    assert breaker._probes_in_flight == 2
+    assert breaker.try_acquire() is None
+    for probe in probes:
+        breaker.release(throttling.SUCCESS, probe)
+    assert breaker.state == throttling.CLOSED
+
+def test_probes_of_an_earlier_half_open_period_are_ignored():
+    breaker = CircuitBreaker("test", min_requests=1, window_size=1, probe_requests=2)
+    open_breaker(breaker)
+    stale = breaker.try_acquire()
+    failed = breaker.try_acquire()
+    breaker.release(throttling.TIMEOUT, failed)
+    assert breaker.state == throttling.OPEN
+    breaker._opened_at -= breaker.open_seconds
+    probe = breaker.try_acquire()
+    breaker.release(throttling.SUCCESS, stale)
+    assert breaker._probes_in_flight == 1
+    assert breaker._probe_successes == 0
+    breaker.release(throttling.SUCCESS, probe)
+    assert breaker.state == throttling.HALF_OPEN
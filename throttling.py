@@ -0,0 +1,469 @@
+import threading
+import time
+from collections import deque, namedtuple
+
+# Outcomes reported to the limiter for each API request.
+SUCCESS = "success"
+THROTTLED = "throttled"
+SERVER_ERROR = "server_error"
+TIMEOUT = "timeout"
+CONNECTION_ERROR = "connection_error"
+# The caller gave up before sending (job cancelled); says nothing about the backend.
+CANCELLED = "cancelled"
+
+_OVERLOAD_REASONS = {
+    THROTTLED: "429 received",
+    SERVER_ERROR: "server error",
+    TIMEOUT: "request timed out",
+    CONNECTION_ERROR: "connection error",
+}
+
+def classify_status(status_code):
+    """Map an HTTP status code to a limiter outcome (None for client errors that say nothing about load)."""
+    if status_code == 429:
+        return THROTTLED
+    if status_code >= 500:
+        return SERVER_ERROR
+    if status_code < 400:
+        return SUCCESS
+    return None
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit on the number of API requests a job has in flight.
+
+    Every healthy response raises the limit by 1/limit (about +1 per round of requests);
+    a 429, 5xx, timeout or a sustained rise in latency cuts it in half. Cuts are spaced
+    by a cool-down so that one burst of errors from requests already in flight only
+    counts once. The limit always stays within [min_limit, max_limit].
+    """
+    def __init__(self, initial, min_limit, max_limit, latency_tolerance=2.0, on_change=None):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.latency_tolerance = latency_tolerance
+        self.on_change = on_change
+        self.in_flight = 0
+        self._limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self._cond = threading.Condition()
+        self._fast_latency = None   # short-term EWMA of request latency
+        self._slow_latency = None   # long-term EWMA, the "healthy" baseline
+        self._samples = 0
+        self._last_decrease = 0.0
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def acquire(self, cancel_event=None):
+        """Block until a request slot is free. Returns False if `cancel_event` is set while waiting."""
+        with self._cond:
+            while self.in_flight >= int(self._limit):
+                if cancel_event is not None and cancel_event.is_set():
+                    return False
+                self._cond.wait(0.5)
+            self.in_flight += 1
+            return True
+
+    def try_acquire(self):
+        """Take a request slot if one is free, without blocking."""
+        with self._cond:
+            if self.in_flight < int(self._limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def release(self, outcome=None, latency=None):
+        """Free a request slot and adjust the limit from the request's outcome and latency (seconds)."""
+        reason = None
+        with self._cond:
+            self.in_flight -= 1
+            old_limit = int(self._limit)
+            if outcome in _OVERLOAD_REASONS:
+                reason = self._decrease(_OVERLOAD_REASONS[outcome])
+            elif outcome == SUCCESS and latency is not None:
+                if self._latency_rising(latency):
+                    reason = self._decrease("latency rising")
+                else:
+                    self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+                    reason = "healthy responses"
+            new_limit = int(self._limit)
+            self._cond.notify_all()
+        if new_limit != old_limit and self.on_change is not None:
+            self.on_change(old_limit, new_limit, reason)
+
+    def _latency_rising(self, latency):
+        if self._fast_latency is None:
+            self._fast_latency = self._slow_latency = latency
+        else:
+            self._fast_latency += 0.3 * (latency - self._fast_latency)
+            self._slow_latency += 0.05 * (latency - self._slow_latency)
+        self._samples += 1
+        return self._samples >= 20 and self._fast_latency > self._slow_latency * self.latency_tolerance
+
+    def _decrease(self, reason):
+        now = time.monotonic()
+        cooldown = max(self._slow_latency or 0.0, 1.0)
+        if now - self._last_decrease < cooldown:
+            return None
+        self._last_decrease = now
+        self._limit = max(float(self.min_limit), self._limit / 2)
+        # Start the latency comparison afresh at the new level.
+        self._fast_latency = self._slow_latency
+        return reason
+
+class LatencyTracker:
+    """Latencies (seconds) of a job's successful requests, kept in a sliding window for percentiles."""
+    def __init__(self, window=10000):
+        self.count = 0
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+
+    def percentile(self, q):
+        """The q-th percentile (0-100) of the recorded latencies, or None if there are none."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q / 100.0 * len(samples)))]
+
+class RequestHedger:
+    """
+    Decides when a slow request gets a second, identical "hedge" request.
+
+    Once `min_samples` latencies are known, a request that has not answered within the
+    `percentile` latency is hedged, as long as hedges stay below `max_ratio` of requests.
+    The threshold is recomputed every `refresh_every` samples rather than on every request.
+    """
+    def __init__(self, latencies, percentile=95, max_ratio=0.05, min_samples=20, refresh_every=50):
+        self.latencies = latencies
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self.refresh_every = refresh_every
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._threshold = None
+        self._threshold_at = 0
+        self._lock = threading.Lock()
+
+    def delay(self):
+        """Seconds to wait before hedging a request, or None while there are too few samples."""
+        count = self.latencies.count
+        if count < self.min_samples:
+            return None
+        if self._threshold is None or count - self._threshold_at >= self.refresh_every:
+            self._threshold = self.latencies.percentile(self.percentile)
+            self._threshold_at = count
+        return self._threshold
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def try_hedge(self):
+        """Take one hedge from the budget; False if hedges would exceed max_ratio of requests."""
+        with self._lock:
+            if self.hedges + 1 <= self.max_ratio * self.requests:
+                self.hedges += 1
+                return True
+            return False
+
+    def record_win(self):
+        with self._lock:
+            self.hedge_wins += 1
+
+# Circuit breaker states.
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+# Outcomes that indicate the backend itself is failing (429s are the rate limiter's business).
+_BACKEND_FAILURES = (SERVER_ERROR, TIMEOUT, CONNECTION_ERROR)
+
+# How a request was let through a circuit breaker: as a half-open probe or not, and in which half-open period.
+Admission = namedtuple("Admission", ("probe", "generation"))
+
+class CircuitBreaker:
+    """
+    Circuit breaker shared by every job that calls one experiment.
+
+    The breaker opens when at least `failure_threshold` of the last `window_size` requests
+    (and at least `min_requests` of them) failed with a 5xx, timeout or connection error.
+    While open, callers are held before sending. After `open_seconds` it lets
+    `probe_requests` probes through (half-open): if they all succeed the breaker closes
+    and dispatch resumes at full speed, otherwise it opens again.
+    """
+    def __init__(self, name, failure_threshold=0.5, window_size=20, min_requests=10,
+                 open_seconds=30.0, probe_requests=3):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.min_requests = max(1, min_requests)
+        self.open_seconds = open_seconds
+        self.probe_requests = max(1, probe_requests)
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=max(self.min_requests, window_size))
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._generation = 0  # counts half-open periods
+        self._listeners = []
+        self._cond = threading.Condition()
+
+    def add_listener(self, listener):
+        """Call `listener(old_state, new_state, reason)` on every state change."""
+        with self._cond:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._cond:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def open_for(self):
+        """Seconds until an open breaker lets probes through (0 if it is not open)."""
+        with self._cond:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def try_acquire(self):
+        """
+        Return an Admission if a request may be sent now, else None. Pass the admission to
+        release(); only requests admitted as probes while half-open decide the probe.
+        """
+        with self._cond:
+            changes = []
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                changes.append(self._set_state(HALF_OPEN, f"probing after {self.open_seconds:g} s"))
+                self._generation += 1
+                self._probes_in_flight = 0
+                self._probe_successes = 0
+            admission = None
+            if self.state == CLOSED:
+                admission = Admission(False, self._generation)
+            elif self.state == HALF_OPEN and self._probes_in_flight + self._probe_successes < self.probe_requests:
+                self._probes_in_flight += 1
+                admission = Admission(True, self._generation)
+            listeners = list(self._listeners)
+        self._notify(listeners, changes)
+        return admission
+
+    def acquire(self, cancel_event=None):
+        """
+        Block while the breaker holds dispatch. Returns the Admission, or None if
+        `cancel_event` is set while waiting.
+        """
+        while True:
+            admission = self.try_acquire()
+            if admission is not None:
+                return admission
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            with self._cond:
+                self._cond.wait(0.5)
+
+    def release(self, outcome, admission):
+        """Record the outcome of a request that was let through with `admission`."""
+        failed = outcome in _BACKEND_FAILURES
+        with self._cond:
+            changes = []
+            if admission.probe:
+                # Probes of an earlier half-open period no longer count.
+                if self.state == HALF_OPEN and admission.generation == self._generation:
+                    self._probes_in_flight -= 1
+                    if outcome == CANCELLED:
+                        pass
+                    elif failed:
+                        changes.append(self._open("probe request failed"))
+                    else:
+                        self._probe_successes += 1
+                        if self._probe_successes >= self.probe_requests:
+                            self._outcomes.clear()
+                            changes.append(self._set_state(CLOSED, f"{self._probe_successes} probe requests succeeded"))
+            elif self.state == CLOSED and outcome != CANCELLED:
+                self._outcomes.append(failed)
+                failures = sum(self._outcomes)
+                if (len(self._outcomes) >= self.min_requests
+                        and failures >= self.failure_threshold * len(self._outcomes)):
+                    changes.append(self._open(f"{failures} of the last {len(self._outcomes)} requests failed"))
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+        self._notify(listeners, changes)
+
+    def _open(self, reason):
+        self._opened_at = time.monotonic()
+        self._probes_in_flight = 0
+        return self._set_state(OPEN, reason)
+
+    def _set_state(self, state, reason):
+        old_state, self.state = self.state, state
+        return old_state, state, reason
+
+    def _notify(self, listeners, changes):
+        for change in changes:
+            for listener in listeners:
+                listener(*change)
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (delta-seconds or HTTP date) into seconds from now, or None."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except Exception:
+        return None
+
+def _header(headers, *names):
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            return value
+    return None
+
+class TokenBucket:
+    """
+    Token-bucket request rate limiter shared by every job that calls one experiment.
+
+    `rate` is in requests per second (0 means unlimited) and `burst` is the bucket size.
+    The bucket also reads rate-limit response headers: when the server reports how many
+    requests remain until its window resets, the rate is lowered to spread them evenly
+    over the window, and a Retry-After pauses all callers until it has elapsed.
+    """
+    def __init__(self, name, rate, burst=None):
+        self.name = name
+        self._lock = threading.Lock()
+        self._shaped_rate = None
+        self._shaped_until = 0.0
+        self._paused_until = 0.0
+        self.configure(rate, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def configure(self, rate, burst=None):
+        with self._lock:
+            self.rate = max(0.0, float(rate))
+            self.burst = max(1.0, float(burst) if burst else self.rate)
+
+    def _effective_rate(self, now):
+        rates = []
+        if self.rate > 0:
+            rates.append(self.rate)
+        if self._shaped_rate is not None and now < self._shaped_until:
+            rates.append(self._shaped_rate)
+        return min(rates) if rates else None
+
+    @property
+    def current_rate(self):
+        """The rate currently enforced in requests per second, or None if unlimited."""
+        with self._lock:
+            return self._effective_rate(time.monotonic())
+
+    def reserve(self):
+        """Take a token and return how many seconds the caller must wait before sending."""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._paused_until - now)
+            rate = self._effective_rate(now)
+            if rate is None:
+                return wait
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * rate)
+            self._updated = now
+            self._tokens -= 1.0
+            if self._tokens < 0:
+                wait = max(wait, -self._tokens / rate)
+            return wait
+
+    def acquire(self, cancel_event=None):
+        """Block until the caller may send. Returns False if `cancel_event` is set while waiting."""
+        wait = self.reserve()
+        if wait <= 0:
+            return True
+        if cancel_event is None:
+            time.sleep(wait)
+            return True
+        return not cancel_event.wait(wait)
+
+    def pause(self, seconds):
+        """Hold every caller for `seconds` (e.g. after a Retry-After)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def observe_headers(self, headers, status_code=None):
+        """Shape the rate from a response's rate-limit headers, if the API sends them."""
+        if not headers:
+            return
+        retry_after = parse_retry_after(_header(headers, "Retry-After"))
+        if retry_after and (status_code == 429 or (status_code or 0) >= 500):
+            self.pause(retry_after)
+        remaining = _header(headers, "RateLimit-Remaining", "X-RateLimit-Remaining",
+                            "x-ms-ratelimit-remaining-requests")
+        reset = _header(headers, "RateLimit-Reset", "X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        try:
+            remaining = float(remaining)
+            reset = float(reset)
+        except ValueError:
+            return
+        # Reset is either seconds until the window ends or an epoch timestamp.
+        if reset > 10 ** 9:
+            reset = reset - time.time()
+        if reset <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if remaining <= 0:
+                self._paused_until = max(self._paused_until, now + reset)
+            else:
+                self._shaped_rate = remaining / reset
+                self._shaped_until = now + reset
+
+# Rate limiters and circuit breakers are keyed by experiment ID and shared by all jobs in the process.
+_rate_limiters = {}
+_circuit_breakers = {}
+_registry_lock = threading.Lock()
+
+def get_rate_limiter(experiment_id):
+    """Return the process-wide rate limiter for an experiment, refreshed from config.ini."""
+    import config
+    rate, burst = config.get_rate_limit(experiment_id)
+    with _registry_lock:
+        bucket = _rate_limiters.get(experiment_id)
+        if bucket is None:
+            bucket = TokenBucket(experiment_id, rate, burst)
+            _rate_limiters[experiment_id] = bucket
+        else:
+            bucket.configure(rate, burst)
+        return bucket
+
+def get_circuit_breaker(experiment_id):
+    """Return the process-wide circuit breaker for an experiment, or None if CIRCUIT_BREAKER is off."""
+    import config
+    if not config.CIRCUIT_BREAKER:
+        return None
+    with _registry_lock:
+        breaker = _circuit_breakers.get(experiment_id)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                experiment_id,
+                failure_threshold=config.BREAKER_FAILURE_THRESHOLD,
+                window_size=config.BREAKER_WINDOW_SIZE,
+                min_requests=config.BREAKER_MIN_REQUESTS,
+                open_seconds=config.BREAKER_OPEN_SECONDS,
+                probe_requests=config.BREAKER_PROBE_REQUESTS
+            )
+            _circuit_breakers[experiment_id] = breaker
+        return breaker
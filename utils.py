@@ -41,24 +41,25 @@ def write_csv_to_excel(csv_file, excel_file):
     except Exception as e:
         print(f"Error writing Excel file: {e}")
 
-def check_resume_status():
+def check_resume_status(job):
     """
-    Checks the resume status by comparing the total input cases with the processed cases.
+    Checks the resume status of a job by comparing the total input cases with the processed cases.
     If the processed tracking file does not exist or is empty, it returns that resume is not possible.
     
     Returns a dictionary with:
-      - total_input: total number of cases from the input file.
+      - total_input: number of distinct cases in the input file.
       - processed_count: number of cases that have already been processed.
       - resume_possible: True if there are some (but not all) cases processed.
     """
     import os
     import config
-    import processing
+    import input_index
+    import resume_journal
+    import job_store
 
-    # Count total input cases from the input file.
+    # Count the distinct cases in the input file (duplicate rows are processed once).
     try:
-        with open(config.ARGS.file, 'r') as f:
-            total_input = sum(1 for line in f if line.strip())
+        total_input = input_index.get_index(job.input_file).unique_count
     except Exception:
         total_input = 0
 
@@ -66,9 +67,16 @@ def check_resume_status():
     if not os.path.exists(job.processed_tracking_file):
         return {"total_input": total_input, "processed_count": 0, "resume_possible": False}
     else:
-        with open(job.processed_tracking_file, 'r') as f:
-            processed_lines = [line.strip() for line in f if line.strip()]
-        processed_count = len(processed_lines)
+        store = job_store.open_store(job)
+        if store is not None:
+            # Indexed count instead of reading the tracking file.
+            try:
+                counts = store.status_counts()
+            finally:
+                store.close()
+            processed_count = counts.get(job_store.DONE, 0) + counts.get(job_store.FAILED, 0)
+        else:
+            processed_count = len(resume_journal.read_processed_cases(job.processed_tracking_file)[0])
         # Only allow resume if at least one case has been processed and not all.
         resume_possible = total_input > 0 and processed_count > 0 and processed_count < total_input
         return {
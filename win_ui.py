@@ -9,15 +9,20 @@ import processing
 import consolidation
 import utils
 from config import generate_filename
-from job_manager import Job, get_input_file_md5, save_job_state, load_all_jobs, clear_job_state
-from log_config import logger
+from job_manager import Job, get_input_file_md5, save_job_state, load_job, load_job_catalog, clear_job_state
+from log_config import get_logger
 import itertools
+from collections import deque
 import time
 import configparser  # For configuration editing
 import uuid  # For generating unique job IDs
 
+logger = get_logger(__name__)
+
 # Global dictionary to manage jobs: job_id -> Job object
 jobs_dict = {}
+# Saved jobs not opened yet: job_id -> catalog entry (status, input_file, experiment_id, progress)
+job_catalog = {}
 
 # Global UI components
 job_list_tree = None
@@ -48,7 +53,40 @@ def update_jobs_list():
     for job in jobs_dict.values():
         exp_name = exp_name_map.get(job.experiment_id, job.experiment_id)
         job_list_tree.insert("", "end", iid=job.job_id,
-                             values=(job.job_id, os.path.basename(job.input_file), exp_name, job.status))
+                             values=(job.job_id, os.path.basename(job.input_file), exp_name, job.status,
+                                     f"{job.progress_done}/{job.progress_total}"))
+    for job_id, entry in job_catalog.items():
+        exp_name = exp_name_map.get(entry["experiment_id"], entry["experiment_id"])
+        job_list_tree.insert("", "end", iid=job_id,
+                             values=(job_id, os.path.basename(entry["input_file"] or ""), exp_name, entry["status"],
+                                     f"{entry['progress_done']}/{entry['progress_total']}"))
+
+def open_job(job_id):
+    """Load a saved job from its state file and create its tab (the first time it is selected)."""
+    if job_id in jobs_dict:
+        job = jobs_dict[job_id]
+    elif job_id in job_catalog:
+        job = load_job(job_id)
+        if job is None:
+            messagebox.showerror("Error", f"The saved state of Job {job_id[:8]} could not be found.")
+            job_catalog.pop(job_id)
+            update_jobs_list()
+            return None
+        job_catalog.pop(job_id)
+        if job.status == "running":
+            # Saved by a checkpoint of a run that never finished (crash or power loss).
+            job.status = "stopped"
+            job.log("Job was interrupted. Resume it to continue from its last checkpoint.")
+        jobs_dict[job_id] = job
+        create_job_tab(job)
+    else:
+        return None
+    notebook.select(job.ui["tab"])
+    return job
+
+def on_job_selected(event=None):
+    for job_id in job_list_tree.selection():
+        open_job(job_id)
 
 def create_job_tab(job):
     global notebook
@@ -85,6 +123,23 @@ def create_job_tab(job):
     if not hasattr(job, "start_time"):
         job.start_time = time.time()
     
+    # Adaptive concurrency label
+    concurrency_label = ttk.Label(tab, text="Concurrency: -")
+    concurrency_label.pack(fill=tk.X, padx=5, pady=5)
+    
+    # Cases parked for a delayed retry
+    parked_label = ttk.Label(tab, text="Parked for retry: 0")
+    parked_label.pack(fill=tk.X, padx=5, pady=5)
+
+    # Circuit breaker state of the job's experiment
+    breaker_label = ttk.Label(tab, text="Circuit breaker: -")
+    breaker_label.pack(fill=tk.X, padx=5, pady=5)
+    
+    # Pages older log entries in from the job's log file
+    older_button = ttk.Button(tab, text="Show Older Log Entries",
+                              command=lambda job=job: show_older_log_entries(job), state=tk.DISABLED)
+    older_button.pack(anchor=tk.W, padx=5)
+    
     # Log text area
     log_text = scrolledtext.ScrolledText(tab, wrap=tk.WORD, height=10)
     log_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -111,12 +166,18 @@ def create_job_tab(job):
         "progress_label": progress_label,
         "spinner_label": spinner_label,
         "elapsed_time_label": elapsed_time_label,
+        "concurrency_label": concurrency_label,
+        "parked_label": parked_label,
+        "breaker_label": breaker_label,
         "log_text": log_text,
+        "older_button": older_button,
         "cancel_button": stop_button,
         "resume_button": resume_button,
         "save_button": save_button,
         "tab": tab,
-        "last_log_index": 0
+        "log_next": 0,                # number of the next job log entry to show
+        "log_lines": deque(),         # (file offset, text lines) of each shown entry, oldest first
+        "log_limit": config.JOB_LOG_VIEW_ENTRIES
     }
     return tab
 
@@ -131,6 +192,42 @@ def cancel_job(job_id):
         job.ui["resume_button"].config(state=tk.NORMAL)
         save_job_state(job)
 
+def show_new_log_entries(job):
+    """Append the job's new log entries to its log view, dropping the oldest beyond the view limit."""
+    ui = job.ui
+    entries = job.logs.entries_since(ui["log_next"])
+    if not entries:
+        return
+    log_text = ui["log_text"]
+    if entries[0][0] > ui["log_next"] and ui["log_lines"]:
+        # Entries were added faster than shown and left memory: restart the view at the ones still in memory.
+        log_text.delete("1.0", tk.END)
+        ui["log_lines"].clear()
+        ui["log_limit"] = config.JOB_LOG_VIEW_ENTRIES
+    for number, offset, text in entries:
+        log_text.insert(tk.END, text + "\n")
+        ui["log_lines"].append((offset, text.count("\n") + 1))
+    ui["log_next"] = entries[-1][0] + 1
+    while len(ui["log_lines"]) > ui["log_limit"]:
+        _, lines = ui["log_lines"].popleft()
+        log_text.delete("1.0", f"{lines + 1}.0")
+    ui["older_button"].config(state=tk.NORMAL if ui["log_lines"][0][0] > 0 else tk.DISABLED)
+
+def show_older_log_entries(job):
+    """Insert a page of log entries older than the oldest one shown, read from the job's log file."""
+    ui = job.ui
+    if not ui["log_lines"]:
+        return
+    start, lines = job.logs.read_before(ui["log_lines"][0][0], config.JOB_LOG_PAGE_ENTRIES)
+    log_text = ui["log_text"]
+    for offset, text in reversed(lines):
+        log_text.insert("1.0", text + "\n")
+        ui["log_lines"].appendleft((offset, 1))
+    # Loaded pages stay in the view until it is closed.
+    ui["log_limit"] += len(lines)
+    log_text.see("1.0")
+    ui["older_button"].config(state=tk.NORMAL if start > 0 else tk.DISABLED)
+
 def resume_job(job_id):
     job = jobs_dict.get(job_id)
     if not job:
@@ -150,7 +247,7 @@ def resume_job(job_id):
             job.log("Job finished processing.")
             original_cases = consolidation.load_original_cases(job.input_file)
             job.log(f"Loaded {len(original_cases)} original cases.")
-            error_log = consolidation.load_error_log(job.api_error_log_file)
+            error_log = consolidation.load_job_errors(job)
             job.log(f"Loaded {len(error_log)} error entries.")
         
             if job.parsing_method.upper() == "CSV":
@@ -214,7 +311,7 @@ def save_job_results(job):
             job.log("Job output saved. Clearing job from UI.")
             update_jobs_list()
             notebook.forget(job.ui["tab"])
-            clear_job_state(job.job_id)
+            clear_job_state(job.job_id, job)
             del jobs_dict[job.job_id]
             update_jobs_list()
         except Exception as e:
@@ -558,7 +655,10 @@ def start_new_job(main_window):
         experiment_name=selected_experiment,
         parsing_method=selected_parsing,
         threads=processing_settings["threads"],
-        batch_size=processing_settings["batch_size"]
+        batch_size=processing_settings["batch_size"],
+        engine=processing_settings["engine"],
+        max_in_flight=processing_settings["max_in_flight"],
+        cases_per_request=processing_settings["cases_per_request"]
     )
     
     job.processed_tracking_file = unique_job_filename(job.input_file, job.experiment_id, "processed", "txt", job.job_id)
@@ -589,7 +689,7 @@ def start_new_job(main_window):
             job.log("Job finished processing.")
             original_cases = consolidation.load_original_cases(job.input_file)
             job.log(f"Loaded {len(original_cases)} original cases.")
-            error_log = consolidation.load_error_log(job.api_error_log_file)
+            error_log = consolidation.load_job_errors(job)
             job.log(f"Loaded {len(error_log)} error entries.")
             if job.parsing_method.upper() == "CSV":
                 job.log("CSV consolidation Selected.")
@@ -642,11 +742,13 @@ def stop_all_jobs():
 def clear_all_jobs():
     stop_all_jobs()
     global jobs_dict
+    for job_id, job in list(jobs_dict.items()):
+        clear_job_state(job_id, job)
+    # Includes finished jobs, which are not listed.
+    for job_id in load_job_catalog():
+        clear_job_state(job_id)
     jobs_dict.clear()
-    jobs_state_dir = os.path.join(config.OUTPUT_DIR, "jobs_state")
-    for filename in os.listdir(jobs_state_dir):
-        if filename.endswith(".json"):
-            os.remove(os.path.join(jobs_state_dir, filename))
+    job_catalog.clear()
     update_jobs_list()
     for tab in notebook.tabs():
         notebook.forget(tab)
@@ -669,7 +771,8 @@ def prompt_for_input_file(root):
     def browse():
         file_path = filedialog.askopenfilename(
             title="Select Input JSON File",
-            filetypes=[("json Files", "*.json"), ("text Files", "*.txt"), ("All Files", "*.*")]
+            filetypes=[("json Files", "*.json *.jsonl"), ("text Files", "*.txt"),
+                       ("Compressed Files", "*.gz *.zst"), ("All Files", "*.*")]
         )
         if file_path:
             selected_file["file"] = file_path
@@ -813,9 +916,9 @@ def prompt_for_parsing_method(root):
     return result["parsing"]
 
 def show_processing_settings_dialog(parent):
-    """Show dialog for configuring processing settings (threading/batching)"""
+    """Show dialog for configuring processing settings (engine/threading/batching)"""
     fixed_width = 400
-    fixed_height = 300
+    fixed_height = 450
     
     dialog = tk.Toplevel(parent)
     dialog.title("Processing Settings")
@@ -863,25 +966,59 @@ def show_processing_settings_dialog(parent):
     batch_spinner = ttk.Spinbox(batch_size_frame, from_=2, to=100, textvariable=batch_size, width=5, state="disabled")
     batch_spinner.pack(side=tk.LEFT, padx=5)
 
+    multi_case = tk.BooleanVar(value=False)
+    multi_case_check = ttk.Checkbutton(batch_frame, text="Send each group as one API request (CSV parsing only)",
+                                       variable=multi_case, state="disabled")
+    multi_case_check.pack(anchor=tk.W, padx=5, pady=5)
+
     # Enable/disable batch size spinner based on checkbox
     def toggle_batch_spinner(*args):
         batch_spinner.configure(state="normal" if batch_enabled.get() else "disabled")
+        multi_case_check.configure(state="normal" if batch_enabled.get() else "disabled")
     batch_enabled.trace_add("write", toggle_batch_spinner)
 
+    # Engine settings
+    engine_frame = ttk.LabelFrame(main_frame, text="Processing Engine")
+    engine_frame.pack(fill=tk.X, pady=(0, 10))
+
+    engine = tk.StringVar(value="threads")
+    engine_buttons_frame = ttk.Frame(engine_frame)
+    engine_buttons_frame.pack(fill=tk.X, padx=5, pady=5)
+    ttk.Radiobutton(engine_buttons_frame, text="Threads", value="threads", variable=engine).pack(side=tk.LEFT)
+    ttk.Radiobutton(engine_buttons_frame, text="Asyncio", value="asyncio", variable=engine).pack(side=tk.LEFT, padx=10)
+
+    in_flight_frame = ttk.Frame(engine_frame)
+    in_flight_frame.pack(fill=tk.X, padx=5, pady=5)
+    ttk.Label(in_flight_frame, text="Max requests in flight:").pack(side=tk.LEFT)
+
+    max_in_flight = tk.IntVar(value=config.ASYNC_MAX_IN_FLIGHT)
+    in_flight_spinner = ttk.Spinbox(in_flight_frame, from_=1, to=5000, textvariable=max_in_flight, width=6, state="disabled")
+    in_flight_spinner.pack(side=tk.LEFT, padx=5)
+
+    # The in-flight limit only applies to the asyncio engine
+    def toggle_engine(*args):
+        is_async = engine.get() == "asyncio"
+        in_flight_spinner.configure(state="normal" if is_async else "disabled")
+    engine.trace_add("write", toggle_engine)
+
     # Help text
-    help_text = "Threading: Process multiple cases concurrently\nGrouping: Group cases into batches for processing on each thread" 
+    help_text = "Threading: Process multiple cases concurrently\nGrouping: Group cases into batches for processing on each thread\nAsyncio: Many concurrent requests on a single thread" 
     ttk.Label(main_frame, text=help_text, foreground="gray").pack(anchor=tk.W, pady=5)
 
     # Buttons
     button_frame = ttk.Frame(main_frame)
     button_frame.pack(fill=tk.X, pady=10)
 
-    result = {"confirmed": False, "threads": 0, "batch_size": 0}
+    result = {"confirmed": False, "threads": 0, "batch_size": 0, "engine": "threads", "max_in_flight": 0,
+              "cases_per_request": 0}
 
     def on_confirm():
         result["confirmed"] = True
         result["threads"] = thread_count.get() if thread_enabled.get() else 0
         result["batch_size"] = batch_size.get() if batch_enabled.get() else 0
+        result["engine"] = engine.get()
+        result["max_in_flight"] = max_in_flight.get() if engine.get() == "asyncio" else 0
+        result["cases_per_request"] = batch_size.get() if batch_enabled.get() and multi_case.get() else 0
         dialog.destroy()
 
     ttk.Button(button_frame, text="Cancel", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
@@ -911,16 +1048,17 @@ def show_job_details(job_id):
 def tk_ui_main():
     global job_list_tree, notebook, chat_window, config_button  # Include config_button here
     
-    # Load unfinished jobs from file
-    loaded_jobs = load_all_jobs()
-    if loaded_jobs:
-        for job in loaded_jobs.values():
-            if job.status != "finished":
-                jobs_dict[job.job_id] = job
+    # List unfinished jobs from the job catalog; a job's state is loaded and its tab created when it is selected.
+    for job_id, entry in load_job_catalog().items():
+        if entry["status"] != "finished":
+            if entry["status"] == "running":
+                # The run never finished (crash or power loss); open_job() marks the job stopped.
+                entry["status"] = "stopped"
+            job_catalog[job_id] = entry
 
     if config.ARGS is None:
         import argparse
-        config.ARGS = argparse.Namespace(file="", threads=0, batch=0,
+        config.ARGS = argparse.Namespace(file="", threads=0, batch=0, engine="threads", max_in_flight=0, cache_mode="use", cases_per_request=0,
                                            consolidated_csv=config.default_consolidated_csv,
                                            consolidated_excel=config.default_consolidated_excel,
                                            no_ui=False, with_curses=False)
@@ -933,13 +1071,15 @@ def tk_ui_main():
     top_frame.pack(fill=tk.X, padx=5, pady=5)
     top_frame.columnconfigure(0, weight=3)
     top_frame.columnconfigure(1, weight=1, minsize=200)
-    job_list_tree = ttk.Treeview(top_frame, columns=("Job ID", "Input File", "Experiment", "Status"),
+    job_list_tree = ttk.Treeview(top_frame, columns=("Job ID", "Input File", "Experiment", "Status", "Progress"),
                                  show="headings", height=5)
     job_list_tree.heading("Job ID", text="Job ID")
     job_list_tree.heading("Input File", text="Input File")
     job_list_tree.heading("Experiment", text="Experiment")
     job_list_tree.heading("Status", text="Status")
+    job_list_tree.heading("Progress", text="Progress")
     job_list_tree.grid(row=0, column=0, sticky="nsew")
+    job_list_tree.bind("<<TreeviewSelect>>", on_job_selected)
     
     # Create the control frame
     control_frame = tk.Frame(top_frame)
@@ -966,8 +1106,6 @@ def tk_ui_main():
     notebook = ttk.Notebook(notebook_frame)
     notebook.pack(fill=tk.BOTH, expand=True)
     
-    for job in jobs_dict.values():
-        create_job_tab(job)
     update_jobs_list()
     
     def update_ui():
@@ -982,6 +1120,21 @@ def tk_ui_main():
                 minutes, seconds = divmod(rem, 60)
                 elapsed_str = f"{int(hours):02}:{int(minutes):02}:{int(seconds):02}"
                 ui["elapsed_time_label"].config(text=f"Elapsed time: {elapsed_str}")
+            limiter = getattr(job, "concurrency_limiter", None)
+            if limiter is not None and job.status == "running":
+                ui["concurrency_label"].config(text=f"Concurrency: limit {limiter.limit} ({limiter.in_flight} in flight)")
+            else:
+                ui["concurrency_label"].config(text="Concurrency: -")
+            retry_queue = getattr(job, "retry_queue", None)
+            ui["parked_label"].config(text=f"Parked for retry: {len(retry_queue) if retry_queue is not None else 0}")
+            breaker = getattr(job, "circuit_breaker", None)
+            if breaker is not None and job.status == "running":
+                if breaker.state == "open":
+                    ui["breaker_label"].config(text=f"Circuit breaker: open, dispatch held (probing in {breaker.open_for():.0f} s)")
+                else:
+                    ui["breaker_label"].config(text=f"Circuit breaker: {breaker.state}")
+            else:
+                ui["breaker_label"].config(text="Circuit breaker: -")
             # Update button states based on job.status.
             if job.status == "running":
                 ui["cancel_button"].config(state=tk.NORMAL)
@@ -993,12 +1146,7 @@ def tk_ui_main():
             else:  # stopped, paused, etc.
                 ui["cancel_button"].config(state=tk.DISABLED)
                 ui["resume_button"].config(state=tk.NORMAL)
-            if not ui.get("last_log_index"):
-                ui["last_log_index"] = 0
-            new_entries = job.logs[ui["last_log_index"]:]
-            for entry in new_entries:
-                ui["log_text"].insert(tk.END, entry+"\n")
-            ui["last_log_index"] = len(job.logs)
+            show_new_log_entries(job)
         root.after(500, update_ui)
     update_ui()
     root.mainloop()
@@ -0,0 +1,147 @@
+import heapq
+import itertools
+import threading
+import time
+from queue import Queue, Empty, Full
+from log_config import get_logger
+
+logger = get_logger(__name__)
+
+# Marks the end of the work stream; one is queued per worker.
+_STOP = object()
+
+class DelayedRetryQueue:
+    """
+    Thread-safe holding area for cases waiting to be retried.
+    A failed attempt is parked with its due time instead of sleeping in the worker;
+    workers pick parked items up again with pop_due() once they are due.
+    """
+    def __init__(self):
+        self._heap = []
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._heap)
+
+    def park(self, item, delay):
+        with self._lock:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), item))
+
+    def pop_due(self):
+        """Return the next item whose due time has passed, or None."""
+        with self._lock:
+            if self._heap and self._heap[0][0] <= time.monotonic():
+                return heapq.heappop(self._heap)[2]
+            return None
+
+    def next_due_in(self):
+        """Seconds until the next parked item is due (0 if overdue), or None if nothing is parked."""
+        with self._lock:
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - time.monotonic())
+
+    def wait(self, cancel_event, max_wait=0.5):
+        """Sleep until the next item is due, at most `max_wait` seconds, waking early on cancel."""
+        due_in = self.next_due_in()
+        cancel_event.wait(max_wait if due_in is None else min(due_in, max_wait))
+
+class WorkerPool:
+    """
+    A fixed set of long-lived worker threads fed from a bounded work queue.
+
+    Workers take cases in chunks of up to `chunk_size` (the job's group size). The chunk
+    size shrinks as the queue drains, so near the end of a job no worker sits on a
+    large group while the others are idle.
+
+    If a `retry_queue` is given, workers take due retries ahead of new cases, and
+    keep serving it after the input is exhausted until nothing is left parked.
+    """
+    def __init__(self, num_workers, handler, chunk_size=1, cancel_event=None, name="worker", retry_queue=None):
+        self.num_workers = max(1, num_workers)
+        self.handler = handler
+        self.chunk_size = max(1, chunk_size)
+        self.cancel_event = cancel_event or threading.Event()
+        self.name = name
+        self.retry_queue = retry_queue
+        self._queue = Queue(maxsize=self.num_workers * self.chunk_size * 2)
+        self._threads = []
+
+    def run(self, items):
+        """Feed `items` to the workers and block until every item has been handled or the pool is cancelled."""
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+            for i in range(self.num_workers)
+        ]
+        for t in self._threads:
+            t.start()
+        try:
+            for item in items:
+                if not self._put(item):
+                    break
+        finally:
+            # Workers keep draining the queue after a cancel, so these puts cannot block forever.
+            for _ in self._threads:
+                self._queue.put(_STOP)
+            for t in self._threads:
+                t.join()
+
+    def _put(self, item):
+        while not self.cancel_event.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _next_chunk(self, timeout=None):
+        """Return (chunk, stop); the chunk is empty if the stream has ended or `timeout` expired."""
+        try:
+            first = self._queue.get(timeout=timeout)
+        except Empty:
+            return [], False
+        if first is _STOP:
+            return [], True
+        chunk = [first]
+        # Guided chunking: take a share of what is queued, capped at the configured group size.
+        target = max(1, min(self.chunk_size, self._queue.qsize() // self.num_workers))
+        while len(chunk) < target:
+            try:
+                item = self._queue.get_nowait()
+            except Empty:
+                break
+            if item is _STOP:
+                return chunk, True
+            chunk.append(item)
+        return chunk, False
+
+    def _handle(self, item):
+        try:
+            self.handler(item)
+        except Exception as e:
+            logger.error(f"Unhandled error in {threading.current_thread().name}: {e}")
+
+    def _worker(self):
+        retry_queue = self.retry_queue
+        stop = False
+        while True:
+            if retry_queue is not None and not self.cancel_event.is_set():
+                item = retry_queue.pop_due()
+                if item is not None:
+                    self._handle(item)
+                    continue
+            if stop:
+                # Input exhausted: stay until every parked retry has been served.
+                if retry_queue is None or self.cancel_event.is_set() or len(retry_queue) == 0:
+                    break
+                retry_queue.wait(self.cancel_event)
+                continue
+            # Without a retry queue there is nothing else to wait for, so block on the input.
+            chunk, stop = self._next_chunk(timeout=0.5 if retry_queue is not None else None)
+            for item in chunk:
+                if self.cancel_event.is_set():
+                    break
+                self._handle(item)